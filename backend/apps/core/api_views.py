@@ -15,6 +15,8 @@ from rest_framework_simplejwt.views import TokenObtainPairView
 from apps.accounts.models import User, UserRole
 from apps.core.models import Organization
 from apps.core.permissions import IsAuthenticatedPatientPortal, IsCoordinatorOrAdmin
+from apps.core.services.circuit_breaker import provider_breaker_states
+from apps.core.services.http_client import http_client_metrics
 from apps.matching.models import MatchEvaluation, MatchOverallStatus, MatchingRun
 from apps.matching.serializers import MatchEvaluationSerializer, MatchingRunSerializer
 from apps.matching.services.engine import (
@@ -23,6 +25,8 @@ from apps.matching.services.engine import (
     reconcile_stale_running_runs,
     run_full_matching_cycle,
 )
+from apps.matching.services.progress import read_run_progress
+from apps.matching.tasks import start_sharded_matching_run
 from apps.outreach.models import OutreachMessage
 from apps.outreach.serializers import OutreachMessageSerializer, SendOutreachSerializer
 from apps.outreach.services.sender import send_outreach_message
@@ -35,9 +39,11 @@ from apps.patients.serializers import (
     PatientProfileSerializer,
 )
 from apps.patients.services.profile import (
+    apply_history_profile,
+    combined_history_text,
     compute_completeness,
-    generate_patient_embedding,
-    infer_structured_profile,
+    embed_patient,
+    infer_history_profile,
 )
 from apps.patients.services.access_token import issue_patient_portal_token
 from apps.patients.services.document_extraction import extract_document_text, is_supported_text_document
@@ -50,14 +56,6 @@ def _visible_matches_queryset(queryset):
     return queryset.exclude(overall_status=MatchOverallStatus.UNLIKELY).filter(eligibility_score__gte=min_eligibility)
 
 
-def _build_combined_history_text(patient: PatientProfile) -> str:
-    entries = patient.history_entries.order_by("created_at").values_list("entry_text", flat=True)
-    cleaned = [text.strip() for text in entries if isinstance(text, str) and text.strip()]
-    if cleaned:
-        return "\n\n".join(cleaned)
-    return (patient.story or "").strip()
-
-
 def _ensure_ai_structured_profile(patient: PatientProfile) -> None:
     """
     Backfill structured profile + AI summary for legacy patients that were
@@ -68,40 +66,11 @@ def _ensure_ai_structured_profile(patient: PatientProfile) -> None:
     if has_ai_summary:
         return
 
-    combined_story = _build_combined_history_text(patient)
+    combined_story = combined_history_text(patient)
     if not combined_story:
         return
 
-    inferred = infer_structured_profile(combined_story)
-    embedding = generate_patient_embedding(
-        {
-            "name": patient.full_name,
-            "age": patient.age,
-            "sex": patient.sex,
-            "city": patient.city,
-            "country": patient.country,
-            "story": combined_story,
-        },
-        inferred,
-    )
-
-    patient.story = combined_story
-    patient.structured_profile = inferred
-    patient.embedding_vector = embedding
-    if inferred.get("diagnosis"):
-        patient.diagnosis = str(inferred.get("diagnosis", ""))
-    if inferred.get("stage"):
-        patient.stage = str(inferred.get("stage", ""))
-    patient.save(
-        update_fields=[
-            "story",
-            "structured_profile",
-            "embedding_vector",
-            "diagnosis",
-            "stage",
-            "updated_at",
-        ]
-    )
+    apply_history_profile(patient, combined_story, infer_history_profile(combined_story))
 
 
 def _ensure_initial_history_entry(patient: PatientProfile) -> None:
@@ -203,6 +172,24 @@ class MeView(APIView):
         )
 
 
+def _running_run_progress(run: MatchingRun) -> dict:
+    """Live counters from the run's progress channel, over the last flushed metadata."""
+    metadata = run.metadata if isinstance(run.metadata, dict) else {}
+    progress = {
+        "patients": metadata.get("patients"),
+        "processed_patients": metadata.get("processed_patients", 0),
+        "updates": metadata.get("updates", 0),
+        "stop_requested": bool(metadata.get("stop_requested")),
+    }
+    live = read_run_progress(run.id)
+    # Redis counters restart if its keys expire mid-run; never report less than what was flushed.
+    for key in ("processed_patients", "updates"):
+        if key in live:
+            progress[key] = max(int(progress[key] or 0), live[key])
+    progress["stop_requested"] = progress["stop_requested"] or bool(live.get("stop_requested"))
+    return progress
+
+
 class CoordinatorDashboardView(APIView):
     permission_classes = [IsCoordinatorOrAdmin]
 
@@ -234,6 +221,7 @@ class CoordinatorDashboardView(APIView):
                 "is_running": bool(running_run),
                 "running_run_id": running_run.id if running_run else None,
                 "running_started_at": running_run.started_at if running_run else None,
+                "running_progress": _running_run_progress(running_run) if running_run else None,
                 "latest_run_status": latest_run.status if latest_run else None,
                 "latest_run_started_at": latest_run.started_at if latest_run else None,
                 "last_completed_at": (completed_run.finished_at if completed_run else latest_match_evaluated),
@@ -390,8 +378,11 @@ class CoordinatorSettingsView(APIView):
                     "mode": settings.LLM_MODE,
                     "configured": llm_configured,
                     "providers": {"gemini": gemini_configured, "hf": hf_configured},
+                    "circuit_breakers": provider_breaker_states(),
                 },
                 "outreach_delivery_mode": settings.OUTREACH_DELIVERY_MODE,
+                # Latency of outbound calls made by this web process (story parsing, embeddings).
+                "outbound_http": http_client_metrics(),
             }
         )
 
@@ -419,8 +410,8 @@ class PatientIntakeView(APIView):
 
         org = _resolve_intake_organization(payload)
 
-        structured = infer_structured_profile(story_text)
-        embedding = generate_patient_embedding(normalized_payload, structured)
+        structured = infer_history_profile(story_text)
+        embedding = embed_patient(normalized_payload, structured)
 
         patient_count = PatientProfile.objects.count() + 1
         patient = PatientProfile.objects.create(
@@ -440,7 +431,8 @@ class PatientIntakeView(APIView):
             contact_value=payload["contactInfo"],
             consent=payload["consent"],
             profile_completeness=compute_completeness(normalized_payload),
-            embedding_vector=embedding,
+            embedding_vector=embedding.vector,
+            embedding_version=embedding.version,
         )
         if story_text:
             PatientHistoryEntry.objects.create(
@@ -559,43 +551,22 @@ class PatientHistoryView(APIView):
         serializer = PatientHistoryEntryCreateSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
+        previous_story = combined_history_text(patient)
         entry = PatientHistoryEntry.objects.create(
             patient=patient,
             source=PatientHistoryEntry.Source.PATIENT_PORTAL,
             entry_text=serializer.validated_data["entry_text"],
         )
 
-        combined_story = _build_combined_history_text(patient)
-        structured = infer_structured_profile(combined_story)
-        embedding = generate_patient_embedding(
-            {
-                "name": patient.full_name,
-                "age": patient.age,
-                "sex": patient.sex,
-                "city": patient.city,
-                "country": patient.country,
-                "story": combined_story,
-            },
-            structured,
-        )
-
-        patient.story = combined_story
-        patient.structured_profile = structured
-        patient.embedding_vector = embedding
-        if structured.get("diagnosis"):
-            patient.diagnosis = str(structured.get("diagnosis", ""))
-        if structured.get("stage"):
-            patient.stage = str(structured.get("stage", ""))
-        patient.save(
-            update_fields=[
-                "story",
-                "structured_profile",
-                "embedding_vector",
-                "diagnosis",
-                "stage",
-                "updated_at",
-            ]
+        combined_story = combined_history_text(patient)
+        # Usually parses just the new entry and merges it into the existing profile.
+        structured = infer_history_profile(
+            combined_story,
+            existing=patient.structured_profile,
+            previous_history=previous_story,
+            new_entry=entry.entry_text,
         )
+        apply_history_profile(patient, combined_story, structured)
 
         updates = evaluate_patient_against_trials(patient)
         return Response(
@@ -708,7 +679,10 @@ class MatchingRunNowView(APIView):
     def post(self, request):
         reconcile_stale_running_runs()
         try:
-            run = run_full_matching_cycle(run_type="manual")
+            if settings.MATCH_RUN_MODE == "sharded":
+                run = start_sharded_matching_run(run_type="manual")
+            else:
+                run = run_full_matching_cycle(run_type="manual")
         except MatchingRunAlreadyRunningError as exc:
             payload = {"detail": "A matching run is already in progress."}
             if exc.running_run:
@@ -4,7 +4,7 @@ from django.core.management.base import BaseCommand
 from apps.core.models import Organization
 from apps.matching.services.engine import run_full_matching_cycle
 from apps.patients.models import PatientProfile
-from apps.patients.services.profile import infer_structured_profile
+from apps.patients.services.profile import infer_history_profile
 from apps.trials.services.ingestion import ingest_sample_trials
 
 
@@ -66,7 +66,7 @@ class Command(BaseCommand):
         ]
 
         for payload in sample_patients:
-            structured = infer_structured_profile(payload["story"])
+            structured = infer_history_profile(payload["story"])
             PatientProfile.objects.get_or_create(
                 patient_code=payload["code"],
                 defaults={
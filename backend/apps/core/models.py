@@ -20,3 +20,17 @@ class Organization(TimeStampedModel):
 
     def __str__(self) -> str:
         return self.name
+
+
+class EmbeddingCacheEntry(TimeStampedModel):
+    """Embedding vector keyed by a hash of the normalized text, embedding endpoint and dimensions."""
+
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=255)
+    dimensions = models.PositiveIntegerField()
+    vector = models.BinaryField(help_text="Little-endian float32 values")
+    hit_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.model}:{self.key[:12]}"
@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from datetime import timedelta
+from typing import Any, Dict, Iterable, Type
+
+from django.conf import settings
+from django.db import models
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+
+class CacheTable:
+    """
+    Get, store and prune for a database cache table with a unique `key`,
+    `created_at`, `last_used_at` and `hit_count`. Entries older than the
+    `ttl_setting` seconds are ignored and pruned; without one they never
+    expire. Pruning then keeps the `max_entries_setting` most recently used.
+
+    Settings are named rather than read up front so they follow
+    override_settings.
+    """
+
+    def __init__(self, model: Type[models.Model], max_entries_setting: str, ttl_setting: str | None = None) -> None:
+        self.model = model
+        self.max_entries_setting = max_entries_setting
+        self.ttl_setting = ttl_setting
+
+    def _expiry_cutoff(self):
+        return timezone.now() - timedelta(seconds=int(getattr(settings, self.ttl_setting)))
+
+    def _live(self) -> QuerySet:
+        entries = self.model.objects.all()
+        if self.ttl_setting is not None:
+            entries = entries.filter(created_at__gte=self._expiry_cutoff())
+        return entries
+
+    def get_many(self, keys: Iterable[str], field: str) -> Dict[str, Any]:
+        """`field` of every live entry among `keys`; the entries found are marked recently used."""
+        found = dict(self._live().filter(key__in=list(keys)).values_list("key", field))
+        if found:
+            self.model.objects.filter(key__in=list(found)).update(
+                last_used_at=timezone.now(), hit_count=F("hit_count") + 1
+            )
+        return found
+
+    def get(self, key: str, field: str) -> Any:
+        return self.get_many([key], field).get(key)
+
+    def store_many(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Insert or replace entries given as {key: field values}."""
+        if not entries:
+            return
+        now = timezone.now()
+        fields = list(next(iter(entries.values())))
+        # Replacing an expired entry restarts its TTL, so created_at is rewritten too.
+        self.model.objects.bulk_create(
+            [self.model(key=key, created_at=now, last_used_at=now, **values) for key, values in entries.items()],
+            update_conflicts=True,
+            unique_fields=["key"],
+            update_fields=[*fields, "hit_count", "created_at", "last_used_at"],
+        )
+
+    def prune(self) -> int:
+        """Delete expired entries, then the least recently used above the max entries. Returns the number deleted."""
+        deleted = 0
+        if self.ttl_setting is not None:
+            deleted, _ = self.model.objects.filter(created_at__lt=self._expiry_cutoff()).delete()
+
+        max_entries = max(0, int(getattr(settings, self.max_entries_setting)))
+        overflow_ids = list(
+            self.model.objects.order_by("-last_used_at", "-id").values_list("id", flat=True)[max_entries:]
+        )
+        if overflow_ids:
+            overflow_deleted, _ = self.model.objects.filter(id__in=overflow_ids).delete()
+            deleted += overflow_deleted
+        return deleted
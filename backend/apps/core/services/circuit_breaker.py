@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Callable, Dict, TypeVar
+
+import redis
+import requests
+from django.conf import settings
+
+# Breakers guarding outbound provider calls; reported by the coordinator settings endpoint.
+PROVIDER_BREAKERS = ("gemini", "huggingface", "hf_embedding")
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# After a failed Redis call, skip Redis for this long; breakers then let every call through.
+REDIS_RETRY_SECONDS = 30.0
+
+T = TypeVar("T")
+
+_client: redis.Redis | None = None
+_unavailable_until = 0.0
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    """Timeouts, connection errors and 5xx/429 responses; a 4xx means the provider answered."""
+    if isinstance(exc, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else None
+        return status is None or status >= 500 or status == 429
+    return False
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name: str):
+        super().__init__(f"{name} circuit is open")
+        self.name = name
+
+
+def _redis() -> redis.Redis | None:
+    global _client
+    if time.monotonic() < _unavailable_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.PROVIDER_BREAKER_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+            decode_responses=True,
+        )
+    return _client
+
+
+def _mark_unavailable() -> None:
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one provider, shared by every
+    worker through a Redis hash.
+
+    A call that times out, cannot connect or gets a 5xx/429 response, or
+    succeeds slower than PROVIDER_BREAKER_SLOW_CALL_SECONDS, counts as a
+    failure; other errors (e.g. a 4xx) count as the provider answering.
+    PROVIDER_BREAKER_FAILURE_THRESHOLD failures in a row open the circuit.
+    While open, calls fail fast with CircuitOpenError. After
+    PROVIDER_BREAKER_COOLDOWN_SECONDS one caller at a time is let through as a
+    half-open probe: success closes the circuit, failure reopens it.
+
+    Without Redis the breaker stays closed, so provider calls behave as they
+    would without it.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.key = f"provider_breaker:{name}"
+        self.probe_key = f"{self.key}:probe"
+
+    @staticmethod
+    def _cooldown_seconds() -> float:
+        return max(1.0, float(settings.PROVIDER_BREAKER_COOLDOWN_SECONDS))
+
+    def _read(self, client: redis.Redis) -> Dict[str, str]:
+        return client.hgetall(self.key)
+
+    def is_open(self) -> bool:
+        """True while calls would be rejected without a probe being due."""
+        client = _redis()
+        if client is None:
+            return False
+        try:
+            state = self._read(client)
+            if state.get("state") == OPEN:
+                return time.time() - float(state.get("opened_at", 0)) < self._cooldown_seconds()
+            return state.get("state") == HALF_OPEN and bool(client.exists(self.probe_key))
+        except redis.RedisError:
+            _mark_unavailable()
+            return False
+
+    def allow(self) -> bool:
+        client = _redis()
+        if client is None:
+            return True
+        try:
+            state = self._read(client)
+            current = state.get("state", CLOSED)
+            if current == CLOSED:
+                return True
+            if current == OPEN and time.time() - float(state.get("opened_at", 0)) < self._cooldown_seconds():
+                return False
+            # Cooldown elapsed (or the last probe expired): let exactly one caller probe.
+            probe_ttl = max(1, int(settings.PROVIDER_BREAKER_SLOW_CALL_SECONDS) * 2)
+            if not client.set(self.probe_key, "1", nx=True, ex=probe_ttl):
+                return False
+            client.hset(self.key, "state", HALF_OPEN)
+            return True
+        except redis.RedisError:
+            _mark_unavailable()
+            return True
+
+    def record_success(self, elapsed_seconds: float) -> None:
+        if elapsed_seconds >= float(settings.PROVIDER_BREAKER_SLOW_CALL_SECONDS):
+            self.record_failure(reason="slow")
+            return
+        client = _redis()
+        if client is None:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hset(self.key, mapping={"state": CLOSED, "failures": 0})
+            pipeline.hdel(self.key, "opened_at", "last_failure")
+            pipeline.delete(self.probe_key)
+            pipeline.execute()
+        except redis.RedisError:
+            _mark_unavailable()
+
+    def record_failure(self, reason: str = "error") -> None:
+        client = _redis()
+        if client is None:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hincrby(self.key, "failures", 1)
+            pipeline.hget(self.key, "state")
+            failures, current = pipeline.execute()
+            updates: Dict[str, Any] = {"last_failure": reason}
+            threshold = max(1, int(settings.PROVIDER_BREAKER_FAILURE_THRESHOLD))
+            if current == HALF_OPEN or (current != OPEN and failures >= threshold):
+                updates.update({"state": OPEN, "opened_at": time.time()})
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hset(self.key, mapping=updates)
+            pipeline.delete(self.probe_key)
+            pipeline.execute()
+        except redis.RedisError:
+            _mark_unavailable()
+
+    def call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        started = time.monotonic()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as exc:
+            if counts_as_failure(exc):
+                self.record_failure()
+            else:
+                self.record_success(time.monotonic() - started)
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        client = _redis()
+        if client is None:
+            return {"state": "unknown"}
+        try:
+            state = self._read(client)
+        except redis.RedisError:
+            _mark_unavailable()
+            return {"state": "unknown"}
+        opened_at = state.get("opened_at")
+        return {
+            "state": state.get("state", CLOSED),
+            "consecutive_failures": int(state.get("failures", 0)),
+            "last_failure": state.get("last_failure") or None,
+            "opened_at": (
+                datetime.fromtimestamp(float(opened_at), tz=dt_timezone.utc).isoformat() if opened_at else None
+            ),
+        }
+
+
+def provider_breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(name)
+
+
+def provider_breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {name: provider_breaker(name).status() for name in PROVIDER_BREAKERS}
@@ -1,53 +1,225 @@
 import hashlib
-import math
-from typing import List
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Sequence, Tuple
 
-import requests
+import numpy as np
 from django.conf import settings
 
+from apps.core.services.circuit_breaker import provider_breaker
+from apps.core.services.embedding_cache import (
+    embedding_cache_key,
+    float32_vector,
+    get_cached_embeddings,
+    store_embeddings,
+)
+from apps.core.services.http_client import http_post
+
+
+# Model id recorded for hash-vector fallbacks; bump it if _token_slot ever changes.
+HASH_EMBEDDING_MODEL = "hash-v1"
+
+# Distinct tokens across a catalog are far fewer than token occurrences, so
+# each token is hashed once per dimension count.
+TOKEN_SLOT_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=TOKEN_SLOT_CACHE_SIZE)
+def _token_slot(token: str, dimensions: int) -> Tuple[int, float]:
+    digest = hashlib.sha256(token.encode("utf-8")).digest()
+    return int.from_bytes(digest[:2], "big") % dimensions, (-1.0 if digest[2] % 2 else 1.0)
+
+
+def _normalized_hash_vectors(texts: Sequence[str], dimensions: int) -> np.ndarray:
+    """
+    Hash-vector fallback for many texts as one (len(texts), dimensions) matrix:
+    each token adds its sign at its slot, then rows are L2-normalized. Counts
+    are small integers, so float32 accumulation is exact and the float64 rows
+    match a per-token Python sum bit for bit.
+    """
+    rows: List[int] = []
+    columns: List[int] = []
+    signs: List[float] = []
+    for row, text in enumerate(texts):
+        for token in text.lower().split():
+            column, sign = _token_slot(token, dimensions)
+            rows.append(row)
+            columns.append(column)
+            signs.append(sign)
+
+    counts = np.zeros((len(texts), dimensions), dtype=np.float32)
+    np.add.at(
+        counts,
+        (np.asarray(rows, dtype=np.intp), np.asarray(columns, dtype=np.intp)),
+        np.asarray(signs, dtype=np.float32),
+    )
+    vectors = counts.astype(np.float64)
+    norms = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+    norms[norms == 0.0] = 1.0
+    return vectors / norms[:, None]
+
 
 def _normalized_hash_vector(text: str, dimensions: int) -> List[float]:
-    tokens = text.lower().split()
-    if not tokens:
-        return [0.0] * dimensions
+    return _normalized_hash_vectors([text], dimensions)[0].tolist()
 
-    vec = [0.0] * dimensions
-    for token in tokens:
-        digest = hashlib.sha256(token.encode("utf-8")).digest()
-        idx = int.from_bytes(digest[:2], "big") % dimensions
-        sign = -1.0 if digest[2] % 2 else 1.0
-        vec[idx] += sign
 
-    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
-    return [v / norm for v in vec]
+class Embedding(NamedTuple):
+    vector: List[float]
+    version: str
 
 
-def generate_embedding(text: str) -> List[float]:
-    dimensions = settings.HF_EMBEDDING_DIMENSIONS
-    endpoint = settings.HF_EMBEDDING_ENDPOINT
-    token = settings.HF_API_TOKEN
-
-    if endpoint and token:
-        try:
-            response = requests.post(
-                endpoint,
-                headers={"Authorization": f"Bearer {token}"},
-                json={"inputs": text},
-                timeout=20,
-            )
-            response.raise_for_status()
-            payload = response.json()
-            if isinstance(payload, list) and payload and isinstance(payload[0], (int, float)):
-                vector = payload
-            elif isinstance(payload, list) and payload and isinstance(payload[0], list):
-                vector = payload[0]
-            else:
-                vector = _normalized_hash_vector(text, dimensions)
-        except Exception:
-            vector = _normalized_hash_vector(text, dimensions)
-    else:
-        vector = _normalized_hash_vector(text, dimensions)
+def hf_embeddings_configured() -> bool:
+    return bool(settings.HF_EMBEDDING_ENDPOINT and settings.HF_API_TOKEN)
+
+
+def hash_embedding_version() -> str:
+    return f"{HASH_EMBEDDING_MODEL}/{settings.HF_EMBEDDING_DIMENSIONS}"
+
+
+def current_embedding_version() -> str:
+    """
+    Version stamped on vectors the configured endpoint produces: "<model>/<dimensions>".
+    The model is EMBEDDING_MODEL_VERSION when set, else derived from the HF
+    endpoint, so changing either makes existing vectors stale.
+    """
+    if not hf_embeddings_configured():
+        return hash_embedding_version()
+    model = settings.EMBEDDING_MODEL_VERSION or (
+        "hf-" + hashlib.sha256(settings.HF_EMBEDDING_ENDPOINT.encode("utf-8")).hexdigest()[:12]
+    )
+    return f"{model}/{settings.HF_EMBEDDING_DIMENSIONS}"
 
+
+def compatible_embedding_versions(version: str) -> List[str]:
+    """
+    Stored versions whose vectors can be compared with ones of `version`.
+    Vectors stored before versions were stamped have a blank version and
+    count as the current version until `manage.py reembed` swaps in stamped
+    vectors.
+    """
+    current = current_embedding_version()
+    if version in ("", current):
+        return [current, ""]
+    return [version]
+
+
+def _fit_dimensions(vector: List[float], dimensions: int) -> List[float]:
     if len(vector) < dimensions:
         vector = vector + [0.0] * (dimensions - len(vector))
     return vector[:dimensions]
+
+
+def _embedding_chunks(texts: Sequence[str]) -> List[List[int]]:
+    """Indexes of `texts` grouped into requests of at most HF_EMBEDDING_BATCH_SIZE texts and HF_EMBEDDING_BATCH_MAX_CHARS."""
+    max_items = max(1, int(settings.HF_EMBEDDING_BATCH_SIZE))
+    max_chars = max(1, int(settings.HF_EMBEDDING_BATCH_MAX_CHARS))
+    chunks: List[List[int]] = []
+    current: List[int] = []
+    current_chars = 0
+    for index, text in enumerate(texts):
+        # A single text longer than the limit still goes out, on its own.
+        if current and (len(current) >= max_items or current_chars + len(text) > max_chars):
+            chunks.append(current)
+            current, current_chars = [], 0
+        current.append(index)
+        current_chars += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _request_embeddings(texts: List[str]) -> List[object]:
+    payload = (
+        provider_breaker("hf_embedding")
+        .call(
+            http_post,
+            "hf_embedding",
+            settings.HF_EMBEDDING_ENDPOINT,
+            headers={"Authorization": f"Bearer {settings.HF_API_TOKEN}"},
+            json={"inputs": texts},
+            # Embedding the same text twice is harmless, so transient failures are retried.
+            idempotent=True,
+        )
+        .json()
+    )
+    if not isinstance(payload, list) or len(payload) != len(texts):
+        raise ValueError("unexpected_embedding_response")
+    return payload
+
+
+def _is_vector(value: object) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, (int, float)) for item in value)
+
+
+def _add_stats(stats: Dict[str, int] | None, **counts: int) -> None:
+    if stats is None:
+        return
+    for name, value in counts.items():
+        stats[name] = int(stats.get(name, 0)) + value
+
+
+def embed_texts(texts: Sequence[str], stats: Dict[str, int] | None = None) -> List[Embedding]:
+    """
+    Embed many texts, returning vectors and their versions in input order.
+    Texts already in the embedding cache are not sent; the rest are
+    deduplicated and sent with one HF request per chunk (see
+    _embedding_chunks). A text whose chunk fails, or whose vector in the
+    response is malformed, gets the hash-vector fallback, which is never
+    cached and carries hash_embedding_version().
+
+    When given, `stats` accumulates embedding_cache_hits,
+    embedding_cache_misses and embedding_requests.
+    """
+    dimensions = settings.HF_EMBEDDING_DIMENSIONS
+    vectors: List[List[float] | None] = [None] * len(texts)
+
+    if hf_embeddings_configured():
+        keys = [embedding_cache_key(text, dimensions) for text in texts]
+        cached = get_cached_embeddings(keys)
+        # One slot per distinct uncached text, however often it repeats.
+        pending = {key: text for key, text in zip(keys, texts) if key not in cached}
+        pending_keys = list(pending)
+        pending_texts = list(pending.values())
+        fresh: Dict[str, List[float]] = {}
+        requests = 0
+        for chunk in _embedding_chunks(pending_texts):
+            requests += 1
+            try:
+                # While the breaker is open this fails fast into the hash-vector fallback.
+                response = _request_embeddings([pending_texts[index] for index in chunk])
+            except Exception:
+                continue
+            for index, item in zip(chunk, response):
+                if _is_vector(item):
+                    fresh[pending_keys[index]] = float32_vector(
+                        _fit_dimensions([float(value) for value in item], dimensions)
+                    )
+        store_embeddings(fresh)
+
+        found = {**cached, **fresh}
+        for index, key in enumerate(keys):
+            if key in found:
+                vectors[index] = list(found[key])
+        _add_stats(
+            stats,
+            embedding_cache_hits=sum(1 for key in keys if key in cached),
+            embedding_cache_misses=sum(1 for key in keys if key not in cached),
+            embedding_requests=requests,
+        )
+
+    embeddings: List[Embedding | None] = [
+        Embedding(vector, current_embedding_version()) if vector is not None else None for vector in vectors
+    ]
+    fallback_indexes = [index for index, vector in enumerate(vectors) if vector is None]
+    if fallback_indexes:
+        fallbacks = _normalized_hash_vectors([texts[index] for index in fallback_indexes], dimensions)
+        for index, row in zip(fallback_indexes, fallbacks.tolist()):
+            embeddings[index] = Embedding(row, hash_embedding_version())
+    return embeddings
+
+
+def generate_embeddings(texts: Sequence[str], stats: Dict[str, int] | None = None) -> List[List[float]]:
+    return [embedding.vector for embedding in embed_texts(texts, stats=stats)]
+
+
+def generate_embedding(text: str) -> List[float]:
+    return generate_embeddings([text])[0]
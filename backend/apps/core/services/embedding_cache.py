@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import struct
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from django.conf import settings
+
+from apps.core.models import EmbeddingCacheEntry
+from apps.core.services.cache_table import CacheTable
+
+# Vectors are kept as tuples so a caller mutating its copy cannot change the cached one.
+_lru: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+_lru_lock = threading.Lock()
+_table = CacheTable(EmbeddingCacheEntry, "EMBEDDING_CACHE_MAX_ENTRIES")
+
+
+def embedding_cache_enabled() -> bool:
+    return settings.EMBEDDING_CACHE_ENABLED
+
+
+def embedding_cache_key(text: str, dimensions: int) -> str:
+    normalized = re.sub(r"\s+", " ", text or "").strip()
+    encoded = json.dumps(
+        [normalized, settings.HF_EMBEDDING_ENDPOINT, settings.EMBEDDING_MODEL_VERSION, int(dimensions)],
+        ensure_ascii=True,
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector: Sequence[float]) -> bytes:
+    return struct.pack(f"<{len(vector)}f", *vector)
+
+
+def unpack_vector(data: bytes) -> List[float]:
+    data = bytes(data)
+    return list(struct.unpack(f"<{len(data) // 4}f", data))
+
+
+def float32_vector(vector: Sequence[float]) -> List[float]:
+    """The vector as it reads back from the cache, so cached and fresh embeddings are identical."""
+    return unpack_vector(pack_vector(vector))
+
+
+def _lru_get(keys: Iterable[str]) -> Dict[str, List[float]]:
+    found: Dict[str, List[float]] = {}
+    with _lru_lock:
+        for key in keys:
+            vector = _lru.get(key)
+            if vector is not None:
+                _lru.move_to_end(key)
+                found[key] = list(vector)
+    return found
+
+
+def _lru_put(vectors: Dict[str, Sequence[float]]) -> None:
+    max_size = max(0, int(settings.EMBEDDING_CACHE_LRU_SIZE))
+    with _lru_lock:
+        for key, vector in vectors.items():
+            _lru[key] = tuple(vector)
+            _lru.move_to_end(key)
+        while len(_lru) > max_size:
+            _lru.popitem(last=False)
+
+
+def clear_embedding_lru() -> None:
+    with _lru_lock:
+        _lru.clear()
+
+
+def get_cached_embeddings(keys: Sequence[str]) -> Dict[str, List[float]]:
+    """
+    Look `keys` up in the in-process LRU, then in the table for the rest.
+    Table hits are marked recently used and promoted into the LRU; LRU hits
+    do not touch the table.
+    """
+    if not embedding_cache_enabled() or not keys:
+        return {}
+    found = _lru_get(keys)
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if not missing:
+        return found
+
+    stored = {key: unpack_vector(data) for key, data in _table.get_many(missing, "vector").items()}
+    if stored:
+        _lru_put(stored)
+        found.update(stored)
+    return found
+
+
+def store_embeddings(vectors: Dict[str, Sequence[float]]) -> None:
+    if not embedding_cache_enabled() or not vectors:
+        return
+    model = str(settings.HF_EMBEDDING_ENDPOINT)[:255]
+    _table.store_many(
+        {
+            key: {"model": model, "dimensions": len(vector), "vector": pack_vector(vector)}
+            for key, vector in vectors.items()
+        }
+    )
+    _lru_put(vectors)
+
+
+def prune_embedding_cache() -> int:
+    """Delete the least recently used entries above EMBEDDING_CACHE_MAX_ENTRIES. Returns the number deleted."""
+    return _table.prune()
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Sequence, Tuple
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# Read timeouts per outbound service; the connect timeout is HTTP_CONNECT_TIMEOUT_SECONDS for all of them.
+SERVICE_READ_TIMEOUTS = {
+    "gemini": 40.0,
+    "huggingface": 40.0,
+    "hf_embedding": 20.0,
+    "twilio": 20.0,
+    "ctgov": 30.0,
+}
+DEFAULT_READ_TIMEOUT = 30.0
+# LLM services whose read timeouts are not retried: a provider that hung for
+# a full read timeout is unlikely to answer the next attempt in time, and
+# callers fall back sooner instead.
+NO_READ_TIMEOUT_RETRY_SERVICES = frozenset({"gemini", "huggingface"})
+# Responses worth retrying; anything else is returned (or raised) straight away.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Latency samples kept per service for the percentile snapshot.
+LATENCY_SAMPLES = 200
+
+_session: requests.Session | None = None
+_session_pid: int | None = None
+_session_lock = threading.Lock()
+_metrics: Dict[str, Dict[str, Any]] = {}
+_metrics_lock = threading.Lock()
+
+
+def _session_for_process() -> requests.Session:
+    """
+    Keep-alive session shared by every provider call in this process. The
+    adapter keeps one connection pool per host (HTTP_POOL_CONNECTIONS hosts,
+    HTTP_POOL_MAXSIZE connections each). A forked worker builds its own
+    session rather than sharing the parent's sockets.
+    """
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=max(1, int(settings.HTTP_POOL_CONNECTIONS)),
+                pool_maxsize=max(1, int(settings.HTTP_POOL_MAXSIZE)),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+def request_timeout(service: str, read_timeout: float | None = None) -> Tuple[float, float]:
+    read = read_timeout if read_timeout is not None else SERVICE_READ_TIMEOUTS.get(service, DEFAULT_READ_TIMEOUT)
+    return float(settings.HTTP_CONNECT_TIMEOUT_SECONDS), float(read)
+
+
+def _backoff_seconds(attempt: int, response: requests.Response | None) -> float:
+    cap = float(settings.HTTP_RETRY_BACKOFF_MAX_SECONDS)
+    retry_after = response.headers.get("Retry-After", "") if response is not None else ""
+    if retry_after.isdigit():
+        return min(cap, float(retry_after))
+    # Full jitter keeps workers that failed together from retrying together.
+    return random.uniform(0, min(cap, float(settings.HTTP_RETRY_BACKOFF_SECONDS) * 2**attempt))
+
+
+def _retryable_error(service: str, exc: requests.RequestException, idempotent: bool) -> bool:
+    if isinstance(exc, requests.ConnectTimeout):
+        # Nothing reached the server, so even a non-idempotent call is safe to resend.
+        return True
+    if isinstance(exc, requests.ReadTimeout) and service in NO_READ_TIMEOUT_RETRY_SERVICES:
+        return False
+    return idempotent and isinstance(exc, (requests.ConnectionError, requests.Timeout))
+
+
+def _record(service: str, elapsed: float, retries: int, failed: bool) -> None:
+    with _metrics_lock:
+        stats = _metrics.setdefault(
+            service,
+            {"calls": 0, "failures": 0, "retries": 0, "total_seconds": 0.0, "samples": deque(maxlen=LATENCY_SAMPLES)},
+        )
+        stats["calls"] += 1
+        stats["failures"] += int(failed)
+        stats["retries"] += retries
+        stats["total_seconds"] += elapsed
+        stats["samples"].append(elapsed)
+
+
+def _quantile(samples: Sequence[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def http_request(
+    service: str,
+    method: str,
+    url: str,
+    *,
+    idempotent: bool | None = None,
+    read_timeout: float | None = None,
+    max_retries: int | None = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    Send one outbound request through the pooled session and return the
+    response, raising for HTTP error statuses.
+
+    Connection errors, timeouts and RETRY_STATUSES are retried up to
+    `max_retries` (default HTTP_MAX_RETRIES) times with jittered exponential
+    backoff. Only idempotent calls are retried once a request may have reached
+    the server; `idempotent` defaults to True for GET and False otherwise.
+    Read timeouts of NO_READ_TIMEOUT_RETRY_SERVICES are never retried. Each
+    call's latency, retries included, is recorded under `service`.
+    """
+    if idempotent is None:
+        idempotent = method.upper() == "GET"
+    timeout = request_timeout(service, read_timeout)
+    max_retries = max(0, int(settings.HTTP_MAX_RETRIES if max_retries is None else max_retries))
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        response = None
+        try:
+            response = _session_for_process().request(method, url, timeout=timeout, **kwargs)
+            if not (idempotent and response.status_code in RETRY_STATUSES and attempt < max_retries):
+                response.raise_for_status()
+                _record(service, time.monotonic() - started, attempt, failed=False)
+                return response
+        except requests.HTTPError:
+            _record(service, time.monotonic() - started, attempt, failed=True)
+            raise
+        except requests.RequestException as exc:
+            if not (_retryable_error(service, exc, idempotent) and attempt < max_retries):
+                _record(service, time.monotonic() - started, attempt, failed=True)
+                raise
+        if response is not None:
+            # Release the connection back to the pool before waiting.
+            response.close()
+        time.sleep(_backoff_seconds(attempt, response))
+        attempt += 1
+
+
+def http_get(service: str, url: str, **kwargs: Any) -> requests.Response:
+    return http_request(service, "GET", url, **kwargs)
+
+
+def http_post(service: str, url: str, **kwargs: Any) -> requests.Response:
+    return http_request(service, "POST", url, **kwargs)
+
+
+def http_client_metrics() -> Dict[str, Dict[str, Any]]:
+    """Per-service call counts and latency for outbound calls made by this process."""
+    with _metrics_lock:
+        return {
+            service: {
+                "calls": stats["calls"],
+                "failures": stats["failures"],
+                "retries": stats["retries"],
+                "avg_ms": round(stats["total_seconds"] / stats["calls"] * 1000, 1),
+                "p50_ms": round(_quantile(stats["samples"], 0.5) * 1000, 1),
+                "p95_ms": round(_quantile(stats["samples"], 0.95) * 1000, 1),
+            }
+            for service, stats in sorted(_metrics.items())
+        }
+
+
+def http_latency_quantile(service: str, fraction: float, min_samples: int = 1) -> float | None:
+    """Recent latency quantile for `service` in seconds, or None with fewer than `min_samples` calls."""
+    with _metrics_lock:
+        samples = list(_metrics.get(service, {}).get("samples", ()))
+    if not samples or len(samples) < min_samples:
+        return None
+    return _quantile(samples, fraction)
+
+
+def reset_http_client_metrics() -> None:
+    with _metrics_lock:
+        _metrics.clear()
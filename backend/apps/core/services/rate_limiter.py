@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import redis
+from django.conf import settings
+
+# After a failed Redis call, skip Redis for this long; the limiter then lets every call through.
+REDIS_RETRY_SECONDS = 30.0
+# Idle buckets refill completely within a minute, so their state can expire after that.
+BUCKET_TTL_SECONDS = 120
+# Upper bound on a single sleep while waiting, so a long wait re-checks the bucket.
+MAX_SLEEP_SECONDS = 1.0
+
+# Refills a requests-per-minute and a tokens-per-minute bucket and takes one
+# request plus ARGV[3] tokens from both when both have enough; otherwise takes
+# nothing and returns the seconds until they would. A limit of 0 is unlimited.
+# Refills are timed with the Redis server clock, so workers with skewed clocks
+# share one timeline.
+TOKEN_BUCKET_SCRIPT = """
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local rpm = tonumber(ARGV[1])
+local tpm = tonumber(ARGV[2])
+local cost = math.min(tonumber(ARGV[3]), tpm > 0 and tpm or 0)
+local state = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'ts')
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+local function refill(current, limit)
+  if limit <= 0 then return 0 end
+  return math.min(limit, (tonumber(current) or limit) + elapsed * limit / 60)
+end
+local requests = refill(state[1], rpm)
+local tokens = refill(state[2], tpm)
+local wait = 0
+if rpm > 0 and requests < 1 then wait = math.max(wait, (1 - requests) * 60 / rpm) end
+if tpm > 0 and tokens < cost then wait = math.max(wait, (cost - tokens) * 60 / tpm) end
+if wait == 0 then
+  if rpm > 0 then requests = requests - 1 end
+  tokens = tokens - cost
+end
+redis.call('HSET', KEYS[1], 'requests', tostring(requests), 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return tostring(wait)
+"""
+
+_client: redis.Redis | None = None
+_unavailable_until = 0.0
+
+
+class RateLimitedError(RuntimeError):
+    def __init__(self, provider: str, model: str):
+        super().__init__(f"{provider} rate limit reached for {model}")
+        self.provider = provider
+        self.model = model
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    scope: str
+    requests_per_minute: int
+    tokens_per_minute: int
+
+
+def _redis() -> redis.Redis | None:
+    global _client
+    if time.monotonic() < _unavailable_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.LLM_RATE_LIMIT_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+            decode_responses=True,
+        )
+    return _client
+
+
+def _mark_unavailable() -> None:
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+def parse_rate_limits(spec: str) -> Dict[str, RateLimit]:
+    """
+    Parse LLM_RATE_LIMITS entries of the form `provider[:model]=RPM[/TPM]`,
+    comma separated, e.g. `gemini=900/1000000,gemini:gemini-2.0-pro=60`.
+    Malformed entries are ignored.
+    """
+    limits: Dict[str, RateLimit] = {}
+    for entry in str(spec or "").split(","):
+        scope, _, values = entry.strip().rpartition("=")
+        rpm, _, tpm = values.partition("/")
+        try:
+            limit = RateLimit(scope.strip(), int(rpm or 0), int(tpm or 0))
+        except ValueError:
+            continue
+        if limit.scope and (limit.requests_per_minute > 0 or limit.tokens_per_minute > 0):
+            limits[limit.scope] = limit
+    return limits
+
+
+def rate_limit_for(provider: str, model: str) -> RateLimit | None:
+    """The model's own limit when configured, else the provider-wide one (shared by all its models)."""
+    limits = parse_rate_limits(settings.LLM_RATE_LIMITS)
+    return limits.get(f"{provider}:{model}") or limits.get(provider)
+
+
+def _take(client: redis.Redis, limit: RateLimit, tokens: int) -> float:
+    """Try to take capacity for one call; returns 0 when granted, else the seconds to wait."""
+    wait = client.eval(
+        TOKEN_BUCKET_SCRIPT,
+        1,
+        f"llm_rate:{limit.scope}",
+        limit.requests_per_minute,
+        limit.tokens_per_minute,
+        max(0, int(tokens)),
+        BUCKET_TTL_SECONDS,
+    )
+    return float(wait)
+
+
+def acquire_llm_capacity(provider: str, model: str, tokens: int = 0, max_wait_seconds: float = 0.0) -> bool:
+    """
+    Take one request and `tokens` tokens from the provider/model bucket shared
+    by every process, waiting up to `max_wait_seconds` for it to refill.
+    Returns False when the wait would be longer, so the caller can fall back.
+    Unconfigured providers and an unreachable Redis always succeed.
+    """
+    limit = rate_limit_for(provider, model)
+    if limit is None:
+        return True
+    deadline = time.monotonic() + max(0.0, max_wait_seconds)
+    while True:
+        client = _redis()
+        if client is None:
+            return True
+        try:
+            wait = _take(client, limit, tokens)
+        except redis.RedisError:
+            _mark_unavailable()
+            return True
+        if wait <= 0:
+            return True
+        remaining = deadline - time.monotonic()
+        if wait > remaining:
+            return False
+        time.sleep(min(wait, MAX_SLEEP_SECONDS))
+
+
+def require_llm_capacity(provider: str, model: str, tokens: int = 0, max_wait_seconds: float = 0.0) -> None:
+    """acquire_llm_capacity that raises RateLimitedError instead of returning False."""
+    if not acquire_llm_capacity(provider, model, tokens, max_wait_seconds):
+        raise RateLimitedError(provider, model)
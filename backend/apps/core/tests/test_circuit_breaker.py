@@ -0,0 +1,173 @@
+from unittest.mock import patch
+
+import redis
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from apps.core.services import circuit_breaker
+from apps.core.services.circuit_breaker import CircuitOpenError, provider_breaker
+
+
+class _MemoryRedis:
+    """Just the hash/string commands the breaker uses, kept in process."""
+
+    def __init__(self):
+        self.data = {}
+
+    def pipeline(self, transaction=False):
+        return _MemoryPipeline(self)
+
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        values = dict(mapping or {})
+        if field is not None:
+            values[field] = value
+        self.data.setdefault(key, {}).update({name: str(item) for name, item in values.items()})
+
+    def hdel(self, key, *fields):
+        for field in fields:
+            self.data.get(key, {}).pop(field, None)
+
+    def hincrby(self, key, field, amount):
+        value = int(self.data.setdefault(key, {}).get(field, 0)) + amount
+        self.data[key][field] = str(value)
+        return value
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def exists(self, key):
+        return int(key in self.data)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+class _MemoryPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+
+        return queue
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+
+def _fail():
+    raise requests.ConnectionError("provider down")
+
+
+def _http_error(status_code):
+    def fail():
+        response = requests.Response()
+        response.status_code = status_code
+        raise requests.HTTPError(f"{status_code} error", response=response)
+
+    return fail
+
+
+@override_settings(
+    PROVIDER_BREAKER_FAILURE_THRESHOLD=2,
+    PROVIDER_BREAKER_SLOW_CALL_SECONDS=5,
+    PROVIDER_BREAKER_COOLDOWN_SECONDS=30,
+)
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = _MemoryRedis()
+        patcher = patch.object(circuit_breaker, "_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = provider_breaker("gemini")
+
+    def test_opens_after_consecutive_failures_and_fails_fast(self):
+        for _ in range(2):
+            with self.assertRaises(requests.ConnectionError):
+                self.breaker.call(_fail)
+
+        self.assertTrue(self.breaker.is_open())
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(lambda: "unreachable")
+        self.assertEqual(self.breaker.status()["state"], "open")
+
+    def test_client_errors_do_not_count_as_failures(self):
+        for _ in range(3):
+            with self.assertRaises(requests.HTTPError):
+                self.breaker.call(_http_error(400))
+            with self.assertRaises(ValueError):
+                self.breaker.call(int, "not a number")
+
+        self.assertFalse(self.breaker.is_open())
+        self.assertEqual(self.breaker.status()["consecutive_failures"], 0)
+
+    def test_rate_limits_and_server_errors_count_as_failures(self):
+        for status_code in (429, 503):
+            with self.assertRaises(requests.HTTPError):
+                self.breaker.call(_http_error(status_code))
+
+        self.assertTrue(self.breaker.is_open())
+
+    def test_redis_error_during_probe_check_keeps_breaker_closed(self):
+        self.addCleanup(setattr, circuit_breaker, "_unavailable_until", 0.0)
+        self.redis.hset(self.breaker.key, "state", "half_open")
+        with patch.object(self.redis, "exists", side_effect=redis.ConnectionError("down"), create=True):
+            self.assertFalse(self.breaker.is_open())
+        self.assertGreater(circuit_breaker._unavailable_until, 0.0)
+
+    def test_slow_successes_count_as_failures(self):
+        self.breaker.record_success(elapsed_seconds=6)
+        self.breaker.record_success(elapsed_seconds=6)
+
+        self.assertEqual(self.breaker.status()["last_failure"], "slow")
+        self.assertTrue(self.breaker.is_open())
+
+    def test_half_open_probe_closes_or_reopens(self):
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        with patch.object(circuit_breaker.time, "time", return_value=self._opened_at() + 31):
+            self.assertTrue(self.breaker.allow())
+            # Only one probe at a time.
+            self.assertFalse(self.breaker.allow())
+            self.breaker.record_failure()
+        self.assertTrue(self.breaker.is_open())
+
+        with patch.object(circuit_breaker.time, "time", return_value=self._opened_at() + 31):
+            self.assertEqual(self.breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(
+            self.breaker.status(),
+            {"state": "closed", "consecutive_failures": 0, "last_failure": None, "opened_at": None},
+        )
+
+    def _opened_at(self):
+        return float(self.redis.hget(self.breaker.key, "opened_at"))
+
+
+@override_settings(PROVIDER_BREAKER_REDIS_URL="redis://127.0.0.1:1/0")
+class CircuitBreakerWithoutRedisTests(SimpleTestCase):
+    def setUp(self):
+        circuit_breaker._client = None
+        circuit_breaker._unavailable_until = 0.0
+        self.addCleanup(setattr, circuit_breaker, "_client", None)
+        self.addCleanup(setattr, circuit_breaker, "_unavailable_until", 0.0)
+
+    def test_unreachable_redis_lets_calls_through(self):
+        breaker = provider_breaker("huggingface")
+        for _ in range(3):
+            with self.assertRaises(requests.ConnectionError):
+                breaker.call(_fail)
+
+        self.assertEqual(breaker.call(lambda: "ok"), "ok")
+        self.assertEqual(breaker.status(), {"state": "unknown"})
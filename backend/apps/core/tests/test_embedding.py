@@ -0,0 +1,235 @@
+import hashlib
+import math
+import random
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.core.models import EmbeddingCacheEntry
+from apps.core.services import embedding_cache
+from apps.core.services.embedding import (
+    _embedding_chunks,
+    _normalized_hash_vector,
+    _normalized_hash_vectors,
+    compatible_embedding_versions,
+    current_embedding_version,
+    embed_texts,
+    generate_embeddings,
+)
+from apps.core.services.embedding_cache import clear_embedding_lru, embedding_cache_key, float32_vector
+from apps.trials.models import Trial
+from apps.trials.services.ingestion import upsert_trials
+from apps.trials.services.sample_trials import SAMPLE_TRIALS
+
+
+def _reference_hash_vector(text, dimensions):
+    # The original per-token implementation the vectorized fallback must reproduce exactly.
+    tokens = text.lower().split()
+    if not tokens:
+        return [0.0] * dimensions
+    vec = [0.0] * dimensions
+    for token in tokens:
+        digest = hashlib.sha256(token.encode("utf-8")).digest()
+        idx = int.from_bytes(digest[:2], "big") % dimensions
+        sign = -1.0 if digest[2] % 2 else 1.0
+        vec[idx] += sign
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _embedding_response(inputs):
+    response = Mock()
+    response.json.return_value = [[float(len(text)), 1.0, 0.1, 0.0] for text in inputs]
+    return response
+
+
+@override_settings(
+    HF_EMBEDDING_ENDPOINT="https://hf.example/embed",
+    HF_API_TOKEN="hf-token",
+    HF_EMBEDDING_DIMENSIONS=4,
+    HF_EMBEDDING_BATCH_SIZE=2,
+    HF_EMBEDDING_BATCH_MAX_CHARS=10,
+    EMBEDDING_CACHE_ENABLED=False,
+)
+class BatchEmbeddingTests(SimpleTestCase):
+    def test_chunks_by_count_and_characters(self):
+        texts = ["aa", "bb", "cc", "dddddddd", "e", "ffffffffffff"]
+
+        self.assertEqual(_embedding_chunks(texts), [[0, 1], [2, 3], [4], [5]])
+
+    @patch("apps.core.services.embedding.http_post")
+    def test_one_request_per_chunk_with_per_item_fallback(self, post):
+        def respond(service, url, json, **kwargs):
+            response = Mock()
+            if json["inputs"] == ["c"]:
+                response.json.side_effect = ValueError("bad body")
+            else:
+                response.json.return_value = [[1, 0, 0, 0], "garbage"]
+            return response
+
+        post.side_effect = respond
+        texts = ["a", "b", "c"]
+
+        vectors = generate_embeddings(texts)
+
+        self.assertEqual(post.call_count, 2)
+        self.assertEqual(post.call_args_list[0].kwargs["json"], {"inputs": ["a", "b"]})
+        self.assertEqual(vectors[0], [1.0, 0.0, 0.0, 0.0])
+        self.assertEqual(vectors[1], _normalized_hash_vector("b", 4))
+        self.assertEqual(vectors[2], _normalized_hash_vector("c", 4))
+
+
+class HashEmbeddingTests(SimpleTestCase):
+    def test_vectorized_fallback_is_bit_identical_to_reference(self):
+        rng = random.Random(7)
+        vocabulary = ["HER2+", "stage", "IV", "métastatique", "乳腺癌", "ECOG", "1", "-", "trial", "x" * 40]
+        texts = ["", "   ", "a a", "Breast cancer\tHER2+  stage IV\n"]
+        texts += [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 300))) for _ in range(60)]
+
+        for dimensions in (3, 384, 1536):
+            batch = _normalized_hash_vectors(texts, dimensions)
+            for text, row in zip(texts, batch.tolist()):
+                expected = _reference_hash_vector(text, dimensions)
+                self.assertEqual([value.hex() for value in row], [value.hex() for value in expected])
+                self.assertEqual(_normalized_hash_vector(text, dimensions), expected)
+
+    def test_cancelling_tokens_give_a_zero_vector(self):
+        # With one dimension every token lands in the same slot, so opposite signs cancel.
+        words = {hashlib.sha256(word.encode("utf-8")).digest()[2] % 2: word for word in ("a", "b", "c", "d", "e", "f")}
+        text = f"{words[0]} {words[1]}"
+
+        self.assertEqual(_normalized_hash_vector(text, 1), [0.0])
+        self.assertEqual(_reference_hash_vector(text, 1), [0.0])
+
+
+@override_settings(
+    HF_EMBEDDING_ENDPOINT="https://hf.example/embed",
+    HF_API_TOKEN="hf-token",
+    HF_EMBEDDING_DIMENSIONS=4,
+)
+class EmbeddingCacheLookupTests(SimpleTestCase):
+    def test_key_ignores_whitespace_but_not_endpoint_or_dimensions(self):
+        key = embedding_cache_key("Breast  cancer\n", 4)
+
+        self.assertEqual(key, embedding_cache_key(" Breast cancer", 4))
+        self.assertNotEqual(key, embedding_cache_key("Breast cancer", 8))
+        with self.settings(HF_EMBEDDING_ENDPOINT="https://hf.example/other"):
+            self.assertNotEqual(key, embedding_cache_key("Breast cancer", 4))
+
+    @patch("apps.core.services.embedding.store_embeddings")
+    @patch("apps.core.services.embedding.get_cached_embeddings")
+    @patch("apps.core.services.embedding.http_post")
+    def test_only_distinct_uncached_texts_are_requested(self, post, get_cached, store):
+        get_cached.return_value = {embedding_cache_key("cached", 4): [0.0, 0.0, 1.0, 0.0]}
+        post.side_effect = lambda service, url, json, **kwargs: _embedding_response(json["inputs"])
+        stats = {"embedding_requests": 1}
+
+        vectors = generate_embeddings(["cached", "new", "new"], stats=stats)
+
+        self.assertEqual(post.call_args.kwargs["json"], {"inputs": ["new"]})
+        self.assertEqual(vectors[0], [0.0, 0.0, 1.0, 0.0])
+        self.assertEqual(vectors[1], float32_vector([3.0, 1.0, 0.1, 0.0]))
+        self.assertEqual(vectors[2], vectors[1])
+        self.assertEqual(store.call_args.args[0], {embedding_cache_key("new", 4): vectors[1]})
+        self.assertEqual(stats, {"embedding_cache_hits": 1, "embedding_cache_misses": 2, "embedding_requests": 2})
+
+    @patch("apps.core.services.embedding.store_embeddings")
+    @patch("apps.core.services.embedding.get_cached_embeddings", return_value={})
+    @patch("apps.core.services.embedding.http_post", side_effect=RuntimeError("down"))
+    def test_hash_fallbacks_are_not_cached(self, post, get_cached, store):
+        embeddings = embed_texts(["a b"])
+
+        self.assertEqual(embeddings[0].vector, _normalized_hash_vector("a b", 4))
+        self.assertEqual(embeddings[0].version, "hash-v1/4")
+        store.assert_called_once_with({})
+
+
+class EmbeddingVersionTests(SimpleTestCase):
+    @override_settings(HF_EMBEDDING_ENDPOINT="", HF_EMBEDDING_DIMENSIONS=384)
+    def test_hash_version_without_endpoint(self):
+        self.assertEqual(current_embedding_version(), "hash-v1/384")
+
+    @override_settings(HF_EMBEDDING_ENDPOINT="https://hf.example/a", HF_API_TOKEN="t", HF_EMBEDDING_DIMENSIONS=384)
+    def test_version_follows_endpoint_and_override(self):
+        version = current_embedding_version()
+
+        self.assertRegex(version, r"^hf-[0-9a-f]{12}/384$")
+        with self.settings(HF_EMBEDDING_ENDPOINT="https://hf.example/b"):
+            self.assertNotEqual(current_embedding_version(), version)
+        with self.settings(EMBEDDING_MODEL_VERSION="bge-small-v1.5"):
+            self.assertEqual(current_embedding_version(), "bge-small-v1.5/384")
+
+    @override_settings(HF_EMBEDDING_ENDPOINT="", HF_EMBEDDING_DIMENSIONS=384)
+    def test_unstamped_vectors_count_as_current_version(self):
+        self.assertEqual(compatible_embedding_versions(""), ["hash-v1/384", ""])
+        self.assertEqual(compatible_embedding_versions("hash-v1/384"), ["hash-v1/384", ""])
+        self.assertEqual(compatible_embedding_versions("legacy/384"), ["legacy/384"])
+
+
+@override_settings(EMBEDDING_CACHE_LRU_SIZE=2)
+class EmbeddingLruTests(SimpleTestCase):
+    def setUp(self):
+        clear_embedding_lru()
+        self.addCleanup(clear_embedding_lru)
+
+    def test_lru_serves_hits_without_the_table_and_evicts_oldest(self):
+        embedding_cache._lru_put({"a": [1.0], "b": [2.0]})
+        embedding_cache._lru_get(["a"])
+        embedding_cache._lru_put({"c": [3.0]})
+
+        with patch.object(embedding_cache.EmbeddingCacheEntry, "objects") as objects:
+            self.assertEqual(embedding_cache.get_cached_embeddings(["a", "c"]), {"a": [1.0], "c": [3.0]})
+        objects.filter.assert_not_called()
+        self.assertNotIn("b", embedding_cache._lru)
+
+    def test_vectors_round_trip_as_float32_bytes(self):
+        packed = embedding_cache.pack_vector([0.5, -1.25, 0.1])
+
+        self.assertEqual(len(packed), 12)
+        self.assertEqual(embedding_cache.unpack_vector(packed), float32_vector([0.5, -1.25, 0.1]))
+
+
+@override_settings(
+    HF_EMBEDDING_ENDPOINT="https://hf.example/embed",
+    HF_API_TOKEN="hf-token",
+    HF_EMBEDDING_DIMENSIONS=4,
+)
+class EmbeddingCacheTests(TestCase):
+    def setUp(self):
+        clear_embedding_lru()
+        self.addCleanup(clear_embedding_lru)
+
+    @patch("apps.core.services.embedding.http_post")
+    def test_resyncing_unchanged_trials_makes_no_embedding_requests(self, post):
+        post.side_effect = lambda service, url, json, **kwargs: _embedding_response(json["inputs"])
+        upsert_trials(SAMPLE_TRIALS)
+        first_calls = post.call_count
+        clear_embedding_lru()
+        stats = {}
+
+        trials = upsert_trials(SAMPLE_TRIALS, stats=stats)
+
+        self.assertGreater(first_calls, 0)
+        self.assertEqual(post.call_count, first_calls)
+        self.assertEqual(stats["embedding_cache_hits"], len(SAMPLE_TRIALS))
+        self.assertEqual(stats["embedding_requests"], 0)
+        self.assertEqual(EmbeddingCacheEntry.objects.count(), len({trial.embedding_text for trial in trials}))
+        self.assertEqual(EmbeddingCacheEntry.objects.filter(hit_count=1).count(), EmbeddingCacheEntry.objects.count())
+
+    @patch("apps.core.services.embedding.http_post")
+    def test_fetch_failing_partway_writes_no_trials(self, post):
+        post.side_effect = lambda service, url, json, **kwargs: _embedding_response(json["inputs"])
+        upsert_trials(SAMPLE_TRIALS[:1])
+        before = Trial.objects.values("trial_id", "inclusion_text", "embedding_vector", "rule_features").get()
+
+        def payloads():
+            yield {**SAMPLE_TRIALS[0], "inclusion_text": "Changed criteria."}
+            raise ConnectionError("fetch failed")
+
+        with self.assertRaises(ConnectionError):
+            upsert_trials(payloads())
+
+        after = Trial.objects.values("trial_id", "inclusion_text", "embedding_vector", "rule_features").get()
+        self.assertEqual(after["inclusion_text"], before["inclusion_text"])
+        self.assertEqual(list(after["embedding_vector"]), list(before["embedding_vector"]))
+        self.assertEqual(after["rule_features"], before["rule_features"])
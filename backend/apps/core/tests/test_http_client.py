@@ -0,0 +1,75 @@
+import io
+from unittest.mock import Mock, patch
+
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from apps.core.services import http_client
+from apps.core.services.http_client import http_client_metrics, http_post, reset_http_client_metrics
+
+
+def _response(status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+@override_settings(HTTP_MAX_RETRIES=2, HTTP_CONNECT_TIMEOUT_SECONDS=3)
+class HttpClientTests(SimpleTestCase):
+    def setUp(self):
+        reset_http_client_metrics()
+        self.addCleanup(reset_http_client_metrics)
+        self.session = Mock()
+        for target, replacement in (("_session_for_process", Mock(return_value=self.session)), ("time", Mock())):
+            patcher = patch.object(http_client, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        http_client.time.monotonic.return_value = 0.0
+
+    def test_idempotent_call_retries_transient_failures(self):
+        self.session.request.side_effect = [requests.ConnectionError("reset"), _response(503), _response(200)]
+
+        response = http_post("gemini", "https://example.test", json={}, idempotent=True)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.session.request.call_count, 3)
+        self.assertEqual(self.session.request.call_args.kwargs["timeout"], (3.0, 40.0))
+        self.assertEqual(http_client.time.sleep.call_count, 2)
+        self.assertEqual(http_client_metrics()["gemini"]["retries"], 2)
+
+    def test_non_idempotent_call_only_retries_connect_timeouts(self):
+        self.session.request.side_effect = [requests.ConnectTimeout(), requests.ReadTimeout()]
+
+        with self.assertRaises(requests.ReadTimeout):
+            http_post("twilio", "https://example.test", data={})
+
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertEqual(http_client_metrics()["twilio"]["failures"], 1)
+
+    def test_llm_read_timeouts_are_not_retried(self):
+        self.session.request.side_effect = [requests.ConnectionError("reset"), requests.ReadTimeout()]
+
+        with self.assertRaises(requests.ReadTimeout):
+            http_post("gemini", "https://example.test", json={}, idempotent=True)
+
+        self.assertEqual(self.session.request.call_count, 2)
+        self.assertEqual(http_client_metrics()["gemini"]["retries"], 1)
+
+    def test_max_retries_overrides_setting(self):
+        self.session.request.return_value = _response(503)
+
+        with self.assertRaises(requests.HTTPError):
+            http_post("gemini", "https://example.test", json={}, idempotent=True, max_retries=0)
+
+        self.assertEqual(self.session.request.call_count, 1)
+
+    def test_error_status_raises_after_retries_are_spent(self):
+        self.session.request.return_value = _response(503)
+
+        with self.assertRaises(requests.HTTPError):
+            http_post("huggingface", "https://example.test", idempotent=True)
+
+        self.assertEqual(self.session.request.call_count, 3)
+        metrics = http_client_metrics()["huggingface"]
+        self.assertEqual((metrics["calls"], metrics["failures"], metrics["retries"]), (1, 1, 2))
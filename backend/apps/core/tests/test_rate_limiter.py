@@ -0,0 +1,65 @@
+from unittest.mock import Mock, patch
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.core.services import rate_limiter
+from apps.core.services.rate_limiter import RateLimit, acquire_llm_capacity, parse_rate_limits, rate_limit_for
+
+
+class RateLimitConfigTests(SimpleTestCase):
+    def test_parse_rate_limits(self):
+        limits = parse_rate_limits("gemini=900/1000000, huggingface:https://hf.example/m=30, broken=x, zero=0")
+
+        self.assertEqual(limits["gemini"], RateLimit("gemini", 900, 1000000))
+        self.assertEqual(
+            limits["huggingface:https://hf.example/m"], RateLimit("huggingface:https://hf.example/m", 30, 0)
+        )
+        self.assertNotIn("broken", limits)
+        self.assertNotIn("zero", limits)
+
+    @override_settings(LLM_RATE_LIMITS="gemini=900/1000000,gemini:gemini-2.0-pro=60")
+    def test_model_limit_overrides_provider_limit(self):
+        self.assertEqual(rate_limit_for("gemini", "gemini-2.0-pro").requests_per_minute, 60)
+        self.assertEqual(rate_limit_for("gemini", "gemini-2.0-flash").scope, "gemini")
+        self.assertIsNone(rate_limit_for("huggingface", "https://hf.example/m"))
+
+
+@override_settings(LLM_RATE_LIMITS="gemini=60/10000")
+class AcquireCapacityTests(SimpleTestCase):
+    def setUp(self):
+        for target, replacement in (("_redis", Mock(return_value=Mock())), ("time", Mock(wraps=rate_limiter.time))):
+            patcher = patch.object(rate_limiter, target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        rate_limiter.time.sleep = Mock()
+
+    def test_waits_for_refill_within_max_wait(self):
+        with patch.object(rate_limiter, "_take", side_effect=[0.5, 0.0]) as take:
+            self.assertTrue(acquire_llm_capacity("gemini", "gemini-2.0-flash", tokens=1200, max_wait_seconds=5))
+
+        self.assertEqual(take.call_count, 2)
+        self.assertEqual(take.call_args.args[1:], (RateLimit("gemini", 60, 10000), 1200))
+        rate_limiter.time.sleep.assert_called_once_with(0.5)
+
+    def test_returns_false_when_wait_exceeds_max_wait(self):
+        with patch.object(rate_limiter, "_take", return_value=30.0):
+            self.assertFalse(acquire_llm_capacity("gemini", "gemini-2.0-flash", tokens=1200, max_wait_seconds=5))
+
+        rate_limiter.time.sleep.assert_not_called()
+
+    def test_bucket_is_timed_by_the_redis_clock(self):
+        client = Mock()
+        client.eval.return_value = "0"
+
+        self.assertEqual(rate_limiter._take(client, RateLimit("gemini", 60, 10000), 1200), 0.0)
+
+        script, _, key, *args = client.eval.call_args.args
+        self.assertIn("redis.call('TIME')", script)
+        self.assertEqual(key, "llm_rate:gemini")
+        self.assertEqual(args, [60, 10000, 1200, rate_limiter.BUCKET_TTL_SECONDS])
+
+    def test_unconfigured_provider_skips_redis(self):
+        with patch.object(rate_limiter, "_take") as take:
+            self.assertTrue(acquire_llm_capacity("huggingface", "https://hf.example/m"))
+
+        take.assert_not_called()
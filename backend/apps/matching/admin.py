@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import MatchEvaluation, MatchingRun
+from .models import ExplanationCacheEntry, MatchEvaluation, MatchingRun
 
 
 @admin.register(MatchingRun)
@@ -21,3 +21,9 @@ class MatchEvaluationAdmin(admin.ModelAdmin):
         "outreach_status",
     )
     search_fields = ("patient__patient_code", "patient__full_name", "trial__trial_id")
+
+
+@admin.register(ExplanationCacheEntry)
+class ExplanationCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ("id", "provider", "model", "prompt_version", "hit_count", "created_at", "last_used_at")
+    search_fields = ("key",)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.core.services.embedding import current_embedding_version
+from apps.core.services.embedding_cache import prune_embedding_cache
+from apps.matching.services.reembed import (
+    REEMBED_TARGETS,
+    backfill_shadow_embeddings,
+    stale_rows,
+    swap_shadow_embeddings,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-embed trials and patients whose vectors are missing or from another embedding model, "
+        "writing shadow columns and swapping them in atomically once every row is done. Resumable."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            choices=[*sorted(REEMBED_TARGETS), "all"],
+            default="all",
+            help="Table to re-embed (default: all, swapped together).",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=0,
+            help="Rows per embedding call and checkpoint (default: HF_EMBEDDING_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--no-swap",
+            action="store_true",
+            help="Only fill the shadow columns; a later run without this flag swaps them in.",
+        )
+
+    def handle(self, *args, **options):
+        targets = sorted(REEMBED_TARGETS) if options["target"] == "all" else [options["target"]]
+        batch_size = max(1, int(options["batch_size"] or settings.HF_EMBEDDING_BATCH_SIZE))
+        version = current_embedding_version()
+        stats: dict = {}
+
+        backfills = []
+        for target in targets:
+            self.stdout.write(f"{target}: {stale_rows(target, version).count()} stale row(s) for {version}")
+            backfill = backfill_shadow_embeddings(
+                target,
+                batch_size,
+                stats=stats,
+                on_batch=lambda item: self.stdout.write(
+                    f"  {item.target}: checkpoint id={item.last_id} embedded={item.embedded} failed={item.failed}"
+                ),
+            )
+            backfills.append(backfill)
+
+        if options["no_swap"]:
+            self.stdout.write(self.style.SUCCESS("Shadow columns filled; run again without --no-swap to swap."))
+            return
+
+        swap_shadow_embeddings(backfills)
+        prune_embedding_cache()
+        summary = ", ".join(f"{item.target} {item.swapped} swapped, {item.failed} failed" for item in backfills)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Re-embedded with {version}: {summary} "
+                f"(embedding cache {stats.get('embedding_cache_hits', 0)} hit(s), "
+                f"{stats.get('embedding_requests', 0)} request(s))."
+            )
+        )
@@ -1,6 +1,8 @@
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 
 from apps.matching.services.engine import run_full_matching_cycle
+from apps.matching.tasks import start_sharded_matching_run
 
 
 class Command(BaseCommand):
@@ -8,7 +10,38 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument("--run-type", default="manual")
+        parser.add_argument(
+            "--mode",
+            choices=["serial", "sharded"],
+            default=None,
+            help="Run in-process (serial) or fan shards out to Celery workers (default: MATCH_RUN_MODE).",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help=(
+                "Only re-evaluate patients affected by patient or trial changes since the last completed run. "
+                "Incremental runs are always in-process."
+            ),
+        )
 
     def handle(self, *args, **options):
+        if options["incremental"]:
+            if options["mode"] == "sharded":
+                raise CommandError("--incremental runs in-process and cannot be combined with --mode sharded.")
+            run = run_full_matching_cycle(run_type=options["run_type"], incremental=True)
+            self.stdout.write(self.style.SUCCESS(f"Incremental matching run {run.id} complete: {run.metadata}"))
+            return
+
+        mode = options["mode"] or settings.MATCH_RUN_MODE
+        if mode == "sharded":
+            run = start_sharded_matching_run(run_type=options["run_type"])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Matching run {run.id} dispatched as {run.metadata.get('shard_count', 0)} shard(s)."
+                )
+            )
+            return
+
         run = run_full_matching_cycle(run_type=options["run_type"])
         self.stdout.write(self.style.SUCCESS(f"Matching run {run.id} complete: {run.metadata}"))
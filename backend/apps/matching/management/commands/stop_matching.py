@@ -8,6 +8,7 @@ from django.utils import timezone
 
 from apps.matching.models import MatchingRun
 from apps.matching.services.engine import MATCHING_RUN_LOCK_KEY
+from apps.matching.services.progress import read_run_progress, request_run_stop
 
 
 class Command(BaseCommand):
@@ -59,15 +60,9 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS("No running matching job found."))
             return
 
-        now = timezone.now().isoformat()
-        for run in running_runs:
-            metadata = run.metadata if isinstance(run.metadata, dict) else {}
-            metadata["stop_requested"] = True
-            metadata["stop_requested_at"] = now
-            run.metadata = metadata
-            run.save(update_fields=["metadata", "updated_at"])
-
         run_ids = [run.id for run in running_runs]
+        request_run_stop(run_ids)
+
         self.stdout.write(self.style.WARNING(f"Stop requested for run(s): {run_ids}"))
 
         if self._matching_lock_is_free():
@@ -96,9 +91,11 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.SUCCESS(f"Marked stale run(s) as stopped: {stopped_ids}"))
                 return
         if remaining:
+            progress = {run_id: read_run_progress(run_id) for run_id in remaining}
             self.stdout.write(
                 self.style.WARNING(
                     f"Stop requested, but run(s) still marked running: {remaining}. "
+                    f"Live progress: {progress}. "
                     "Check worker/api logs and rerun if needed."
                 )
             )
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import math
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.matching.services.engine import ACTIVE_TRIAL_STATUSES
+from apps.matching.services.retrieval import (
+    configure_vector_search,
+    cosine_distance,
+    halfvec_index_name,
+    halfvec_index_sql,
+    vector_search_params,
+)
+from apps.patients.models import PatientProfile
+from apps.trials.models import Trial
+
+TARGET_MODELS = {
+    "trials": Trial,
+    "patients": PatientProfile,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Inspect ANN vector indexes, manage optional IVFFlat and halfvec indexes, report recall@K versus exact "
+        "search and benchmark half against full precision."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "action",
+            choices=[
+                "status",
+                "create-ivfflat",
+                "drop-ivfflat",
+                "create-halfvec",
+                "drop-halfvec",
+                "recall",
+                "benchmark",
+            ],
+        )
+        parser.add_argument(
+            "--target",
+            choices=sorted(TARGET_MODELS),
+            default="trials",
+            help="Table whose vectors are indexed or searched (default: trials).",
+        )
+        parser.add_argument("--lists", type=int, default=0, help="IVFFlat lists (default: sqrt of row count).")
+        parser.add_argument("--k", type=int, default=20, help="Neighbours per query for recall (default: 20).")
+        parser.add_argument("--sample", type=int, default=50, help="Number of query vectors for recall (default: 50).")
+
+    @staticmethod
+    def _ivfflat_index_name(model) -> str:
+        return f"{model._meta.model_name}_embedding_ivfflat"
+
+    def _status(self):
+        tables = [model._meta.db_table for model in TARGET_MODELS.values()]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT tablename, indexname, pg_size_pretty(pg_relation_size(format('%%I', indexname)::regclass))
+                FROM pg_indexes
+                WHERE tablename = ANY(%s) AND (indexdef ILIKE '%%USING hnsw%%' OR indexdef ILIKE '%%USING ivfflat%%')
+                ORDER BY tablename, indexname
+                """,
+                [tables],
+            )
+            rows = cursor.fetchall()
+        ef_search, probes = vector_search_params()
+        self.stdout.write(
+            f"hnsw.ef_search={ef_search} ivfflat.probes={probes} precision={settings.MATCH_VECTOR_PRECISION}"
+        )
+        if not rows:
+            self.stdout.write(self.style.WARNING("No ANN vector indexes found."))
+        for table, index, size in rows:
+            self.stdout.write(f"{table}.{index}: {size}")
+
+    def _create_ivfflat(self, model, lists: int):
+        if lists <= 0:
+            rows = model.objects.exclude(embedding_vector=None).count()
+            lists = max(1, int(math.sqrt(rows)))
+        index_name = self._ivfflat_index_name(model)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {model._meta.db_table} "
+                f"USING ivfflat (embedding_vector vector_cosine_ops) WITH (lists = {int(lists)})"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Created {index_name} with lists={lists}."))
+
+    def _drop_ivfflat(self, model):
+        index_name = self._ivfflat_index_name(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        self.stdout.write(self.style.SUCCESS(f"Dropped {index_name}."))
+
+    def _create_halfvec(self, model):
+        with connection.cursor() as cursor:
+            cursor.execute(halfvec_index_sql(model))
+        self.stdout.write(self.style.SUCCESS(f"Created {halfvec_index_name(model)}."))
+
+    def _drop_halfvec(self, model):
+        index_name = halfvec_index_name(model)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        self.stdout.write(self.style.SUCCESS(f"Dropped {index_name}."))
+
+    @staticmethod
+    def _ranked_ids(model, vector, k: int, half: bool | None = None) -> list[int]:
+        queryset = model.objects.exclude(embedding_vector=None)
+        if model is Trial:
+            queryset = queryset.filter(status__in=ACTIVE_TRIAL_STATUSES)
+        ranked = queryset.annotate(distance=cosine_distance(model, vector, half)).order_by("distance")
+        return list(ranked.values_list("id", flat=True)[:k])
+
+    def _exact_ranked_ids(self, model, vector, k: int, half: bool | None = None) -> list[int]:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_indexscan = off")
+            return self._ranked_ids(model, vector, k, half)
+
+    @staticmethod
+    def _query_vectors(model, sample: int) -> list:
+        # Trials are searched with patient vectors (the matching path) and vice versa.
+        query_model = PatientProfile if model is Trial else Trial
+        queries = list(
+            query_model.objects.exclude(embedding_vector=None)
+            .order_by("?")
+            .values_list("embedding_vector", flat=True)[:sample]
+        )
+        if not queries:
+            raise CommandError(f"No {query_model._meta.verbose_name_plural} with embeddings to query with.")
+        return queries
+
+    def _recall(self, model, k: int, sample: int):
+        queries = self._query_vectors(model, sample)
+
+        recalls: list[float] = []
+        exact_seconds = 0.0
+        ann_seconds = 0.0
+        for vector in queries:
+            started = time.perf_counter()
+            exact_ids = self._exact_ranked_ids(model, vector, k)
+            exact_seconds += time.perf_counter() - started
+
+            configure_vector_search()
+            started = time.perf_counter()
+            ann_ids = self._ranked_ids(model, vector, k)
+            ann_seconds += time.perf_counter() - started
+
+            if exact_ids:
+                recalls.append(len(set(exact_ids) & set(ann_ids)) / len(exact_ids))
+
+        count = len(queries)
+        ef_search, probes = vector_search_params()
+        mean_recall = sum(recalls) / len(recalls) if recalls else 0.0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{model._meta.db_table}: recall@{k}={mean_recall:.4f} over {count} queries "
+                f"(ef_search={ef_search}, probes={probes}); "
+                f"exact avg {exact_seconds / count * 1000:.2f} ms, ann avg {ann_seconds / count * 1000:.2f} ms"
+            )
+        )
+
+    @staticmethod
+    def _index_bytes(model) -> dict[str, int]:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT indexname, pg_relation_size(format('%%I', indexname)::regclass)
+                FROM pg_indexes
+                WHERE tablename = %s AND indexdef ILIKE '%%USING hnsw%%'
+                """,
+                [model._meta.db_table],
+            )
+            return dict(cursor.fetchall())
+
+    def _benchmark(self, model, k: int, sample: int):
+        """
+        Recall@K (against exact float32 search) and latency of float32 and
+        halfvec HNSW search, plus what each precision costs in index and
+        vector storage.
+        """
+        queries = self._query_vectors(model, sample)
+        configure_vector_search()
+        index_bytes = self._index_bytes(model)
+        halfvec_index = halfvec_index_name(model)
+        if halfvec_index not in index_bytes:
+            self.stdout.write(
+                self.style.WARNING(f"{halfvec_index} is missing; halfvec timings are exact scans (run create-halfvec).")
+            )
+
+        latencies: dict[str, list[float]] = {"full": [], "half": []}
+        recalls: dict[str, list[float]] = {"full": [], "half": []}
+        for vector in queries:
+            exact_ids = self._exact_ranked_ids(model, vector, k, half=False)
+            for precision in ("full", "half"):
+                started = time.perf_counter()
+                ann_ids = self._ranked_ids(model, vector, k, half=precision == "half")
+                latencies[precision].append(time.perf_counter() - started)
+                if exact_ids:
+                    recalls[precision].append(len(set(exact_ids) & set(ann_ids)) / len(exact_ids))
+
+        rows = model.objects.exclude(embedding_vector=None).count()
+        dimensions = model._meta.get_field("embedding_vector").dimensions
+        float_index = sum(size for name, size in index_bytes.items() if name != halfvec_index)
+        self.stdout.write(f"{model._meta.db_table}: {rows} vectors, {len(queries)} queries, k={k}")
+        for precision, element_bytes, index_size in (
+            ("full", 4, float_index),
+            ("half", 2, index_bytes.get(halfvec_index, 0)),
+        ):
+            timings = sorted(latencies[precision])
+            mean_recall = sum(recalls[precision]) / len(recalls[precision]) if recalls[precision] else 0.0
+            self.stdout.write(
+                f"  {precision}: recall@{k}={mean_recall:.4f} "
+                f"avg {sum(timings) / len(timings) * 1000:.2f} ms, "
+                f"p95 {timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000:.2f} ms, "
+                f"hnsw index {index_size / 1024 / 1024:.1f} MiB, "
+                f"vectors {rows * (element_bytes * dimensions + 8) / 1024 / 1024:.1f} MiB"
+            )
+
+    def handle(self, *args, **options):
+        action = options["action"]
+        model = TARGET_MODELS[options["target"]]
+
+        if action == "status":
+            self._status()
+        elif action == "create-ivfflat":
+            self._create_ivfflat(model, int(options["lists"]))
+        elif action == "drop-ivfflat":
+            self._drop_ivfflat(model)
+        elif action == "create-halfvec":
+            self._create_halfvec(model)
+        elif action == "drop-halfvec":
+            self._drop_halfvec(model)
+        elif action == "benchmark":
+            self._benchmark(model, max(1, int(options["k"])), max(1, int(options["sample"])))
+        else:
+            self._recall(model, max(1, int(options["k"])), max(1, int(options["sample"])))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchevaluation',
+            name='patient_fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='matchevaluation',
+            name='trial_fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0002_matchevaluation_fingerprints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExplanationCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('provider', models.CharField(max_length=32)),
+                ('model', models.CharField(max_length=255)),
+                ('prompt_version', models.CharField(max_length=32)),
+                ('response', models.JSONField(default=dict)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(db_index=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0003_explanationcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchevaluation',
+            name='explanation_state',
+            field=models.CharField(choices=[('pending', 'Pending'), ('complete', 'Complete'), ('fallback', 'Fallback')], default='complete', max_length=16),
+        ),
+    ]
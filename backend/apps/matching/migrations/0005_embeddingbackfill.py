@@ -0,0 +1,31 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matching', '0004_matchevaluation_explanation_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmbeddingBackfill',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('target', models.CharField(max_length=32)),
+                ('version', models.CharField(max_length=64)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('embedded', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('swapped', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
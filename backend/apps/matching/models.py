@@ -24,6 +24,27 @@ class OutreachStatus(models.TextChoices):
     NO_RESPONSE = "no_response", "No Response"
 
 
+class ExplanationState(models.TextChoices):
+    PENDING = "pending", "Pending"
+    COMPLETE = "complete", "Complete"
+    FALLBACK = "fallback", "Fallback"
+
+
+class EmbeddingBackfill(TimeStampedModel):
+    """Checkpoint of a reembed run: rows up to last_id have a shadow vector for `version`."""
+
+    target = models.CharField(max_length=32)
+    version = models.CharField(max_length=64)
+    last_id = models.BigIntegerField(default=0)
+    embedded = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    swapped = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return f"{self.target}:{self.version}"
+
+
 class MatchingRun(TimeStampedModel):
     run_type = models.CharField(max_length=32, default="scheduled")
     status = models.CharField(max_length=32, default="running")
@@ -64,6 +85,11 @@ class MatchEvaluation(TimeStampedModel):
     explanation_summary = models.TextField(blank=True)
     explanation_language = models.CharField(max_length=16, default="en")
     explanation_model = models.CharField(max_length=255, blank=True)
+    explanation_state = models.CharField(
+        max_length=16,
+        choices=ExplanationState.choices,
+        default=ExplanationState.COMPLETE,
+    )
     prompt_version = models.CharField(max_length=32, default="v1")
     confidence = models.FloatField(default=0.0)
 
@@ -72,9 +98,26 @@ class MatchEvaluation(TimeStampedModel):
 
     last_evaluated = models.DateTimeField(auto_now=True)
     is_new = models.BooleanField(default=True)
+    patient_fingerprint = models.CharField(max_length=64, blank=True)
+    trial_fingerprint = models.CharField(max_length=64, blank=True)
 
     class Meta:
         unique_together = ("patient", "trial")
 
     def __str__(self) -> str:
         return f"{self.patient.patient_code} -> {self.trial.trial_id}"
+
+
+class ExplanationCacheEntry(TimeStampedModel):
+    """LLM explanation keyed by a hash of the prompt, provider, model and prompt version."""
+
+    key = models.CharField(max_length=64, unique=True)
+    provider = models.CharField(max_length=32)
+    model = models.CharField(max_length=255)
+    prompt_version = models.CharField(max_length=32)
+    response = models.JSONField(default=dict)
+    hit_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.provider}:{self.key[:12]}"
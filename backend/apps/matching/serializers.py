@@ -28,6 +28,7 @@ class MatchEvaluationSerializer(serializers.ModelSerializer):
             "explanation_summary",
             "explanation_language",
             "explanation_model",
+            "explanation_state",
             "prompt_version",
             "confidence",
             "outreach_status",
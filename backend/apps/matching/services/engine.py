@@ -1,25 +1,42 @@
 from __future__ import annotations
 
+import json
 import re
+import time
+from itertools import islice
 from dataclasses import dataclass
-from typing import Any, Dict, List, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Set, Tuple
 
+import numpy as np
 from django.conf import settings
 from django.db import connection
-from django.db.models import QuerySet
+from django.db.models import F, QuerySet
 from django.utils import timezone
-from pgvector.django import CosineDistance
 
-from apps.matching.models import MatchEvaluation, MatchOverallStatus, MatchingRun, UrgencyFlag
-from apps.matching.services.explanation import generate_explanation
+from apps.core.services.embedding import compatible_embedding_versions, current_embedding_version
+from apps.core.services.embedding_cache import prune_embedding_cache
+from apps.matching.models import ExplanationState, MatchEvaluation, MatchOverallStatus, MatchingRun, UrgencyFlag
+from apps.matching.services.explanation import deferred_explanation, generate_explanations
+from apps.matching.services.explanation_cache import prune_explanation_cache
+from apps.matching.services.features import (
+    STOP_WORDS,
+    TOKEN_PATTERN,
+    TrialFeatures,
+    _tokenize,
+    get_trial_features,
+    prime_trial_feature_cache,
+    refresh_trial_features,
+)
+from apps.matching.services.fingerprints import patient_match_fingerprint
+from apps.matching.services.persistence import MatchWriteBatch
+from apps.matching.services.progress import RunProgressChannel
+from apps.matching.services.retrieval import cosine_distance, hydrate_trials, nearest_trial_ids
+from apps.matching.services.sites import SiteIndex, build_site_index, get_site_index, normalize_place
 from apps.patients.models import PatientProfile
-from apps.patients.services.profile import generate_patient_embedding
+from apps.patients.services.profile import embed_patients, patient_embedding_payload
+from apps.patients.services.story_cache import prune_story_parse_cache
 from apps.trials.models import Trial
 
-TOKEN_PATTERN = re.compile(r"[a-z0-9\+\-]{3,}")
-AGE_RANGE_PATTERN = re.compile(r"(\d{1,3})\s*(?:-|to)\s*(\d{1,3})\s*(?:years|year|yrs|yr|yo|y/o)")
-MIN_AGE_PATTERN = re.compile(r"(?:minimum age|min age)\s*[:\-]?\s*(\d{1,3})")
-MAX_AGE_PATTERN = re.compile(r"(?:maximum age|max age)\s*[:\-]?\s*(\d{1,3})")
 REPEATED_CHAR_PATTERN = re.compile(r"(.)\1{5,}")
 MEDICAL_SIGNAL_PATTERN = re.compile(
     r"\b(cancer|tumou?r|metasta\w+|stage|ecog|her2|brca|chemo\w*|radiation|biopsy|diagnos\w+|treatment|"
@@ -28,36 +45,19 @@ MEDICAL_SIGNAL_PATTERN = re.compile(
     re.IGNORECASE,
 )
 
-STOP_WORDS = {
-    "with",
-    "from",
-    "have",
-    "been",
-    "that",
-    "this",
-    "were",
-    "which",
-    "will",
-    "patient",
-    "patients",
-    "trial",
-    "study",
-    "disease",
-    "cancer",
-    "treatment",
-    "prior",
-    "after",
-    "before",
-    "under",
-    "over",
-    "into",
-    "and",
-    "the",
-    "for",
-    "are",
-}
-
 MATCHING_RUN_LOCK_KEY = 8432671934
+ACTIVE_TRIAL_STATUSES = ["RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING"]
+EMBEDDING_RUN_COUNTERS = ("embedding_cache_hits", "embedding_cache_misses", "embedding_requests")
+DOCTOR_CHECKLIST = (
+    "Order CBC with differential",
+    "Order hepatic and renal function panel",
+    "Confirm ECOG performance status",
+    "Review inclusion/exclusion criteria with treating oncologist",
+)
+VECTOR_SIMILARITY_WEIGHT = 0.85
+LEXICAL_SIMILARITY_WEIGHT = 0.15
+# Stored as the similarity floor for patients without clinical context so no trial change reaches them.
+UNREACHABLE_SIMILARITY_FLOOR = 2.0
 
 
 class MatchingRunAlreadyRunningError(RuntimeError):
@@ -90,6 +90,9 @@ def reconcile_stale_running_runs() -> list[int]:
     stopped_ids: list[int] = []
     for run in MatchingRun.objects.filter(id__in=running_ids, status="running"):
         metadata = run.metadata if isinstance(run.metadata, dict) else {}
+        if metadata.get("mode") == "sharded" and (now - run.started_at).total_seconds() < _max_run_seconds():
+            # Shard tasks may still be queued behind other work; give them until the run deadline.
+            continue
         run.status = "stopped"
         run.finished_at = now
         run.metadata = {**metadata, "stopped_reason": "stale_without_lock", "stopped_at": now.isoformat()}
@@ -108,12 +111,6 @@ def _clamp(value: float, low: float, high: float) -> float:
     return max(low, min(high, value))
 
 
-def _tokenize(text: str) -> Set[str]:
-    if not text:
-        return set()
-    return {t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS}
-
-
 def _jaccard(a: Set[str], b: Set[str]) -> float:
     if not a or not b:
         return 0.0
@@ -142,24 +139,9 @@ def _normalized_weights(weights: Dict[str, float] | None) -> Dict[str, float]:
     return {k: v / total for k, v in merged.items()}
 
 
-def _trial_text(trial: Trial) -> str:
-    return " ".join(
-        [
-            trial.title or "",
-            trial.summary or "",
-            trial.eligibility_summary or "",
-            trial.inclusion_text or "",
-            trial.exclusion_text or "",
-            " ".join(trial.conditions or []),
-            " ".join(trial.interventions or []),
-        ]
-    ).lower()
-
-
 def _condition_overlap_score(patient: PatientProfile, trial: Trial) -> float:
     patient_tokens = _tokenize(f"{patient.diagnosis} {patient.story} {patient.stage}")
-    trial_tokens = _tokenize(" ".join(trial.conditions or []))
-    return _jaccard(patient_tokens, trial_tokens)
+    return _jaccard(patient_tokens, set(get_trial_features(trial).condition_tokens))
 
 
 def _extract_markers(patient: PatientProfile) -> Set[str]:
@@ -180,65 +162,73 @@ def _marker_overlap_score(patient: PatientProfile, trial: Trial) -> Tuple[float,
     markers = _extract_markers(patient)
     if not markers:
         return 0.0, []
-    text = _trial_text(trial)
+    text = get_trial_features(trial).search_text
     matched = [m for m in markers if m in text]
     return len(matched) / max(1, len(markers)), matched
 
 
-def _extract_age_limits(text: str) -> Tuple[int | None, int | None]:
-    min_age: int | None = None
-    max_age: int | None = None
-
-    range_match = AGE_RANGE_PATTERN.search(text)
-    if range_match:
-        min_age = int(range_match.group(1))
-        max_age = int(range_match.group(2))
-
-    min_match = MIN_AGE_PATTERN.search(text)
-    if min_match:
-        parsed = int(min_match.group(1))
-        min_age = parsed if min_age is None else max(min_age, parsed)
-
-    max_match = MAX_AGE_PATTERN.search(text)
-    if max_match:
-        parsed = int(max_match.group(1))
-        max_age = parsed if max_age is None else min(max_age, parsed)
-
-    return min_age, max_age
-
-
-def _sex_constraint(text: str, sex: str) -> Tuple[bool | None, str]:
-    lowered = text.lower()
+def _sex_constraint(features: TrialFeatures, sex: str) -> Tuple[bool | None, str]:
     patient_sex = (sex or "").lower()
 
-    female_only = "female" in lowered or "women" in lowered
-    male_only = "male only" in lowered or "men only" in lowered
-
-    if female_only and patient_sex and patient_sex != "female":
+    if features.female_only and patient_sex and patient_sex != "female":
         return False, "Trial appears restricted to female participants"
-    if male_only and patient_sex and patient_sex != "male":
+    if features.male_only and patient_sex and patient_sex != "male":
         return False, "Trial appears restricted to male participants"
-    if female_only or male_only:
+    if features.female_only or features.male_only:
         return True, "Patient sex aligns with trial sex requirements"
     return None, ""
 
 
 def _location_feasibility(patient: PatientProfile, trial: Trial) -> Tuple[float, str]:
+    site_index = get_site_index()
+    if site_index is not None and site_index.covers(trial):
+        return _indexed_location_feasibility(site_index, patient, trial)
+
+    features = get_trial_features(trial)
     patient_city = (patient.city or "").lower()
     patient_country = (patient.country or "").lower()
 
-    for site in trial.sites.all():
-        if patient_city and patient_city in (site.city or "").lower() and patient_country in (site.country or "").lower():
+    for site_city, site_country in features.site_locations:
+        if patient_city and patient_city in site_city and patient_country in site_country:
             return 1.0, "Patient city and country align with a recruiting site"
 
-    for site in trial.sites.all():
-        if patient_country and patient_country in (site.country or "").lower():
+    for site_country in features.site_countries:
+        if patient_country and patient_country in site_country:
             return 0.8, "Patient country aligns with a recruiting site"
 
-    if patient_country and any(patient_country in c.lower() for c in trial.countries or []):
+    if patient_country and any(patient_country in c for c in features.countries):
         return 0.7, "Patient country aligns with trial country availability"
 
-    if not trial.sites.exists():
+    if not features.has_sites:
+        return 0.6, "Trial site data is limited; coordinator should confirm logistics"
+
+    return 0.45, "Travel feasibility requires coordinator confirmation"
+
+
+def _indexed_location_feasibility(site_index: SiteIndex, patient: PatientProfile, trial: Trial) -> Tuple[float, str]:
+    patient_city = normalize_place(patient.city)
+    patient_country = normalize_place(patient.country)
+
+    if site_index.has_site_in_city(trial.id, patient_country, patient_city):
+        return 1.0, "Patient city and country align with a recruiting site"
+
+    near_km = float(settings.MATCH_SITE_NEAR_KM)
+    region_km = max(near_km, float(settings.MATCH_SITE_REGION_KM))
+    distance_km = site_index.nearest_site_km(trial.id, patient_country, patient_city, region_km)
+    if distance_km is not None and distance_km <= near_km:
+        return 0.9, f"Recruiting site about {round(distance_km)} km from the patient's city"
+
+    if site_index.has_site_in_country(trial.id, patient_country):
+        return 0.8, "Patient country aligns with a recruiting site"
+
+    if distance_km is not None:
+        return 0.75, f"Nearest recruiting site is about {round(distance_km)} km from the patient's city"
+
+    features = get_trial_features(trial)
+    if patient_country and any(patient_country in normalize_place(c) for c in features.countries):
+        return 0.7, "Patient country aligns with trial country availability"
+
+    if trial.id not in site_index.trials_with_sites:
         return 0.6, "Trial site data is limited; coordinator should confirm logistics"
 
     return 0.45, "Travel feasibility requires coordinator confirmation"
@@ -293,7 +283,7 @@ def _evaluate_rules(patient: PatientProfile, trial: Trial, similarity: float) ->
     missing_info: List[str] = []
     doctor_checklist: List[str] = []
 
-    trial_text = _trial_text(trial)
+    features = get_trial_features(trial)
     condition_overlap = _condition_overlap_score(patient, trial)
     marker_overlap, matched_markers = _marker_overlap_score(patient, trial)
 
@@ -307,7 +297,7 @@ def _evaluate_rules(patient: PatientProfile, trial: Trial, similarity: float) ->
     else:
         missing_info.append("Biomarker alignment unclear from provided records")
 
-    min_age, max_age = _extract_age_limits(trial_text)
+    min_age, max_age = features.min_age, features.max_age
     age_penalty = 0
     if min_age is not None and patient.age < min_age:
         reasons_failed.append(f"Patient age {patient.age} is below trial minimum age {min_age}")
@@ -320,7 +310,7 @@ def _evaluate_rules(patient: PatientProfile, trial: Trial, similarity: float) ->
     else:
         missing_info.append("Age criteria could not be extracted from trial eligibility text")
 
-    sex_ok, sex_reason = _sex_constraint(trial_text, patient.sex)
+    sex_ok, sex_reason = _sex_constraint(features, patient.sex)
     if sex_ok is False:
         reasons_failed.append(sex_reason)
     elif sex_ok is True and sex_reason:
@@ -345,14 +335,7 @@ def _evaluate_rules(patient: PatientProfile, trial: Trial, similarity: float) ->
     if "bilirubin" not in story and "cbc" not in story and "creatinine" not in story:
         missing_info.append("Recent labs are missing (CBC/LFTs/renal)")
 
-    doctor_checklist.extend(
-        [
-            "Order CBC with differential",
-            "Order hepatic and renal function panel",
-            "Confirm ECOG performance status",
-            "Review inclusion/exclusion criteria with treating oncologist",
-        ]
-    )
+    doctor_checklist.extend(DOCTOR_CHECKLIST)
 
     eligibility = 32 + int(condition_overlap * 34) + int(marker_overlap * 18) + int(similarity * 16)
     if trial.status not in {"RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING"}:
@@ -435,39 +418,250 @@ def _passes_relevance_gate(rule_result: Dict[str, object], similarity: float) ->
     return True
 
 
-def _candidate_trials(patient: PatientProfile) -> List[Candidate]:
-    allowed_statuses = ["RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING"]
-    queryset: QuerySet[Trial] = Trial.objects.filter(status__in=allowed_statuses).prefetch_related("sites")
+def _rank_candidates(patient: PatientProfile, ranked: List[Tuple[Trial, float]]) -> List[Candidate]:
+    combined = []
+    for trial, distance in ranked:
+        vector_similarity = _clamp(1.0 - distance, 0.0, 1.0)
+        lexical_similarity = _condition_overlap_score(patient, trial)
+        similarity = _clamp(
+            (vector_similarity * VECTOR_SIMILARITY_WEIGHT) + (lexical_similarity * LEXICAL_SIMILARITY_WEIGHT),
+            0.0,
+            1.0,
+        )
+        combined.append(Candidate(trial=trial, similarity=similarity))
+    combined.sort(key=lambda c: c.similarity, reverse=True)
+    return combined[: settings.MATCH_TOP_K]
 
-    if patient.embedding_vector is not None:
-        try:
-            ranked = (
-                queryset.exclude(embedding_vector=None)
-                .annotate(distance=CosineDistance("embedding_vector", patient.embedding_vector))
-                .order_by("distance")[: settings.MATCH_TOP_K * 2]
-            )
-            combined = []
-            for trial in ranked:
-                vector_similarity = _clamp(1.0 - float(trial.distance), 0.0, 1.0)
-                lexical_similarity = _condition_overlap_score(patient, trial)
-                similarity = _clamp((vector_similarity * 0.85) + (lexical_similarity * 0.15), 0.0, 1.0)
-                combined.append(Candidate(trial=trial, similarity=similarity))
-
-            if combined:
-                combined.sort(key=lambda c: c.similarity, reverse=True)
-                return combined[: settings.MATCH_TOP_K]
-        except Exception:
-            pass
 
-    fallback = queryset[: settings.MATCH_TOP_K * 2]
+def _fallback_candidates(patient: PatientProfile, trials: List[Trial]) -> List[Candidate]:
     candidates = []
-    for trial in fallback:
+    for trial in trials:
         lexical_similarity = _condition_overlap_score(patient, trial)
         candidates.append(Candidate(trial=trial, similarity=_clamp(0.45 + lexical_similarity * 0.45, 0.0, 1.0)))
     candidates.sort(key=lambda c: c.similarity, reverse=True)
     return candidates[: settings.MATCH_TOP_K]
 
 
+def _candidate_trials_for_patients(patients: List[PatientProfile]) -> Dict[int, List[Candidate]]:
+    """
+    Retrieve candidates for many patients with one vector query per embedding
+    version, so a patient is only compared with trials embedded by the same
+    model. Unstamped legacy vectors are grouped with the current version.
+    Trial rows and their sites are loaded once and shared between patients'
+    candidates.
+    """
+    ranked_ids: Dict[int, List[Tuple[int, float]]] = {}
+    vectors_by_version: Dict[str, Dict[int, Any]] = {}
+    current_version = current_embedding_version()
+    for patient in patients:
+        if patient.embedding_vector is not None:
+            version = patient.embedding_version or current_version
+            vectors_by_version.setdefault(version, {})[patient.id] = patient.embedding_vector
+    for version, vectors in vectors_by_version.items():
+        try:
+            ranked_ids.update(
+                nearest_trial_ids(vectors, ACTIVE_TRIAL_STATUSES, settings.MATCH_TOP_K * 2, version=version)
+            )
+        except Exception:
+            continue
+
+    trials = hydrate_trials(trial_id for ranked in ranked_ids.values() for trial_id, _ in ranked)
+    fallback_trials: List[Trial] | None = None
+    candidates: Dict[int, List[Candidate]] = {}
+    for patient in patients:
+        ranked = [
+            (trials[trial_id], distance) for trial_id, distance in ranked_ids.get(patient.id, []) if trial_id in trials
+        ]
+        if ranked:
+            candidates[patient.id] = _rank_candidates(patient, ranked)
+            continue
+        if fallback_trials is None:
+            fallback_trials = list(
+                Trial.objects.filter(status__in=ACTIVE_TRIAL_STATUSES).prefetch_related("sites")[
+                    : settings.MATCH_TOP_K * 2
+                ]
+            )
+        candidates[patient.id] = _fallback_candidates(patient, fallback_trials)
+    return candidates
+
+
+def _candidate_trials(patient: PatientProfile) -> List[Candidate]:
+    return _candidate_trials_for_patients([patient])[patient.id]
+
+
+def _evaluate_rules_batch(patient: PatientProfile, candidates: List[Candidate]) -> List[Dict[str, object] | None]:
+    """
+    Columnar equivalent of _evaluate_rules followed by _passes_relevance_gate
+    for one patient's candidates. Patient-side inputs are derived once, scores
+    and the gate are computed as arrays, and the full result (with reason
+    strings) is only built for candidates that pass; the others are None.
+    """
+    if not candidates:
+        return []
+
+    patient_tokens = _tokenize(f"{patient.diagnosis} {patient.story} {patient.stage}")
+    markers = _extract_markers(patient)
+    patient_sex = (patient.sex or "").lower()
+    story = (patient.story or "").lower()
+    ecog_missing = "ecog" not in story
+    labs_missing = "bilirubin" not in story and "cbc" not in story and "creatinine" not in story
+    urgency_score, urgency_flag = _derive_urgency(patient)
+    weights = _normalized_weights(
+        patient.organization.score_weights if patient.organization and patient.organization.score_weights else None
+    )
+
+    features = [get_trial_features(candidate.trial) for candidate in candidates]
+    matched_markers = [[m for m in markers if m in f.search_text] for f in features]
+    locations = [_location_feasibility(patient, candidate.trial) for candidate in candidates]
+
+    similarity = np.array([candidate.similarity for candidate in candidates], dtype=np.float64)
+    condition = np.array([_jaccard(patient_tokens, f.condition_tokens) for f in features], dtype=np.float64)
+    marker_count = np.array([len(matched) for matched in matched_markers])
+    marker = marker_count / max(1, len(markers)) if markers else np.zeros(len(candidates))
+    location = np.array([score for score, _ in locations], dtype=np.float64)
+    travel_flag = np.array(["Travel feasibility" in reason for _, reason in locations]) & (location < 0.8)
+    active = np.array([candidate.trial.status in ACTIVE_TRIAL_STATUSES for candidate in candidates])
+
+    has_min = np.array([f.min_age is not None for f in features])
+    has_max = np.array([f.max_age is not None for f in features])
+    min_age = np.array([f.min_age if f.min_age is not None else 0 for f in features])
+    max_age = np.array([f.max_age if f.max_age is not None else 0 for f in features])
+    below_age = has_min & (patient.age < min_age)
+    above_age = ~below_age & has_max & (patient.age > max_age)
+    age_failed = below_age | above_age
+    age_unknown = ~has_min & ~has_max
+
+    female_only = np.array([f.female_only for f in features])
+    male_only = np.array([f.male_only for f in features])
+    female_failed = female_only & bool(patient_sex and patient_sex != "female")
+    male_failed = ~female_failed & male_only & bool(patient_sex and patient_sex != "male")
+    sex_unknown = ~female_only & ~male_only
+
+    condition_failed = condition < 0.08
+    failed_count = condition_failed.astype(int) + age_failed + (female_failed | male_failed) + ~active
+    missing_count = (
+        (marker_count == 0).astype(int) + age_unknown + sex_unknown + (location < 0.8) + ecog_missing + labs_missing
+    )
+
+    eligibility = (
+        32
+        + np.trunc(condition * 34)
+        + np.trunc(marker * 18)
+        + np.trunc(similarity * 16)
+        - 25 * ~active
+        - 35 * age_failed
+        - 7 * failed_count
+    )
+    eligibility_scores = np.clip(eligibility, 0, 100).astype(int)
+    feasibility = 40 + np.trunc(location * 45) + int(min(15, patient.profile_completeness / 10)) - 6 * travel_flag
+    feasibility_scores = np.clip(feasibility, 0, 100).astype(int)
+    explainability_scores = np.clip(96 - missing_count * 10 - failed_count * 8, 30, 99).astype(int)
+    weighted = (
+        eligibility_scores * weights["eligibility"]
+        + feasibility_scores * weights["feasibility"]
+        + urgency_score * weights["urgency"]
+        + explainability_scores * weights["explainability"]
+    )
+    eligible = (weighted >= 78) & (failed_count == 0)
+    possibly_eligible = ~eligible & (weighted >= 55)
+
+    min_eligibility = max(0, int(getattr(settings, "MATCH_MIN_ELIGIBILITY_SCORE", 35)))
+    min_condition_overlap = max(0.0, float(getattr(settings, "MATCH_MIN_CONDITION_OVERLAP", 0.06)))
+    min_vector_similarity = max(0.0, float(getattr(settings, "MATCH_MIN_VECTOR_SIMILARITY", 0.62)))
+    # The scalar gate reads the rounded overlaps stored on the rule result.
+    condition_rounded = np.array([round(float(value), 4) for value in condition])
+    marker_rounded = np.array([round(float(value), 4) for value in marker])
+    passes = (
+        (eligibility_scores >= min_eligibility)
+        & (eligible | possibly_eligible)
+        & ~(
+            (condition_rounded < min_condition_overlap) & (marker_rounded <= 0.0) & (similarity < min_vector_similarity)
+        )
+        & ~((condition_rounded <= 0.0) & (marker_rounded <= 0.0) & condition_failed)
+    )
+
+    results: List[Dict[str, object] | None] = []
+    for index, candidate in enumerate(candidates):
+        if not passes[index]:
+            results.append(None)
+            continue
+
+        reasons_matched: List[str] = []
+        reasons_failed: List[str] = []
+        missing_info: List[str] = []
+        if condition_failed[index]:
+            reasons_failed.append("Diagnosis alignment with trial conditions is weak")
+        else:
+            reasons_matched.append("Diagnosis profile overlaps with trial condition focus")
+        if matched_markers[index]:
+            reasons_matched.append(f"Biomarker alignment noted ({', '.join(matched_markers[index][:3])})")
+        else:
+            missing_info.append("Biomarker alignment unclear from provided records")
+
+        trial_features = features[index]
+        if below_age[index]:
+            reasons_failed.append(f"Patient age {patient.age} is below trial minimum age {trial_features.min_age}")
+        elif above_age[index]:
+            reasons_failed.append(f"Patient age {patient.age} is above trial maximum age {trial_features.max_age}")
+        elif not age_unknown[index]:
+            reasons_matched.append("Patient age falls within trial age window")
+        else:
+            missing_info.append("Age criteria could not be extracted from trial eligibility text")
+
+        if female_failed[index]:
+            reasons_failed.append("Trial appears restricted to female participants")
+        elif male_failed[index]:
+            reasons_failed.append("Trial appears restricted to male participants")
+        elif not sex_unknown[index]:
+            reasons_matched.append("Patient sex aligns with trial sex requirements")
+        else:
+            missing_info.append("Sex-specific eligibility constraints are not explicit")
+
+        if active[index]:
+            reasons_matched.append(f"Trial status is {candidate.trial.status}")
+        else:
+            reasons_failed.append("Trial is not currently available for matching")
+
+        location_score, location_reason = locations[index]
+        if location_score >= 0.8:
+            reasons_matched.append(location_reason)
+        else:
+            missing_info.append(location_reason)
+        if ecog_missing:
+            missing_info.append("ECOG/performance status missing")
+        if labs_missing:
+            missing_info.append("Recent labs are missing (CBC/LFTs/renal)")
+
+        weighted_score = float(weighted[index])
+        if eligible[index]:
+            overall_status = MatchOverallStatus.ELIGIBLE
+        elif possibly_eligible[index]:
+            overall_status = MatchOverallStatus.POSSIBLY_ELIGIBLE
+        else:
+            overall_status = MatchOverallStatus.UNLIKELY
+        confidence = 0.34 + (weighted_score / 100.0) * 0.44 + (candidate.similarity * 0.14) - (len(missing_info) * 0.02)
+
+        results.append(
+            {
+                "eligibility_score": int(eligibility_scores[index]),
+                "feasibility_score": int(feasibility_scores[index]),
+                "urgency_score": urgency_score,
+                "urgency_flag": urgency_flag,
+                "explainability_score": int(explainability_scores[index]),
+                "weighted_score": round(weighted_score, 2),
+                "overall_status": overall_status,
+                "condition_overlap": float(condition_rounded[index]),
+                "marker_overlap": float(marker_rounded[index]),
+                "reasons_matched": reasons_matched,
+                "reasons_failed": reasons_failed,
+                "missing_info": missing_info,
+                "doctor_checklist": list(DOCTOR_CHECKLIST),
+                "confidence": round(_clamp(confidence, 0.2, 0.97), 2),
+            }
+        )
+    return results
+
+
 def _build_patient_payload(patient: PatientProfile) -> Dict[str, object]:
     return {
         "patient_code": patient.patient_code,
@@ -495,101 +689,558 @@ def _build_trial_payload(trial: Trial) -> Dict[str, object]:
         "inclusion_text": trial.inclusion_text,
         "exclusion_text": trial.exclusion_text,
         "sites": [{"facility": s.facility, "city": s.city, "country": s.country} for s in trial.sites.all()],
+        # Criteria lines extracted at ingestion are preferred over the free text when prompts are compacted.
+        **{
+            key: trial.eligibility_json[key]
+            for key in ("inclusion_criteria", "exclusion_criteria")
+            if isinstance(trial.eligibility_json, dict) and isinstance(trial.eligibility_json.get(key), list)
+        },
     }
 
 
 def ensure_patient_embedding(patient: PatientProfile) -> None:
-    if patient.embedding_vector is not None:
+    ensure_patient_embeddings([patient])
+
+
+def ensure_patient_embeddings(patients: Sequence[PatientProfile], stats: Dict[str, int] | None = None) -> None:
+    """Embed every patient still missing a vector, batching the embedding requests."""
+    missing = [patient for patient in patients if patient.embedding_vector is None]
+    if not missing:
         return
-    vector = generate_patient_embedding(
-        {
-            "name": patient.full_name,
-            "age": patient.age,
-            "sex": patient.sex,
-            "city": patient.city,
-            "country": patient.country,
-            "story": patient.story,
-        },
-        patient.structured_profile,
+    embeddings = embed_patients(
+        [(patient_embedding_payload(patient), patient.structured_profile) for patient in missing],
+        stats=stats,
     )
-    patient.embedding_vector = vector
-    patient.save(update_fields=["embedding_vector", "updated_at"])
+    now = timezone.now()
+    for patient, embedding in zip(missing, embeddings):
+        patient.embedding_vector, patient.embedding_version = embedding
+        patient.updated_at = now
+    PatientProfile.objects.bulk_update(missing, ["embedding_vector", "embedding_version", "updated_at"])
+
+
+def _consume_llm_budget(llm_state: dict[str, Any]) -> bool:
+    """
+    Reserve one LLM call from the run budget. Sharded runs set
+    `shared_run_id` so every shard draws from the counter on the parent run.
+    """
+    budget = max(0, int(llm_state.get("budget", 0)))
+    shared_run_id = llm_state.get("shared_run_id")
+    if shared_run_id:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {MatchingRun._meta.db_table}
+                SET metadata = jsonb_set(
+                    metadata,
+                    '{{llm_calls_used}}',
+                    to_jsonb(COALESCE((metadata->>'llm_calls_used')::int, 0) + 1)
+                )
+                WHERE id = %s AND COALESCE((metadata->>'llm_calls_used')::int, 0) < %s
+                RETURNING id
+                """,
+                [shared_run_id, budget],
+            )
+            acquired = cursor.fetchone() is not None
+        if acquired:
+            llm_state["used"] = int(llm_state.get("used", 0)) + 1
+        return acquired
+
+    used = int(llm_state.get("used", 0))
+    if used >= budget:
+        return False
+    llm_state["used"] = used + 1
+    return True
+
+
+def _release_llm_budget(llm_state: dict[str, Any]) -> None:
+    """Return a reservation from _consume_llm_budget whose provider request was never sent."""
+    shared_run_id = llm_state.get("shared_run_id")
+    if shared_run_id:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE {MatchingRun._meta.db_table}
+                SET metadata = jsonb_set(
+                    metadata,
+                    '{{llm_calls_used}}',
+                    to_jsonb(GREATEST(COALESCE((metadata->>'llm_calls_used')::int, 0) - 1, 0))
+                )
+                WHERE id = %s
+                """,
+                [shared_run_id],
+            )
+    llm_state["used"] = max(0, int(llm_state.get("used", 0)) - 1)
+
+
+def _build_match_evaluation(
+    patient: PatientProfile,
+    candidate: Candidate,
+    rule_result: Dict[str, Any],
+    explanation: Dict[str, Any],
+    run: MatchingRun | None,
+    explanation_state: str,
+) -> MatchEvaluation:
+    return MatchEvaluation(
+        patient=patient,
+        trial=candidate.trial,
+        organization=patient.organization,
+        matching_run=run,
+        eligibility_score=rule_result["eligibility_score"],
+        feasibility_score=rule_result["feasibility_score"],
+        urgency_score=rule_result["urgency_score"],
+        explainability_score=rule_result["explainability_score"],
+        urgency_flag=rule_result["urgency_flag"],
+        overall_status=explanation.get("overall_status", rule_result["overall_status"]),
+        reasons_matched=explanation.get("reasons_matched", rule_result["reasons_matched"]),
+        reasons_failed=explanation.get("reasons_failed", rule_result["reasons_failed"]),
+        missing_info=explanation.get("missing_info", rule_result["missing_info"]),
+        doctor_checklist=explanation.get("doctor_checklist", rule_result["doctor_checklist"]),
+        explanation_summary=explanation.get("plain_language_summary", ""),
+        explanation_language=patient.language[:2].lower() if patient.language else "en",
+        explanation_model=explanation.get("model", "deterministic-fallback"),
+        explanation_state=explanation_state,
+        prompt_version=settings.LLM_PROMPT_VERSION,
+        confidence=float(explanation.get("confidence", rule_result["confidence"])),
+        vector_similarity=candidate.similarity,
+        patient_fingerprint=patient.match_fingerprint,
+        trial_fingerprint=candidate.trial.match_fingerprint,
+    )
+
+
+def _record_explanation_stats(llm_state: dict[str, Any], explanation: Dict[str, Any]) -> None:
+    cache_status = explanation.get("cache_status")
+    if cache_status == "hit":
+        llm_state["cache_hits"] = int(llm_state.get("cache_hits", 0)) + 1
+    elif cache_status == "miss":
+        llm_state["cache_misses"] = int(llm_state.get("cache_misses", 0)) + 1
+    if explanation.get("hedge"):
+        llm_state["hedged"] = int(llm_state.get("hedged", 0)) + 1
+    prompt_tokens = explanation.get("prompt_tokens")
+    if prompt_tokens:
+        for size in ("original", "compacted"):
+            key = f"prompt_tokens_{size}"
+            llm_state[key] = int(llm_state.get(key, 0)) + int(prompt_tokens.get(size, 0))
+
+
+def _explanation_state(explanation: Dict[str, Any]) -> str:
+    if explanation.get("model", "deterministic-fallback") == "deterministic-fallback":
+        return ExplanationState.FALLBACK
+    return ExplanationState.COMPLETE
+
+
+def explanations_deferred() -> bool:
+    return settings.MATCH_EXPLANATION_MODE == "deferred"
+
+
+def enqueue_match_explanations(jobs: List[Dict[str, Any]], run_id: int | None = None) -> int:
+    """
+    Queue deferred explanation jobs on MATCH_EXPLANATION_QUEUE in tasks of
+    MATCH_EXPLANATION_TASK_BATCH matches. Returns the number of tasks sent.
+    """
+    # Imported here because the task module imports this one.
+    from apps.matching.tasks import explain_matches_task
+
+    batch_size = max(1, int(settings.MATCH_EXPLANATION_TASK_BATCH))
+    sent = 0
+    for start in range(0, len(jobs), batch_size):
+        explain_matches_task.apply_async(
+            args=[jobs[start : start + batch_size], run_id],
+            queue=settings.MATCH_EXPLANATION_QUEUE,
+        )
+        sent += 1
+    return sent
+
+
+# (patient, patient_payload, candidate, rule_result) for a retained match awaiting its inline explanation.
+PendingMatch = Tuple[PatientProfile, Dict[str, Any], Candidate, Dict[str, Any]]
+
+
+def _add_explained_matches(
+    pending: List[PendingMatch],
+    batch: MatchWriteBatch,
+    run: MatchingRun | None,
+    llm_state: dict[str, Any] | None,
+) -> None:
+    """
+    Explain `pending` matches with one generate_explanations call, so the
+    provider requests for every patient in it run concurrently, and queue the
+    matches on `batch`.
+    """
+    explanations = generate_explanations(
+        [
+            (patient_payload, _build_trial_payload(candidate.trial), rule_result)
+            for _, patient_payload, candidate, rule_result in pending
+        ],
+        reserve_llm_call=(lambda: _consume_llm_budget(llm_state)) if llm_state is not None else None,
+        release_llm_call=(lambda: _release_llm_budget(llm_state)) if llm_state is not None else None,
+    )
+    for (patient, _, candidate, rule_result), explanation in zip(pending, explanations):
+        if llm_state is not None:
+            _record_explanation_stats(llm_state, explanation)
+        batch.add(
+            _build_match_evaluation(patient, candidate, rule_result, explanation, run, _explanation_state(explanation))
+        )
 
 
 def evaluate_patient_against_trials(
     patient: PatientProfile,
     run: MatchingRun | None = None,
     llm_state: dict[str, Any] | None = None,
+    write_batch: MatchWriteBatch | None = None,
+    candidates: List[Candidate] | None = None,
+    pending_matches: List[PendingMatch] | None = None,
 ) -> int:
+    """
+    Score a patient against its candidate trials and queue the retained
+    matches on `write_batch`. Without a batch the matches are written before
+    returning; with one, the caller decides when to flush. `candidates` may be
+    passed in when they were retrieved for a batch of patients up front.
+
+    With MATCH_EXPLANATION_MODE=deferred, matches are written with the
+    deterministic explanation and explanation_state=pending, and the LLM
+    explanation is queued once the write commits (see explain_deferred_matches).
+    A caller-supplied batch must then have been created with an `on_commit`
+    that enqueues the jobs.
+
+    In inline mode, passing `pending_matches` (with a `write_batch`) collects
+    the retained matches there instead of explaining them, so the caller can
+    explain a whole chunk of patients at once with _add_explained_matches.
+    """
+    deferred = explanations_deferred()
+    if write_batch is not None:
+        batch = write_batch
+    elif deferred:
+        batch = MatchWriteBatch(on_commit=enqueue_match_explanations)
+    else:
+        batch = MatchWriteBatch()
+    patient.match_fingerprint = patient_match_fingerprint(patient)
+
     if not _has_meaningful_clinical_context(patient):
-        MatchEvaluation.objects.filter(patient=patient).delete()
+        batch.clear_patient(patient.id, patient.match_fingerprint, UNREACHABLE_SIMILARITY_FLOOR)
+        if write_batch is None:
+            batch.flush()
         return 0
 
-    ensure_patient_embedding(patient)
-    candidates = _candidate_trials(patient)[: settings.MATCH_EVALUATE_TOP_N]
+    if candidates is None:
+        ensure_patient_embedding(patient)
+        candidates = _candidate_trials(patient)
+    candidates = candidates[: settings.MATCH_EVALUATE_TOP_N]
+
+    # Any trial scoring above the weakest evaluated candidate could change this
+    # patient's matches; with fewer candidates than the cut, any trial could.
+    similarity_floor = 0.0
+    if candidates and len(candidates) >= settings.MATCH_EVALUATE_TOP_N:
+        similarity_floor = min(candidate.similarity for candidate in candidates)
 
     updates = 0
-    retained_trial_ids: set[int] = set()
-    for candidate in candidates:
-        trial = candidate.trial
-        rule_result = _evaluate_rules(patient, trial, candidate.similarity)
-        if not _passes_relevance_gate(rule_result, candidate.similarity):
+    batch.track_patient(patient.id, patient.match_fingerprint, similarity_floor)
+    retained = [
+        (candidate, rule_result)
+        for candidate, rule_result in zip(candidates, _evaluate_rules_batch(patient, candidates))
+        if rule_result is not None
+    ]
+
+    if deferred:
+        for candidate, rule_result in retained:
+            match = _build_match_evaluation(
+                patient, candidate, rule_result, deferred_explanation(rule_result), run, ExplanationState.PENDING
+            )
+            batch.add(
+                match,
+                deferred_explanation={
+                    "patient_id": patient.id,
+                    "trial_id": candidate.trial.id,
+                    "patient_fingerprint": patient.match_fingerprint,
+                    "trial_fingerprint": candidate.trial.match_fingerprint,
+                    "rule_result": rule_result,
+                },
+            )
+            updates += 1
+    else:
+        patient_payload = _build_patient_payload(patient)
+        matches = [(patient, patient_payload, candidate, rule_result) for candidate, rule_result in retained]
+        if pending_matches is not None:
+            pending_matches.extend(matches)
+        else:
+            _add_explained_matches(matches, batch, run, llm_state)
+        updates += len(matches)
+
+    if write_batch is None:
+        batch.flush()
+        if llm_state is not None and batch.queued_explanations:
+            llm_state["explanations_queued"] = int(llm_state.get("explanations_queued", 0)) + batch.queued_explanations
+    return updates
+
+
+def explain_deferred_matches(jobs: List[Dict[str, Any]], run_id: int | None = None) -> Dict[str, int]:
+    """
+    Generate LLM explanations for matches written with explanation_state=pending
+    and fill them in. Jobs whose match was deleted, already explained, or
+    re-evaluated from different patient or trial inputs are skipped. LLM calls
+    for a run draw from the shared budget counter on that run.
+    """
+    result = {"explained": 0, "skipped": 0}
+    if not jobs:
+        return result
+
+    pending_rows = {
+        (row.patient_id, row.trial_id): row
+        for row in MatchEvaluation.objects.filter(
+            patient_id__in={job["patient_id"] for job in jobs},
+            trial_id__in={job["trial_id"] for job in jobs},
+            explanation_state=ExplanationState.PENDING,
+        ).only("id", "patient_id", "trial_id", "patient_fingerprint", "trial_fingerprint")
+    }
+    patients = PatientProfile.objects.in_bulk({job["patient_id"] for job in jobs})
+    trials = Trial.objects.prefetch_related("sites").in_bulk({job["trial_id"] for job in jobs})
+
+    current: List[Tuple[Dict[str, Any], MatchEvaluation]] = []
+    for job in jobs:
+        row = pending_rows.get((job["patient_id"], job["trial_id"]))
+        if (
+            row is None
+            or job["patient_id"] not in patients
+            or job["trial_id"] not in trials
+            or row.patient_fingerprint != job["patient_fingerprint"]
+            or row.trial_fingerprint != job["trial_fingerprint"]
+        ):
+            result["skipped"] += 1
             continue
+        current.append((job, row))
+    if not current:
+        return result
 
-        retained_trial_ids.add(trial.id)
-        llm_budget_reached = False
+    llm_state: dict[str, Any] | None = None
+    if run_id is not None:
+        llm_state = {
+            "used": 0,
+            "budget": max(0, int(settings.MATCH_LLM_MAX_CALLS_PER_RUN)),
+            "shared_run_id": run_id,
+            "cache_hits": 0,
+            "cache_misses": 0,
+        }
+    patient_payloads = {patient_id: _build_patient_payload(patient) for patient_id, patient in patients.items()}
+    explanations = generate_explanations(
+        [
+            (patient_payloads[job["patient_id"]], _build_trial_payload(trials[job["trial_id"]]), job["rule_result"])
+            for job, _ in current
+        ],
+        reserve_llm_call=(lambda: _consume_llm_budget(llm_state)) if llm_state is not None else None,
+        release_llm_call=(lambda: _release_llm_budget(llm_state)) if llm_state is not None else None,
+    )
+
+    now = timezone.now()
+    for (job, row), explanation in zip(current, explanations):
+        rule_result = job["rule_result"]
         if llm_state is not None:
-            used = int(llm_state.get("used", 0))
-            budget = int(llm_state.get("budget", 0))
-            llm_budget_reached = used >= max(0, budget)
-            if not llm_budget_reached:
-                llm_state["used"] = used + 1
-        explanation = generate_explanation(
-            _build_patient_payload(patient),
-            _build_trial_payload(trial),
-            rule_result,
-            allow_llm=not llm_budget_reached,
+            _record_explanation_stats(llm_state, explanation)
+        # Guarded on the state and fingerprints so a re-evaluation that landed meanwhile is not overwritten.
+        written = MatchEvaluation.objects.filter(
+            id=row.id,
+            explanation_state=ExplanationState.PENDING,
+            patient_fingerprint=job["patient_fingerprint"],
+            trial_fingerprint=job["trial_fingerprint"],
+        ).update(
+            overall_status=explanation.get("overall_status", rule_result["overall_status"]),
+            reasons_matched=explanation.get("reasons_matched", rule_result["reasons_matched"]),
+            reasons_failed=explanation.get("reasons_failed", rule_result["reasons_failed"]),
+            missing_info=explanation.get("missing_info", rule_result["missing_info"]),
+            doctor_checklist=explanation.get("doctor_checklist", rule_result["doctor_checklist"]),
+            explanation_summary=explanation.get("plain_language_summary", ""),
+            explanation_model=explanation.get("model", "deterministic-fallback"),
+            explanation_state=_explanation_state(explanation),
+            confidence=float(explanation.get("confidence", rule_result["confidence"])),
+            updated_at=now,
         )
-
-        existed_before = MatchEvaluation.objects.filter(patient=patient, trial=trial).exists()
-        match, created = MatchEvaluation.objects.update_or_create(
-            patient=patient,
-            trial=trial,
-            defaults={
-                "organization": patient.organization,
-                "matching_run": run,
-                "eligibility_score": rule_result["eligibility_score"],
-                "feasibility_score": rule_result["feasibility_score"],
-                "urgency_score": rule_result["urgency_score"],
-                "explainability_score": rule_result["explainability_score"],
-                "urgency_flag": rule_result["urgency_flag"],
-                "overall_status": explanation.get("overall_status", rule_result["overall_status"]),
-                "reasons_matched": explanation.get("reasons_matched", rule_result["reasons_matched"]),
-                "reasons_failed": explanation.get("reasons_failed", rule_result["reasons_failed"]),
-                "missing_info": explanation.get("missing_info", rule_result["missing_info"]),
-                "doctor_checklist": explanation.get("doctor_checklist", rule_result["doctor_checklist"]),
-                "explanation_summary": explanation.get("plain_language_summary", ""),
-                "explanation_language": patient.language[:2].lower() if patient.language else "en",
-                "explanation_model": explanation.get("model", "deterministic-fallback"),
-                "prompt_version": settings.LLM_PROMPT_VERSION,
-                "confidence": float(explanation.get("confidence", rule_result["confidence"])),
-                "vector_similarity": candidate.similarity,
-                "is_new": not existed_before,
+        result["explained" if written else "skipped"] += 1
+
+    if llm_state is not None:
+        _increment_run_metadata(
+            run_id,
+            {
+                "explanations_completed": result["explained"],
+                "llm_cache_hits": llm_state["cache_hits"],
+                "llm_cache_misses": llm_state["cache_misses"],
+                "llm_prompt_tokens_original": llm_state.get("prompt_tokens_original", 0),
+                "llm_prompt_tokens_compacted": llm_state.get("prompt_tokens_compacted", 0),
+                "llm_hedged_explanations": llm_state.get("hedged", 0),
             },
         )
-        # Keep previous outreach state for existing matches.
-        if not created:
-            match.is_new = False
-            match.save(update_fields=["is_new", "updated_at"])
-        updates += 1
+    return result
 
-    stale_matches = MatchEvaluation.objects.filter(patient=patient).exclude(trial_id__in=retained_trial_ids)
-    stale_matches.filter(outreach_messages__isnull=True).delete()
 
-    return updates
+def _run_metadata(run_id: int) -> Dict[str, Any]:
+    live_metadata = MatchingRun.objects.filter(id=run_id).values_list("metadata", flat=True).first()
+    return live_metadata if isinstance(live_metadata, dict) else {}
+
+
+def _merge_run_metadata(run_id: int, values: Dict[str, Any]) -> None:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {MatchingRun._meta.db_table} SET metadata = metadata || %s::jsonb, updated_at = NOW() "
+            "WHERE id = %s",
+            [json.dumps(values, default=str), run_id],
+        )
+
+
+def _increment_run_metadata(run_id: int, counters: Dict[str, int]) -> None:
+    # Explanation tasks for one run finish concurrently, so counters are added in place.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {MatchingRun._meta.db_table}
+            SET metadata = metadata || (
+                    SELECT jsonb_object_agg(key, COALESCE((metadata->>key)::int, 0) + value::int)
+                    FROM jsonb_each_text(%s::jsonb)
+                ),
+                updated_at = NOW()
+            WHERE id = %s
+            """,
+            [json.dumps(counters), run_id],
+        )
+
+
+def _llm_run_metadata(llm_state: dict[str, Any]) -> Dict[str, Any]:
+    """
+    LLM counters a run reports. In deferred mode the explanation tasks own
+    llm_calls_used and the cache counters on the run, so only the budget and
+    the number of queued explanations are reported here.
+    """
+    if llm_state.get("explanation_mode") == "deferred":
+        return {
+            "explanation_mode": "deferred",
+            "llm_calls_budget": llm_state["budget"],
+            "explanations_queued": int(llm_state.get("explanations_queued", 0)),
+        }
+    return {
+        "llm_calls_used": llm_state["used"],
+        "llm_calls_budget": llm_state["budget"],
+        "llm_cache_hits": llm_state["cache_hits"],
+        "llm_cache_misses": llm_state["cache_misses"],
+        "llm_prompt_tokens_original": int(llm_state.get("prompt_tokens_original", 0)),
+        "llm_prompt_tokens_compacted": int(llm_state.get("prompt_tokens_compacted", 0)),
+        "llm_hedged_explanations": int(llm_state.get("hedged", 0)),
+    }
+
+
+def _embedding_run_metadata(llm_state: dict[str, Any]) -> Dict[str, int]:
+    """Patient embedding counters, reported in both explanation modes."""
+    return {name: int(llm_state.get(name, 0)) for name in EMBEDDING_RUN_COUNTERS}
+
+
+def _elapsed_seconds(started_at) -> int:
+    return int((timezone.now() - started_at).total_seconds())
+
+
+def _max_run_seconds() -> int:
+    return max(1, int(settings.MATCH_MAX_RUN_SECONDS))
+
+
+def _prefetch_candidates(
+    patients: List[PatientProfile], llm_state: dict[str, Any] | None = None
+) -> Dict[int, List[Candidate]]:
+    """
+    Embed and retrieve candidates for the patients that will reach retrieval.
+    Embedding cache counters are added to `llm_state` when given.
+    """
+    eligible = [patient for patient in patients if _has_meaningful_clinical_context(patient)]
+    ensure_patient_embeddings(eligible, stats=llm_state)
+    return _candidate_trials_for_patients(eligible) if eligible else {}
+
+
+def _evaluate_patient_iterable(
+    run: MatchingRun,
+    patients: Iterable[PatientProfile],
+    llm_state: dict[str, Any],
+    started_at,
+    on_progress: Callable[[int, int, int], None],
+) -> tuple[int, int, Dict[str, Any]]:
+    """
+    Evaluate patients in order until done, a stop is requested on `run`, or
+    the run deadline measured from `started_at` passes.
+
+    Returns (updates, processed_patients, stop_info); stop_info is empty when
+    every patient was processed. Candidates are retrieved and matches written
+    in batches of MATCH_WRITE_BATCH_PATIENTS patients.
+
+    Per-patient progress and the stop flag go through the run's Redis channel;
+    `on_progress` is only called every MATCH_PROGRESS_FLUSH_PATIENTS patients
+    or MATCH_PROGRESS_FLUSH_SECONDS seconds, and once more at the end.
+
+    In inline explanation mode the matches of a whole batch are explained
+    together before it is written, so provider requests for different
+    patients run concurrently. In deferred mode each flush queues
+    explanation tasks for the matches it wrote, so explanations start while
+    later patients are scored.
+    """
+    updates = 0
+    processed_patients = 0
+    stop_info: Dict[str, Any] = {}
+    batch_size = max(1, int(settings.MATCH_WRITE_BATCH_PATIENTS))
+    flush_patients = max(1, int(settings.MATCH_PROGRESS_FLUSH_PATIENTS))
+    flush_seconds = max(0.0, float(settings.MATCH_PROGRESS_FLUSH_SECONDS))
+    channel = RunProgressChannel(run.id)
+    if explanations_deferred():
+        write_batch = MatchWriteBatch(on_commit=lambda jobs: enqueue_match_explanations(jobs, run_id=run.id))
+    else:
+        write_batch = MatchWriteBatch()
+    queued_before = int(llm_state.get("explanations_queued", 0))
+    prime_trial_feature_cache(Trial.objects.filter(status__in=ACTIVE_TRIAL_STATUSES))
+    build_site_index(Trial.objects.filter(status__in=ACTIVE_TRIAL_STATUSES).values_list("id", flat=True))
+    unflushed_patients = 0
+    last_flush_at = time.monotonic()
+    elapsed_seconds = 0
+    patient_iterator = iter(patients)
+    while not stop_info:
+        chunk = list(islice(patient_iterator, batch_size))
+        if not chunk:
+            break
+        candidates_by_patient = _prefetch_candidates(chunk, llm_state)
+        pending_matches: List[PendingMatch] = []
+
+        for patient in chunk:
+            if channel.stop_requested():
+                stop_info = {"stopped_reason": "stop_requested"}
+                break
+
+            elapsed_seconds = _elapsed_seconds(started_at)
+            if elapsed_seconds >= _max_run_seconds():
+                stop_info = {
+                    "stopped_reason": "max_run_seconds_exceeded",
+                    "max_run_seconds": int(settings.MATCH_MAX_RUN_SECONDS),
+                    "elapsed_seconds": elapsed_seconds,
+                }
+                break
+
+            patient_updates = evaluate_patient_against_trials(
+                patient,
+                run=run,
+                llm_state=llm_state,
+                write_batch=write_batch,
+                candidates=candidates_by_patient.get(patient.id),
+                pending_matches=pending_matches,
+            )
+            updates += patient_updates
+            processed_patients += 1
+            channel.record(patient_updates)
+            unflushed_patients += 1
+            if unflushed_patients >= flush_patients or time.monotonic() - last_flush_at >= flush_seconds:
+                on_progress(updates, processed_patients, elapsed_seconds)
+                unflushed_patients = 0
+                last_flush_at = time.monotonic()
+
+        if pending_matches:
+            _add_explained_matches(pending_matches, write_batch, run, llm_state)
+        write_batch.flush()
+        if write_batch.queued_explanations:
+            llm_state["explanations_queued"] = queued_before + write_batch.queued_explanations
+
+    if unflushed_patients:
+        on_progress(updates, processed_patients, elapsed_seconds)
+    return updates, processed_patients, stop_info
 
 
-def run_full_matching_cycle(run_type: str = "scheduled") -> MatchingRun:
+def _acquire_exclusive_matching_lock() -> None:
     reconcile_stale_running_runs()
 
     with connection.cursor() as cursor:
@@ -601,77 +1252,142 @@ def run_full_matching_cycle(run_type: str = "scheduled") -> MatchingRun:
         running_run = MatchingRun.objects.filter(status="running").order_by("-started_at").first()
         raise MatchingRunAlreadyRunningError(running_run=running_run)
 
+    # Sharded runs only hold the lock while shard tasks execute, so a parent
+    # whose shards are still queued must also block new runs.
+    queued_sharded_run = (
+        MatchingRun.objects.filter(status="running", metadata__mode="sharded").order_by("-started_at").first()
+    )
+    if queued_sharded_run is not None:
+        _release_exclusive_matching_lock()
+        raise MatchingRunAlreadyRunningError(running_run=queued_sharded_run)
+
+
+def _release_exclusive_matching_lock() -> None:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", [MATCHING_RUN_LOCK_KEY])
+
+
+def select_incremental_patient_ids() -> tuple[List[int] | None, Dict[str, Any]]:
+    """
+    Find patients whose matches could differ from the last completed run:
+    their own inputs changed, they hold a match on a changed trial, or a
+    changed trial could rank within their evaluated candidates. That includes
+    trials that went inactive: dropping one from a patient's candidates lets
+    a lower-ranked trial move into their top N.
+
+    Returns (None, info) when there is no completed run to diff against.
+    """
+    last_completed = MatchingRun.objects.filter(status="completed").order_by("-started_at").first()
+    if last_completed is None:
+        return None, {"mode": "incremental", "incremental_baseline": None}
+
+    # Trials written outside upsert_trial have no fingerprint yet; stamping them now marks them changed.
+    for trial in Trial.objects.filter(match_fingerprint="").prefetch_related("sites"):
+        refresh_trial_features(trial)
+
+    dirty_ids: set[int] = set()
+    patients = PatientProfile.objects.select_related("organization").defer("embedding_vector")
+    for patient in patients.iterator(chunk_size=1000):
+        if patient_match_fingerprint(patient) != patient.match_fingerprint:
+            dirty_ids.add(patient.id)
+    changed_patients = len(dirty_ids)
+
+    changed_trials = list(Trial.objects.filter(fingerprint_updated_at__gte=last_completed.started_at))
+    if changed_trials:
+        dirty_ids.update(MatchEvaluation.objects.filter(trial__in=changed_trials).values_list("patient_id", flat=True))
+
+    reachable = PatientProfile.objects.filter(match_similarity_floor__lt=UNREACHABLE_SIMILARITY_FLOOR)
+    # Combined similarity is at most VECTOR_WEIGHT * vector + LEXICAL_WEIGHT, so a
+    # trial can only beat a patient's floor when its vector distance is below this.
+    max_distance = 1.0 - (F("match_similarity_floor") - LEXICAL_SIMILARITY_WEIGHT) / VECTOR_SIMILARITY_WEIGHT
+    for trial in changed_trials:
+        if trial.embedding_vector is None:
+            dirty_ids.update(reachable.values_list("id", flat=True))
+            break
+        dirty_ids.update(
+            reachable.exclude(embedding_vector=None)
+            .filter(embedding_version__in=compatible_embedding_versions(trial.embedding_version))
+            .annotate(distance=cosine_distance(PatientProfile, trial.embedding_vector))
+            .filter(distance__lte=max_distance)
+            .values_list("id", flat=True)
+        )
+
+    return sorted(dirty_ids), {
+        "mode": "incremental",
+        "incremental_baseline": last_completed.id,
+        "changed_trials": len(changed_trials),
+        "changed_patients": changed_patients,
+    }
+
+
+def run_full_matching_cycle(run_type: str = "scheduled", incremental: bool = False) -> MatchingRun:
+    """
+    Evaluate patients in-process under the exclusive matching lock. Incremental
+    runs only evaluate patients picked by select_incremental_patient_ids.
+    """
+    _acquire_exclusive_matching_lock()
+
     run: MatchingRun | None = None
     try:
         run = MatchingRun.objects.create(run_type=run_type, status="running")
-        total_updates = 0
-        patients = PatientProfile.objects.select_related("organization").all()
+        patients = PatientProfile.objects.select_related("organization").order_by("id")
+        selection_info: Dict[str, Any] = {}
+        if incremental:
+            patient_ids, selection_info = select_incremental_patient_ids()
+            if patient_ids is not None:
+                selection_info["skipped_patients"] = PatientProfile.objects.count() - len(patient_ids)
+                patients = patients.filter(id__in=patient_ids)
         total_patients = patients.count()
-        processed_patients = 0
         started_at = timezone.now()
         llm_state: dict[str, Any] = {
             "used": 0,
             "budget": max(0, int(settings.MATCH_LLM_MAX_CALLS_PER_RUN)),
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "explanation_mode": settings.MATCH_EXPLANATION_MODE,
         }
 
-        for patient in patients:
-            live_metadata = MatchingRun.objects.filter(id=run.id).values_list("metadata", flat=True).first()
-            if isinstance(live_metadata, dict) and live_metadata.get("stop_requested"):
-                run.status = "stopped"
-                run.metadata = {
-                    **live_metadata,
-                    "patients": total_patients,
-                    "updates": total_updates,
-                    "processed_patients": processed_patients,
-                    "stopped_reason": "stop_requested",
-                    "llm_calls_used": llm_state["used"],
-                    "llm_calls_budget": llm_state["budget"],
-                }
-                run.finished_at = timezone.now()
-                run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
-                return run
-
-            elapsed_seconds = int((timezone.now() - started_at).total_seconds())
-            if elapsed_seconds >= max(1, int(settings.MATCH_MAX_RUN_SECONDS)):
-                run.status = "stopped"
-                run.metadata = {
-                    **(live_metadata if isinstance(live_metadata, dict) else {}),
-                    "patients": total_patients,
-                    "updates": total_updates,
-                    "processed_patients": processed_patients,
-                    "stopped_reason": "max_run_seconds_exceeded",
-                    "max_run_seconds": int(settings.MATCH_MAX_RUN_SECONDS),
-                    "elapsed_seconds": elapsed_seconds,
-                    "llm_calls_used": llm_state["used"],
-                    "llm_calls_budget": llm_state["budget"],
-                }
-                run.finished_at = timezone.now()
-                run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
-                return run
-
-            total_updates += evaluate_patient_against_trials(patient, run=run, llm_state=llm_state)
-            processed_patients += 1
+        def save_progress(updates: int, processed_patients: int, elapsed_seconds: int) -> None:
             run.metadata = {
+                **selection_info,
                 "patients": total_patients,
-                "updates": total_updates,
+                "updates": updates,
                 "processed_patients": processed_patients,
                 "elapsed_seconds": elapsed_seconds,
-                "llm_calls_used": llm_state["used"],
-                "llm_calls_budget": llm_state["budget"],
+                **_llm_run_metadata(llm_state),
             }
-            run.save(update_fields=["metadata", "updated_at"])
+            # Merge rather than overwrite so a stop flag written meanwhile survives.
+            _merge_run_metadata(run.id, run.metadata)
 
-        run.status = "completed"
-        run.metadata = {
+        total_updates, processed_patients, stop_info = _evaluate_patient_iterable(
+            run, patients, llm_state, started_at, save_progress
+        )
+
+        summary = {
+            **selection_info,
             "patients": total_patients,
             "updates": total_updates,
             "processed_patients": processed_patients,
-            "elapsed_seconds": int((timezone.now() - started_at).total_seconds()),
-            "llm_calls_used": llm_state["used"],
-            "llm_calls_budget": llm_state["budget"],
+            **_llm_run_metadata(llm_state),
+            **_embedding_run_metadata(llm_state),
         }
+        run.status = "stopped" if stop_info else "completed"
         run.finished_at = timezone.now()
-        run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
+        if stop_info:
+            final_metadata = {**summary, **stop_info}
+        else:
+            final_metadata = {**summary, "elapsed_seconds": _elapsed_seconds(started_at)}
+        if stop_info or llm_state["explanation_mode"] == "deferred":
+            # Merge in place: the stop flag and deferred explanation counters live in the same document.
+            _merge_run_metadata(run.id, final_metadata)
+            run.save(update_fields=["status", "finished_at", "updated_at"])
+            run.metadata = _run_metadata(run.id)
+        else:
+            run.metadata = final_metadata
+            run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
+        prune_explanation_cache()
+        prune_story_parse_cache()
+        prune_embedding_cache()
         return run
     except Exception as exc:
         if run is not None:
@@ -683,6 +1399,224 @@ def run_full_matching_cycle(run_type: str = "scheduled") -> MatchingRun:
             }
             run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
         raise
+    finally:
+        if run is not None:
+            RunProgressChannel(run.id).clear()
+        _release_exclusive_matching_lock()
+
+
+def plan_patient_shards(patient_ids: List[int], shard_size: int) -> List[Tuple[int, int]]:
+    """
+    Split sorted patient ids into inclusive (first_id, last_id) ranges of at
+    most `shard_size` patients each.
+    """
+    size = max(1, int(shard_size))
+    return [
+        (patient_ids[index], patient_ids[min(index + size, len(patient_ids)) - 1])
+        for index in range(0, len(patient_ids), size)
+    ]
+
+
+def create_sharded_matching_run(run_type: str = "scheduled") -> tuple[MatchingRun, List[Tuple[int, int]]]:
+    """
+    Create the parent run for a sharded matching cycle and plan its id-range
+    shards. The caller is responsible for dispatching one shard task per range.
+    """
+    _acquire_exclusive_matching_lock()
+    try:
+        patient_ids = list(PatientProfile.objects.order_by("id").values_list("id", flat=True))
+        shard_size = max(1, int(settings.MATCH_SHARD_SIZE))
+        shards = plan_patient_shards(patient_ids, shard_size)
+        run = MatchingRun.objects.create(
+            run_type=run_type,
+            status="running",
+            metadata={
+                "mode": "sharded",
+                "patients": len(patient_ids),
+                "updates": 0,
+                "processed_patients": 0,
+                "shard_size": shard_size,
+                "shard_count": len(shards),
+                "shards": [[first_id, last_id] for first_id, last_id in shards],
+                "shard_progress": {},
+                "llm_calls_used": 0,
+                "llm_calls_budget": max(0, int(settings.MATCH_LLM_MAX_CALLS_PER_RUN)),
+                "llm_cache_hits": 0,
+                "llm_cache_misses": 0,
+                "explanation_mode": settings.MATCH_EXPLANATION_MODE,
+                "explanations_queued": 0,
+            },
+        )
+        if not shards:
+            run.status = "completed"
+            run.finished_at = timezone.now()
+            run.metadata = {**run.metadata, "elapsed_seconds": 0}
+            run.save(update_fields=["status", "metadata", "finished_at", "updated_at"])
+        return run, shards
+    finally:
+        _release_exclusive_matching_lock()
+
+
+def _record_shard_progress(run_id: int, shard_index: int, progress: Dict[str, Any]) -> None:
+    # Shards write concurrently, so only the shard's own key is replaced in place.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            UPDATE {MatchingRun._meta.db_table}
+            SET metadata = jsonb_set(
+                    metadata || jsonb_build_object('shard_progress', COALESCE(metadata->'shard_progress', '{{}}'::jsonb)),
+                    ARRAY['shard_progress', %s],
+                    %s::jsonb
+                ),
+                updated_at = NOW()
+            WHERE id = %s
+            """,
+            [str(shard_index), json.dumps(progress), run_id],
+        )
+
+
+def run_matching_shard(run_id: int, shard_index: int, first_patient_id: int, last_patient_id: int) -> Dict[str, Any]:
+    """
+    Evaluate one id-range shard of a sharded matching run. Shards hold the
+    matching lock in shared mode so serial runs cannot start underneath them,
+    and draw LLM calls from the parent run's shared budget.
+    """
+    run = MatchingRun.objects.filter(id=run_id).first()
+    result: Dict[str, Any] = {"shard": shard_index, "updates": 0, "processed_patients": 0}
+    if run is None or run.status != "running":
+        return {**result, "skipped": True, "reason": "run_not_running"}
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_lock_shared(%s)", [MATCHING_RUN_LOCK_KEY])
+        lock_row = cursor.fetchone()
+    if not (lock_row and lock_row[0]):
+        return {**result, "skipped": True, "reason": "lock_unavailable"}
+
+    try:
+        patients = (
+            PatientProfile.objects.select_related("organization")
+            .filter(id__gte=first_patient_id, id__lte=last_patient_id)
+            .order_by("id")
+        )
+        llm_state: dict[str, Any] = {
+            "used": 0,
+            "budget": max(0, int(settings.MATCH_LLM_MAX_CALLS_PER_RUN)),
+            "shared_run_id": run.id,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "explanation_mode": run.metadata.get("explanation_mode", "inline"),
+        }
+
+        def shard_llm_counters() -> Dict[str, Any]:
+            if llm_state["explanation_mode"] == "deferred":
+                return {
+                    "explanations_queued": int(llm_state.get("explanations_queued", 0)),
+                    **_embedding_run_metadata(llm_state),
+                }
+            return {
+                **_embedding_run_metadata(llm_state),
+                "llm_cache_hits": llm_state["cache_hits"],
+                "llm_cache_misses": llm_state["cache_misses"],
+                "llm_prompt_tokens_original": int(llm_state.get("prompt_tokens_original", 0)),
+                "llm_prompt_tokens_compacted": int(llm_state.get("prompt_tokens_compacted", 0)),
+                "llm_hedged_explanations": int(llm_state.get("hedged", 0)),
+            }
+
+        def save_progress(updates: int, processed_patients: int, elapsed_seconds: int) -> None:
+            _record_shard_progress(
+                run.id,
+                shard_index,
+                {
+                    "status": "running",
+                    "updates": updates,
+                    "processed_patients": processed_patients,
+                    **shard_llm_counters(),
+                },
+            )
+
+        updates, processed_patients, stop_info = _evaluate_patient_iterable(
+            run, patients, llm_state, run.started_at, save_progress
+        )
+        result = {
+            **result,
+            "updates": updates,
+            "processed_patients": processed_patients,
+            **shard_llm_counters(),
+            **stop_info,
+        }
+        _record_shard_progress(
+            run.id,
+            shard_index,
+            {
+                "status": "stopped" if stop_info else "completed",
+                "updates": updates,
+                "processed_patients": processed_patients,
+                **shard_llm_counters(),
+            },
+        )
+        return result
+    except Exception as exc:
+        _record_shard_progress(run.id, shard_index, {"status": "failed", "error": str(exc)})
+        return {**result, "error": str(exc)}
     finally:
         with connection.cursor() as cursor:
-            cursor.execute("SELECT pg_advisory_unlock(%s)", [MATCHING_RUN_LOCK_KEY])
+            cursor.execute("SELECT pg_advisory_unlock_shared(%s)", [MATCHING_RUN_LOCK_KEY])
+
+
+def finalize_sharded_matching_run(shard_results: List[Dict[str, Any]], run_id: int) -> MatchingRun | None:
+    """
+    Merge per-shard results into the parent run and close it out.
+    """
+    run = MatchingRun.objects.filter(id=run_id).first()
+    if run is None:
+        return None
+
+    results = [item for item in shard_results or [] if isinstance(item, dict)]
+    errors = [{"shard": item.get("shard"), "error": item["error"]} for item in results if item.get("error")]
+    stop_reasons = [str(item["stopped_reason"]) for item in results if item.get("stopped_reason")]
+    skipped = [item.get("shard") for item in results if item.get("skipped")]
+
+    metadata = {
+        "updates": sum(int(item.get("updates", 0) or 0) for item in results),
+        "processed_patients": sum(int(item.get("processed_patients", 0) or 0) for item in results),
+        "elapsed_seconds": _elapsed_seconds(run.started_at),
+    }
+    if run.metadata.get("explanation_mode") == "deferred":
+        # Deferred explanation tasks keep the cache counters on the run themselves.
+        counters = ["explanations_queued", *EMBEDDING_RUN_COUNTERS]
+    else:
+        counters = [
+            "llm_cache_hits",
+            "llm_cache_misses",
+            "llm_prompt_tokens_original",
+            "llm_prompt_tokens_compacted",
+            "llm_hedged_explanations",
+            *EMBEDDING_RUN_COUNTERS,
+        ]
+    for counter in counters:
+        metadata[counter] = sum(int(item.get(counter, 0) or 0) for item in results)
+    if skipped:
+        metadata["skipped_shards"] = skipped
+
+    if run.status == "running":
+        if errors:
+            run.status = "failed"
+            metadata["shard_errors"] = errors
+        elif stop_reasons or skipped:
+            run.status = "stopped"
+            metadata["stopped_reason"] = stop_reasons[0] if stop_reasons else "shards_skipped"
+            if "max_run_seconds_exceeded" in stop_reasons:
+                metadata["max_run_seconds"] = int(settings.MATCH_MAX_RUN_SECONDS)
+        else:
+            run.status = "completed"
+        run.finished_at = timezone.now()
+
+    # Merge in place: explanation tasks may still be updating counters on the run.
+    _merge_run_metadata(run.id, metadata)
+    run.save(update_fields=["status", "finished_at", "updated_at"])
+    run.metadata = _run_metadata(run.id)
+    RunProgressChannel(run.id).clear()
+    prune_explanation_cache()
+    prune_story_parse_cache()
+    prune_embedding_cache()
+    return run
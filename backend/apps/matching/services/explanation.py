@@ -1,9 +1,22 @@
+import asyncio
 import json
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Tuple
 
-import requests
 from django.conf import settings
 
+from apps.core.services.circuit_breaker import provider_breaker
+from apps.core.services.http_client import http_latency_quantile, http_post
+from apps.core.services.rate_limiter import RateLimitedError, require_llm_capacity
+from apps.matching.services.explanation_cache import (
+    explanation_cache_key,
+    get_cached_explanation,
+    store_explanation,
+)
+from apps.matching.services.prompt_compaction import compact_patient_payload, compact_trial_payload, estimate_tokens
+
 
 ELIGIBILITY_PROMPT_TEMPLATE = """
 You are a clinical trial matching explanation engine.
@@ -34,7 +47,41 @@ Rules:
 - Output JSON only.
 """.strip()
 
+BATCH_ELIGIBILITY_PROMPT_TEMPLATE = """
+You are a clinical trial matching explanation engine.
+Explain how one patient matches each of the trials below.
+Return a strict JSON array with exactly one object per input trial, in input order, each with this exact schema:
+{{
+  "trial_id": "string",
+  "plain_language_summary": "string",
+  "reasons_matched": ["string"],
+  "reasons_failed": ["string"],
+  "missing_info": ["string"],
+  "doctor_checklist": ["string"],
+  "overall_status": "Eligible|Possibly Eligible|Unlikely",
+  "confidence": 0.0
+}}
+
+Input patient profile:
+{patient_json}
+
+Input trials, each with its rule evaluation:
+{trials_json}
+
+Rules:
+- Be concise and clinically neutral.
+- Copy each trial_id exactly from the input.
+- Mention unknowns explicitly in missing_info.
+- Do not claim final medical eligibility.
+- Output the JSON array only.
+""".strip()
+
 SUPPORTED_LLM_MODES = {"auto", "hf", "gemini", "fallback"}
+OVERALL_STATUSES = {"Eligible", "Possibly Eligible", "Unlikely"}
+MAX_OUTPUT_TOKENS_PER_EXPLANATION = 800
+# Observed latencies are trusted for the hedge delay once there are this many.
+HEDGE_MIN_LATENCY_SAMPLES = 20
+MIN_HEDGE_DELAY_SECONDS = 1.0
 
 
 def _fallback(rule_result: Dict[str, Any], reason: str) -> Dict[str, Any]:
@@ -54,6 +101,11 @@ def _fallback(rule_result: Dict[str, Any], reason: str) -> Dict[str, Any]:
     }
 
 
+def deferred_explanation(rule_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Deterministic explanation stored with a match while its LLM explanation is queued."""
+    return _fallback(rule_result, reason="explanation_deferred")
+
+
 def _extract_hf_text(payload: Any) -> str:
     if isinstance(payload, dict):
         generated = payload.get("generated_text")
@@ -103,12 +155,17 @@ def _extract_gemini_text(payload: Any) -> str:
     return ""
 
 
-def _extract_json_object(text: str) -> Dict[str, Any]:
+def _strip_code_fence(text: str) -> str:
     cleaned = text.strip()
     if cleaned.startswith("```"):
         cleaned = cleaned.strip("`").strip()
         if cleaned.lower().startswith("json"):
             cleaned = cleaned[4:].strip()
+    return cleaned
+
+
+def _extract_json_object(text: str) -> Dict[str, Any]:
+    cleaned = _strip_code_fence(text)
 
     start = cleaned.find("{")
     end = cleaned.rfind("}")
@@ -121,6 +178,20 @@ def _extract_json_object(text: str) -> Dict[str, Any]:
     return parsed
 
 
+def _extract_json_array(text: str) -> List[Any]:
+    cleaned = _strip_code_fence(text)
+
+    start = cleaned.find("[")
+    end = cleaned.rfind("]")
+    if start == -1 or end == -1 or end < start:
+        raise ValueError("no_json_array")
+
+    parsed = json.loads(cleaned[start : end + 1])
+    if not isinstance(parsed, list):
+        raise ValueError("json_not_array")
+    return parsed
+
+
 def _normalize_response(
     raw: Dict[str, Any],
     rule_result: Dict[str, Any],
@@ -129,8 +200,7 @@ def _normalize_response(
 ) -> Dict[str, Any]:
     return {
         "plain_language_summary": str(
-            raw.get("plain_language_summary")
-            or "Potential match identified. Coordinator review is required."
+            raw.get("plain_language_summary") or "Potential match identified. Coordinator review is required."
         ),
         "reasons_matched": list(raw.get("reasons_matched") or rule_result.get("reasons_matched", [])),
         "reasons_failed": list(raw.get("reasons_failed") or rule_result.get("reasons_failed", [])),
@@ -143,7 +213,46 @@ def _normalize_response(
     }
 
 
-def _build_prompt(
+def _split_batch_response(
+    text: str,
+    trial_ids: List[str],
+    rule_results: List[Dict[str, Any]],
+    model: str,
+    provider: str,
+) -> List[Dict[str, Any] | None]:
+    """
+    Split a batched response into one normalized explanation per trial.
+    Entries are matched by trial_id, or by position when the array has one
+    entry per trial and the entry carries no trial_id. Missing or malformed
+    entries come back as None so only those trials fall back.
+    """
+    parsed = _extract_json_array(text)
+    by_trial_id = {
+        str(entry["trial_id"]): entry for entry in parsed if isinstance(entry, dict) and entry.get("trial_id")
+    }
+    positional = len(parsed) == len(trial_ids)
+
+    explanations: List[Dict[str, Any] | None] = []
+    for position, (trial_id, rule_result) in enumerate(zip(trial_ids, rule_results)):
+        raw = by_trial_id.get(trial_id)
+        if raw is None and positional and isinstance(parsed[position], dict) and not parsed[position].get("trial_id"):
+            raw = parsed[position]
+        if (
+            raw is None
+            or not isinstance(raw.get("plain_language_summary"), str)
+            or not raw["plain_language_summary"].strip()
+            or raw.get("overall_status", "Possibly Eligible") not in OVERALL_STATUSES
+        ):
+            explanations.append(None)
+            continue
+        try:
+            explanations.append(_normalize_response(raw, rule_result, model=model, provider=provider))
+        except (TypeError, ValueError):
+            explanations.append(None)
+    return explanations
+
+
+def _format_prompt(
     patient_payload: Dict[str, Any],
     trial_payload: Dict[str, Any],
     rule_result: Dict[str, Any],
@@ -155,27 +264,85 @@ def _build_prompt(
     )
 
 
-def _generate_with_hf(prompt: str, rule_result: Dict[str, Any]) -> Dict[str, Any]:
-    response = requests.post(
+def _format_batch_prompt(
+    patient_payload: Dict[str, Any],
+    trials: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+) -> str:
+    return BATCH_ELIGIBILITY_PROMPT_TEMPLATE.format(
+        patient_json=json.dumps(patient_payload, ensure_ascii=True),
+        trials_json=json.dumps(
+            [{"trial": trial_payload, "rule_evaluation": rule_result} for trial_payload, rule_result in trials],
+            ensure_ascii=True,
+        ),
+    )
+
+
+def _prompt_tokens(original: str, compacted: str) -> Dict[str, int]:
+    return {"original": estimate_tokens(original), "compacted": estimate_tokens(compacted)}
+
+
+def _build_prompt(
+    patient_payload: Dict[str, Any],
+    trial_payload: Dict[str, Any],
+    rule_result: Dict[str, Any],
+) -> Tuple[str, Dict[str, int]]:
+    """The prompt for one pair, compacted when LLM_PROMPT_COMPACTION is on, and its token estimates."""
+    prompt = _format_prompt(patient_payload, trial_payload, rule_result)
+    if not settings.LLM_PROMPT_COMPACTION:
+        return prompt, _prompt_tokens(prompt, prompt)
+    compacted = _format_prompt(
+        compact_patient_payload(patient_payload), compact_trial_payload(trial_payload), rule_result
+    )
+    return compacted, _prompt_tokens(prompt, compacted)
+
+
+def _build_batch_prompt(
+    patient_payload: Dict[str, Any],
+    trials: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+) -> Tuple[str, Dict[str, int]]:
+    prompt = _format_batch_prompt(patient_payload, trials)
+    if not settings.LLM_PROMPT_COMPACTION:
+        return prompt, _prompt_tokens(prompt, prompt)
+    compacted = _format_batch_prompt(
+        compact_patient_payload(patient_payload),
+        [(compact_trial_payload(trial_payload), rule_result) for trial_payload, rule_result in trials],
+    )
+    return compacted, _prompt_tokens(prompt, compacted)
+
+
+def _request_hf_text(prompt: str, max_new_tokens: int) -> str:
+    require_llm_capacity(
+        "huggingface",
+        settings.HF_LLM_ENDPOINT,
+        estimate_tokens(prompt) + max_new_tokens,
+        max_wait_seconds=float(settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS),
+    )
+    response = provider_breaker("huggingface").call(
+        http_post,
+        "huggingface",
         settings.HF_LLM_ENDPOINT,
         headers={"Authorization": f"Bearer {settings.HF_API_TOKEN}"},
         json={
             "inputs": prompt,
-            "parameters": {"max_new_tokens": 800, "temperature": 0.1},
+            "parameters": {"max_new_tokens": max_new_tokens, "temperature": 0.1},
         },
-        timeout=40,
+        idempotent=True,
     )
-    response.raise_for_status()
-    payload = response.json()
-    text = _extract_hf_text(payload).strip()
-    parsed = _extract_json_object(text)
-    return _normalize_response(parsed, rule_result, model=settings.HF_LLM_ENDPOINT, provider="huggingface")
+    return _extract_hf_text(response.json()).strip()
 
 
-def _generate_with_gemini(prompt: str, rule_result: Dict[str, Any]) -> Dict[str, Any]:
+def _request_gemini_text(prompt: str, max_output_tokens: int) -> str:
     model = settings.GEMINI_MODEL or "gemini-2.0-flash"
     endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-    response = requests.post(
+    require_llm_capacity(
+        "gemini",
+        model,
+        estimate_tokens(prompt) + max_output_tokens,
+        max_wait_seconds=float(settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS),
+    )
+    response = provider_breaker("gemini").call(
+        http_post,
+        "gemini",
         endpoint,
         headers={
             "Content-Type": "application/json",
@@ -185,65 +352,439 @@ def _generate_with_gemini(prompt: str, rule_result: Dict[str, Any]) -> Dict[str,
             "contents": [{"parts": [{"text": prompt}]}],
             "generationConfig": {
                 "temperature": 0.1,
-                "maxOutputTokens": 800,
+                "maxOutputTokens": max_output_tokens,
                 "responseMimeType": "application/json",
             },
         },
-        timeout=40,
+        idempotent=True,
     )
-    response.raise_for_status()
-    payload = response.json()
-    text = _extract_gemini_text(payload).strip()
-    parsed = _extract_json_object(text)
+    return _extract_gemini_text(response.json()).strip()
+
+
+def _generate_with_hf(prompt: str, rule_result: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = _extract_json_object(_request_hf_text(prompt, MAX_OUTPUT_TOKENS_PER_EXPLANATION))
+    return _normalize_response(parsed, rule_result, model=settings.HF_LLM_ENDPOINT, provider="huggingface")
+
+
+def _generate_with_gemini(prompt: str, rule_result: Dict[str, Any]) -> Dict[str, Any]:
+    model = settings.GEMINI_MODEL or "gemini-2.0-flash"
+    parsed = _extract_json_object(_request_gemini_text(prompt, MAX_OUTPUT_TOKENS_PER_EXPLANATION))
     return _normalize_response(parsed, rule_result, model=f"gemini:{model}", provider="gemini")
 
 
+def _generate_batch_with_hf(
+    prompt: str, trial_ids: List[str], rule_results: List[Dict[str, Any]]
+) -> List[Dict[str, Any] | None]:
+    text = _request_hf_text(prompt, MAX_OUTPUT_TOKENS_PER_EXPLANATION * len(trial_ids))
+    return _split_batch_response(text, trial_ids, rule_results, model=settings.HF_LLM_ENDPOINT, provider="huggingface")
+
+
+def _generate_batch_with_gemini(
+    prompt: str, trial_ids: List[str], rule_results: List[Dict[str, Any]]
+) -> List[Dict[str, Any] | None]:
+    model = settings.GEMINI_MODEL or "gemini-2.0-flash"
+    text = _request_gemini_text(prompt, MAX_OUTPUT_TOKENS_PER_EXPLANATION * len(trial_ids))
+    return _split_batch_response(text, trial_ids, rule_results, model=f"gemini:{model}", provider="gemini")
+
+
+@dataclass(frozen=True)
+class _Provider:
+    name: str
+    reason_prefix: str
+    model: str
+
+
+@dataclass
+class _PendingExplanation:
+    index: int
+    prompt: str
+    rule_result: Dict[str, Any]
+    # (provider, cache key, cached response) in the order they are tried.
+    attempts: List[Tuple[_Provider, str, Dict[str, Any] | None]]
+    failure_reason: str
+    patient_payload: Dict[str, Any]
+    trial_payload: Dict[str, Any]
+    prompt_tokens: Dict[str, int]
+
+
+@dataclass
+class _PendingBatch:
+    """Uncached explanations for one patient, sent as a single multi-trial prompt."""
+
+    items: List[_PendingExplanation]
+    prompt: str
+    failure_reason: str
+    prompt_tokens: Dict[str, int]
+
+
+@dataclass
+class _Attempt:
+    """One provider try for a pending request; `start` returns the awaitable response."""
+
+    provider: _Provider
+    start: Callable[[], Awaitable[Any]]
+    cached: bool = False
+    key: str = ""
+
+
+def _provider_plan() -> Tuple[List[_Provider], str]:
+    """
+    Providers to try in order for the configured LLM_MODE, and the fallback
+    reason used when none is available or every attempt fails. Providers
+    whose circuit breaker is open are skipped, so no budget is reserved for
+    requests that would fail fast.
+    """
+    mode = settings.LLM_MODE if settings.LLM_MODE in SUPPORTED_LLM_MODES else "auto"
+    gemini = _Provider("gemini", "gemini", f"gemini:{settings.GEMINI_MODEL or 'gemini-2.0-flash'}")
+    hf = _Provider("huggingface", "hf", settings.HF_LLM_ENDPOINT)
+    hf_ready = bool(settings.HF_LLM_ENDPOINT and settings.HF_API_TOKEN)
+    gemini_ready = bool(settings.GEMINI_API_KEY)
+
+    if mode == "fallback":
+        return [], "llm_mode_fallback"
+    if mode == "gemini":
+        if not gemini_ready:
+            return [], "missing_gemini_config"
+        configured = [gemini]
+    elif mode == "hf":
+        if not hf_ready:
+            return [], "missing_hf_config"
+        configured = [hf]
+    else:
+        # auto mode prefers Gemini when configured, then HF, then deterministic fallback
+        configured = [provider for provider, ready in ((gemini, gemini_ready), (hf, hf_ready)) if ready]
+        if not configured:
+            return [], "no_llm_provider_configured"
+
+    providers = [provider for provider in configured if not provider_breaker(provider.name).is_open()]
+    if not providers:
+        return [], "llm_circuit_open"
+    return providers, f"{providers[-1].reason_prefix}_request_failed"
+
+
+def _call_provider(provider: _Provider, prompt: str, rule_result: Dict[str, Any]) -> Dict[str, Any]:
+    if provider.name == "gemini":
+        return _generate_with_gemini(prompt, rule_result)
+    return _generate_with_hf(prompt, rule_result)
+
+
+def _call_provider_batch(provider: _Provider, batch: _PendingBatch) -> List[Dict[str, Any] | None]:
+    trial_ids = [str(item.trial_payload.get("trial_id", "")) for item in batch.items]
+    rule_results = [item.rule_result for item in batch.items]
+    if provider.name == "gemini":
+        return _generate_batch_with_gemini(batch.prompt, trial_ids, rule_results)
+    return _generate_batch_with_hf(batch.prompt, trial_ids, rule_results)
+
+
 def generate_explanation(
     patient_payload: Dict[str, Any],
     trial_payload: Dict[str, Any],
     rule_result: Dict[str, Any],
     *,
     allow_llm: bool = True,
+    reserve_llm_call: Callable[[], bool] | None = None,
+    release_llm_call: Callable[[], None] | None = None,
 ) -> Dict[str, Any]:
+    """
+    Explain a rule result with the configured LLM provider, falling back to
+    the deterministic explanation. `reserve_llm_call` is invoked only when a
+    provider request is about to be sent (not for cache hits); returning False
+    yields the budget fallback. `release_llm_call` returns the reservation of
+    a request the rate limiter refused, since it was never sent. Results of
+    provider requests carry the prompt's `prompt_tokens` estimates before and
+    after compaction.
+    """
     if not allow_llm:
         return _fallback(rule_result, reason="llm_budget_reached")
 
-    mode = settings.LLM_MODE if settings.LLM_MODE in SUPPORTED_LLM_MODES else "auto"
-    prompt = _build_prompt(patient_payload, trial_payload, rule_result)
-    hf_ready = bool(settings.HF_LLM_ENDPOINT and settings.HF_API_TOKEN)
-    gemini_ready = bool(settings.GEMINI_API_KEY)
-
-    if mode == "fallback":
-        return _fallback(rule_result, reason="llm_mode_fallback")
-
-    if mode == "gemini":
-        if not gemini_ready:
-            return _fallback(rule_result, reason="missing_gemini_config")
+    providers, failure_reason = _provider_plan()
+    if not providers:
+        return _fallback(rule_result, reason=failure_reason)
+
+    prompt, prompt_tokens = _build_prompt(patient_payload, trial_payload, rule_result)
+    requested = False
+    reason = failure_reason
+    for provider in providers:
+        key = explanation_cache_key(prompt, provider.name, provider.model)
+        cached = get_cached_explanation(key)
+        if cached is not None:
+            return {**cached, "cache_status": "hit"}
+        if reserve_llm_call is not None and not reserve_llm_call():
+            return _fallback(rule_result, reason="llm_budget_reached")
+        requested = True
         try:
-            return _generate_with_gemini(prompt, rule_result)
+            result = _call_provider(provider, prompt, rule_result)
+        except RateLimitedError:
+            if release_llm_call is not None:
+                release_llm_call()
+            reason = "llm_rate_limited"
+            continue
         except Exception:
-            return _fallback(rule_result, reason="gemini_request_failed")
+            reason = failure_reason
+            continue
+        store_explanation(key, provider.name, provider.model, result)
+        return {**result, "cache_status": "miss", "prompt_tokens": prompt_tokens}
 
-    if mode == "hf":
-        if not hf_ready:
-            return _fallback(rule_result, reason="missing_hf_config")
-        try:
-            return _generate_with_hf(prompt, rule_result)
-        except Exception:
-            return _fallback(rule_result, reason="hf_request_failed")
+    fallback = _fallback(rule_result, reason=reason)
+    if requested:
+        fallback["prompt_tokens"] = prompt_tokens
+    return fallback
 
-    # auto mode prefers Gemini when configured, then HF, then deterministic fallback
-    if gemini_ready:
-        try:
-            return _generate_with_gemini(prompt, rule_result)
-        except Exception:
-            if not hf_ready:
-                return _fallback(rule_result, reason="gemini_request_failed")
 
-    if hf_ready:
-        try:
-            return _generate_with_hf(prompt, rule_result)
-        except Exception:
-            return _fallback(rule_result, reason="hf_request_failed")
+def generate_explanations(
+    items: Sequence[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]],
+    *,
+    reserve_llm_call: Callable[[], bool] | None = None,
+    release_llm_call: Callable[[], None] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Explain many (patient_payload, trial_payload, rule_result) items, sending
+    every uncached provider request concurrently. Results are returned in
+    input order, one per item; any item that errors, misses
+    LLM_BATCH_TIMEOUT_SECONDS or gets no response gets the deterministic
+    fallback.
+
+    Uncached items for the same patient are packed LLM_PATIENT_BATCH_SIZE at a
+    time into one multi-trial prompt, so the patient is sent once per request.
+    Each request reserves one LLM call, released again if the rate limiter
+    refuses every provider it tries. Every explanation is cached under its
+    single-pair prompt key, whichever prompt produced it, and a trial missing
+    from a batched response falls back on its own. Prompts are compacted
+    (see prompt_compaction) and each provider request reports its
+    `prompt_tokens` estimates once, on the result of its first item.
+
+    Cache lookups, budget reservations and cache writes happen on the calling
+    thread; only provider HTTP requests run in worker threads, at most
+    LLM_<PROVIDER>_MAX_CONCURRENCY at a time per provider.
+    """
+    results: List[Dict[str, Any] | None] = [None] * len(items)
+    providers, failure_reason = _provider_plan()
+    misses_by_patient: Dict[str, List[_PendingExplanation]] = {}
+
+    for index, (patient_payload, trial_payload, rule_result) in enumerate(items):
+        if not providers:
+            results[index] = _fallback(rule_result, reason=failure_reason)
+            continue
+        prompt, prompt_tokens = _build_prompt(patient_payload, trial_payload, rule_result)
+        attempts = []
+        for provider in providers:
+            key = explanation_cache_key(prompt, provider.name, provider.model)
+            attempts.append((provider, key, get_cached_explanation(key)))
+        if attempts[0][2] is not None:
+            results[index] = {**attempts[0][2], "cache_status": "hit"}
+            continue
+        patient_key = json.dumps(patient_payload, sort_keys=True, ensure_ascii=True, default=str)
+        misses_by_patient.setdefault(patient_key, []).append(
+            _PendingExplanation(
+                index, prompt, rule_result, attempts, failure_reason, patient_payload, trial_payload, prompt_tokens
+            )
+        )
+
+    batch_size = max(1, int(settings.LLM_PATIENT_BATCH_SIZE))
+    pending: List[_PendingExplanation | _PendingBatch] = []
+    for misses in misses_by_patient.values():
+        for start in range(0, len(misses), batch_size):
+            chunk = misses[start : start + batch_size]
+            if reserve_llm_call is not None and not reserve_llm_call():
+                for item in chunk:
+                    results[item.index] = _fallback(item.rule_result, reason="llm_budget_reached")
+                continue
+            if len(chunk) == 1:
+                pending.append(chunk[0])
+                continue
+            prompt, prompt_tokens = _build_batch_prompt(
+                chunk[0].patient_payload, [(item.trial_payload, item.rule_result) for item in chunk]
+            )
+            pending.append(_PendingBatch(chunk, prompt, failure_reason, prompt_tokens))
+
+    if pending:
+        outcomes = asyncio.run(
+            _explain_concurrently(pending, reserve_llm_call=reserve_llm_call, release_llm_call=release_llm_call)
+        )
+        for request, outcome in zip(pending, outcomes):
+            for item, item_outcome in _split_outcome(request, outcome):
+                if isinstance(item_outcome, str):
+                    results[item.index] = _fallback(item.rule_result, reason=item_outcome)
+                    continue
+                provider, key, result, cache_status, hedge = item_outcome
+                if cache_status == "miss":
+                    store_explanation(key, provider.name, provider.model, result)
+                results[item.index] = {**result, "cache_status": cache_status}
+                if hedge is not None:
+                    results[item.index]["hedge"] = hedge
+            first_index = request.items[0].index if isinstance(request, _PendingBatch) else request.index
+            results[first_index]["prompt_tokens"] = request.prompt_tokens
+
+    return [
+        result if result is not None else _fallback(rule_result, reason="llm_no_response")
+        for result, (_, _, rule_result) in zip(results, items)
+    ]
+
+
+def _split_outcome(request: _PendingExplanation | _PendingBatch, outcome: Any) -> List[Tuple[_PendingExplanation, Any]]:
+    """Per-item outcomes for a request: (provider, key, response, cache_status, hedge) or a fallback reason."""
+    if isinstance(request, _PendingExplanation):
+        return [(request, outcome)]
+    if isinstance(outcome, str):
+        return [(item, outcome) for item in request.items]
+
+    provider, explanations, hedge = outcome
+    split = []
+    for index, item in enumerate(request.items):
+        explanation = explanations[index] if index < len(explanations) else None
+        if explanation is None:
+            split.append((item, f"{provider.reason_prefix}_batch_item_invalid"))
+            continue
+        key = next(key for attempt_provider, key, _ in item.attempts if attempt_provider == provider)
+        split.append((item, (provider, key, explanation, "miss", hedge)))
+    return split
+
+
+def _hedge_delay(provider: _Provider) -> float:
+    """
+    How long to wait on `provider` before hedging: its observed p90 latency
+    in this process once there are enough samples, else LLM_HEDGE_DELAY_SECONDS.
+    """
+    observed = http_latency_quantile(provider.name, 0.9, min_samples=HEDGE_MIN_LATENCY_SAMPLES)
+    delay = observed if observed is not None else float(settings.LLM_HEDGE_DELAY_SECONDS)
+    return max(MIN_HEDGE_DELAY_SECONDS, delay)
 
-    return _fallback(rule_result, reason="no_llm_provider_configured")
+
+async def _explain_concurrently(
+    pending: List[_PendingExplanation | _PendingBatch],
+    *,
+    reserve_llm_call: Callable[[], bool] | None = None,
+    release_llm_call: Callable[[], None] | None = None,
+) -> List[Any]:
+    """
+    Run pending provider requests under per-provider semaphores and one shared
+    deadline. Each outcome is (provider, key, response, cache_status, hedge)
+    for a single item, (provider, per-trial responses, hedge) for a batch, or
+    a fallback reason string.
+
+    Providers are tried in plan order. With LLM_HEDGING on, a provider that
+    has not answered within its hedge delay is raced against the next one
+    (one more reserved LLM call) and the first valid response wins; the
+    loser is abandoned and `hedge` records both providers and the winner.
+
+    Each request arrives holding one reservation and a hedge reserves its own;
+    reservations left unused because the rate limiter refused the attempt are
+    handed back to `release_llm_call`.
+    """
+    limits = {
+        "gemini": max(1, int(settings.LLM_GEMINI_MAX_CONCURRENCY)),
+        "huggingface": max(1, int(settings.LLM_HF_MAX_CONCURRENCY)),
+    }
+    semaphores = {name: asyncio.Semaphore(limit) for name, limit in limits.items()}
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=sum(limits.values()), thread_name_prefix="llm-explain")
+    hedging = bool(settings.LLM_HEDGING)
+
+    async def call(provider: _Provider, func: Callable[..., Any], *args: Any) -> Any:
+        async with semaphores[provider.name]:
+            return await loop.run_in_executor(executor, func, provider, *args)
+
+    async def cached_response(response: Dict[str, Any]) -> Dict[str, Any]:
+        return response
+
+    async def first_valid(
+        attempts: List[_Attempt], failure_reason: str
+    ) -> Tuple[_Attempt, Any, Dict[str, Any] | None] | str:
+        """Run attempts in plan order, hedging slow ones; (attempt, response, hedge) of the first success."""
+        reason = failure_reason
+        running: Dict[asyncio.Future, _Attempt] = {}
+        position = 0
+        can_hedge = hedging
+        hedged = False
+        # The request's reservation, until an uncached attempt gets past the rate limiter.
+        unsent = 1
+        try:
+            while running or position < len(attempts):
+                if not running:
+                    running[asyncio.ensure_future(attempts[position].start())] = attempts[position]
+                    if not attempts[position].cached:
+                        unsent -= 1
+                    position += 1
+                timeout = None
+                if can_hedge and position < len(attempts):
+                    timeout = _hedge_delay(next(iter(running.values())).provider)
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # A cached next attempt costs nothing; a real request is one more LLM call.
+                    following = attempts[position]
+                    can_hedge = following.cached or reserve_llm_call is None or reserve_llm_call()
+                    if can_hedge:
+                        running[asyncio.ensure_future(following.start())] = following
+                        position += 1
+                        hedged = True
+                    continue
+                for task in done:
+                    attempt = running.pop(task)
+                    try:
+                        response = task.result()
+                    except RateLimitedError:
+                        unsent += 1
+                        reason = "llm_rate_limited"
+                        continue
+                    except Exception:
+                        reason = failure_reason
+                        continue
+                    hedge = None
+                    if hedged:
+                        hedge = {
+                            "providers": [item.provider.name for item in attempts[:position]],
+                            "winner": attempt.provider.name,
+                        }
+                    return attempt, response, hedge
+            return reason
+        finally:
+            # The losing request is abandoned, not interrupted.
+            for task in running:
+                task.cancel()
+            if release_llm_call is not None:
+                for _ in range(unsent):
+                    release_llm_call()
+
+    async def explain_batch(batch: _PendingBatch) -> Any:
+        attempts = [
+            _Attempt(provider, partial(call, provider, _call_provider_batch, batch))
+            for provider, _, _ in batch.items[0].attempts
+        ]
+        outcome = await first_valid(attempts, batch.failure_reason)
+        if isinstance(outcome, str):
+            return outcome
+        attempt, explanations, hedge = outcome
+        return attempt.provider, explanations, hedge
+
+    async def explain(item: _PendingExplanation | _PendingBatch) -> Any:
+        if isinstance(item, _PendingBatch):
+            return await explain_batch(item)
+        attempts = [
+            _Attempt(provider, partial(cached_response, cached), cached=True, key=key)
+            if cached is not None
+            else _Attempt(provider, partial(call, provider, _call_provider, item.prompt, item.rule_result), key=key)
+            for provider, key, cached in item.attempts
+        ]
+        outcome = await first_valid(attempts, item.failure_reason)
+        if isinstance(outcome, str):
+            return outcome
+        attempt, response, hedge = outcome
+        return attempt.provider, attempt.key, response, "hit" if attempt.cached else "miss", hedge
+
+    tasks = [asyncio.ensure_future(explain(item)) for item in pending]
+    try:
+        done, not_done = await asyncio.wait(tasks, timeout=max(1.0, float(settings.LLM_BATCH_TIMEOUT_SECONDS)))
+        for task in not_done:
+            task.cancel()
+        outcomes: List[Any] = []
+        for task, item in zip(tasks, pending):
+            if task not in done:
+                outcomes.append("llm_batch_timeout")
+            elif task.exception() is not None:
+                outcomes.append(item.failure_reason)
+            else:
+                outcomes.append(task.result())
+        return outcomes
+    finally:
+        # Requests already on the wire finish on their own timeout; nothing waits for them.
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict
+
+from django.conf import settings
+
+from apps.core.services.cache_table import CacheTable
+from apps.matching.models import ExplanationCacheEntry
+
+_table = CacheTable(
+    ExplanationCacheEntry, "LLM_EXPLANATION_CACHE_MAX_ENTRIES", ttl_setting="LLM_EXPLANATION_CACHE_TTL_SECONDS"
+)
+
+
+def explanation_cache_enabled() -> bool:
+    return int(settings.LLM_EXPLANATION_CACHE_TTL_SECONDS) > 0
+
+
+def explanation_cache_key(prompt: str, provider: str, model: str) -> str:
+    encoded = json.dumps([prompt, provider, model, settings.LLM_PROMPT_VERSION], ensure_ascii=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_cached_explanation(key: str) -> Dict[str, Any] | None:
+    """Return a stored explanation that is still within its TTL and mark it recently used."""
+    if not explanation_cache_enabled():
+        return None
+    response = _table.get(key, "response")
+    return dict(response) if response is not None else None
+
+
+def store_explanation(key: str, provider: str, model: str, response: Dict[str, Any]) -> None:
+    if not explanation_cache_enabled():
+        return
+    _table.store_many(
+        {
+            key: {
+                "provider": provider,
+                "model": model,
+                "prompt_version": settings.LLM_PROMPT_VERSION,
+                "response": response,
+            }
+        }
+    )
+
+
+def prune_explanation_cache() -> int:
+    """
+    Delete entries past their TTL, then the least recently used entries above
+    LLM_EXPLANATION_CACHE_MAX_ENTRIES. Returns the number of rows deleted.
+    """
+    return _table.prune()
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, Set, Tuple
+
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from apps.matching.services.fingerprints import trial_match_fingerprint
+from apps.trials.models import Trial
+
+TRIAL_FEATURES_VERSION = 2
+TRIAL_FEATURE_FIELDS = ["rule_features", "match_fingerprint", "fingerprint_updated_at", "updated_at"]
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9\+\-]{3,}")
+AGE_RANGE_PATTERN = re.compile(r"(\d{1,3})\s*(?:-|to)\s*(\d{1,3})\s*(?:years|year|yrs|yr|yo|y/o)")
+MIN_AGE_PATTERN = re.compile(r"(?:minimum age|min age)\s*[:\-]?\s*(\d{1,3})")
+MAX_AGE_PATTERN = re.compile(r"(?:maximum age|max age)\s*[:\-]?\s*(\d{1,3})")
+
+STOP_WORDS = {
+    "with",
+    "from",
+    "have",
+    "been",
+    "that",
+    "this",
+    "were",
+    "which",
+    "will",
+    "patient",
+    "patients",
+    "trial",
+    "study",
+    "disease",
+    "cancer",
+    "treatment",
+    "prior",
+    "after",
+    "before",
+    "under",
+    "over",
+    "into",
+    "and",
+    "the",
+    "for",
+    "are",
+}
+
+
+def _tokenize(text: str) -> Set[str]:
+    if not text:
+        return set()
+    return {t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOP_WORDS}
+
+
+def _trial_text(trial: Trial) -> str:
+    return " ".join(
+        [
+            trial.title or "",
+            trial.summary or "",
+            trial.eligibility_summary or "",
+            trial.inclusion_text or "",
+            trial.exclusion_text or "",
+            " ".join(trial.conditions or []),
+            " ".join(trial.interventions or []),
+        ]
+    ).lower()
+
+
+def _site_rows(trial: Trial) -> list[Tuple[str, str, str]]:
+    if trial.pk is None:
+        return []
+    return sorted((site.facility or "", site.city or "", site.country or "") for site in trial.sites.all())
+
+
+def trial_features_source_hash(trial: Trial) -> str:
+    """
+    Hash of the trial fields and sites features are derived from. It is
+    computed when features are (re)computed and stored with them, and only
+    recomputed to validate persisted features the first time a trial version
+    is seen in a process.
+    """
+    countries = [c for c in trial.countries or [] if isinstance(c, str)]
+    encoded = json.dumps([_trial_text(trial), countries, _site_rows(trial)], ensure_ascii=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def _extract_age_limits(text: str) -> Tuple[int | None, int | None]:
+    min_age: int | None = None
+    max_age: int | None = None
+
+    range_match = AGE_RANGE_PATTERN.search(text)
+    if range_match:
+        min_age = int(range_match.group(1))
+        max_age = int(range_match.group(2))
+
+    min_match = MIN_AGE_PATTERN.search(text)
+    if min_match:
+        parsed = int(min_match.group(1))
+        min_age = parsed if min_age is None else max(min_age, parsed)
+
+    max_match = MAX_AGE_PATTERN.search(text)
+    if max_match:
+        parsed = int(max_match.group(1))
+        max_age = parsed if max_age is None else min(max_age, parsed)
+
+    return min_age, max_age
+
+
+@dataclass(frozen=True)
+class TrialFeatures:
+    """
+    Everything the rule engine needs from a trial that does not depend on the
+    patient. Site strings are lowercased so pair evaluation never normalizes.
+    """
+
+    min_age: int | None
+    max_age: int | None
+    female_only: bool
+    male_only: bool
+    condition_tokens: frozenset[str]
+    search_text: str
+    site_locations: Tuple[Tuple[str, str], ...]
+    site_countries: frozenset[str]
+    countries: Tuple[str, ...]
+    source_hash: str = ""
+
+    @property
+    def has_sites(self) -> bool:
+        return bool(self.site_locations)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "version": TRIAL_FEATURES_VERSION,
+            "min_age": self.min_age,
+            "max_age": self.max_age,
+            "female_only": self.female_only,
+            "male_only": self.male_only,
+            "condition_tokens": sorted(self.condition_tokens),
+            "search_text": self.search_text,
+            "site_locations": [list(pair) for pair in self.site_locations],
+            "site_countries": sorted(self.site_countries),
+            "countries": list(self.countries),
+            "source_hash": self.source_hash,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Any, source_hash: str | None = None) -> "TrialFeatures | None":
+        """Persisted features, or None when missing, from another version or (given `source_hash`) stale."""
+        if not isinstance(data, dict) or data.get("version") != TRIAL_FEATURES_VERSION:
+            return None
+        if source_hash is not None and data.get("source_hash") != source_hash:
+            return None
+        try:
+            return cls(
+                min_age=data["min_age"],
+                max_age=data["max_age"],
+                female_only=bool(data["female_only"]),
+                male_only=bool(data["male_only"]),
+                condition_tokens=frozenset(data["condition_tokens"]),
+                search_text=str(data["search_text"]),
+                site_locations=tuple((str(city), str(country)) for city, country in data["site_locations"]),
+                site_countries=frozenset(data["site_countries"]),
+                countries=tuple(data["countries"]),
+                source_hash=str(data.get("source_hash", "")),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+def compute_trial_features(trial: Trial) -> TrialFeatures:
+    text = _trial_text(trial)
+    min_age, max_age = _extract_age_limits(text)
+    site_locations: list[Tuple[str, str]] = []
+    for site in trial.sites.all():
+        pair = ((site.city or "").lower(), (site.country or "").lower())
+        if pair not in site_locations:
+            site_locations.append(pair)
+
+    return TrialFeatures(
+        min_age=min_age,
+        max_age=max_age,
+        female_only="female" in text or "women" in text,
+        male_only="male only" in text or "men only" in text,
+        condition_tokens=frozenset(_tokenize(" ".join(trial.conditions or []))),
+        search_text=text,
+        site_locations=tuple(site_locations),
+        site_countries=frozenset(country for _, country in site_locations),
+        countries=tuple(c.lower() for c in trial.countries or [] if isinstance(c, str)),
+        source_hash=trial_features_source_hash(trial),
+    )
+
+
+def apply_trial_features(trial: Trial) -> TrialFeatures:
+    """
+    Recompute features and the match fingerprint on the instance without
+    saving. fingerprint_updated_at only moves when the fingerprint changes,
+    which is what incremental runs use to find changed trials.
+    """
+    features = compute_trial_features(trial)
+    trial.rule_features = features.to_dict()
+    fingerprint = trial_match_fingerprint(trial, trial.rule_features)
+    if fingerprint != trial.match_fingerprint:
+        trial.match_fingerprint = fingerprint
+        trial.fingerprint_updated_at = timezone.now()
+    return features
+
+
+def refresh_trial_features(trial: Trial) -> TrialFeatures:
+    """
+    Recompute and persist features. Call after any change to a trial's text
+    fields, countries or sites.
+    """
+    features = apply_trial_features(trial)
+    trial.save(update_fields=TRIAL_FEATURE_FIELDS)
+    _FEATURE_CACHE[trial.id] = (trial.updated_at, features)
+    return features
+
+
+# Keyed by trial id; entries are only reused while the trial's updated_at matches.
+_FEATURE_CACHE: Dict[int, Tuple[Any, TrialFeatures]] = {}
+
+
+def get_trial_features(trial: Trial) -> TrialFeatures:
+    """
+    Features for `trial`: cached for its (id, updated_at), else persisted,
+    else computed. Persisted features are only used when their stored source
+    hash matches the trial's text and sites, so criteria edited without a
+    refresh (admin edits, an interrupted upsert) are recomputed; that check
+    runs once per trial version and process.
+    """
+    cached = _FEATURE_CACHE.get(trial.id)
+    if cached is not None and cached[0] == trial.updated_at:
+        return cached[1]
+
+    features = TrialFeatures.from_dict(trial.rule_features, trial_features_source_hash(trial))
+    if features is None:
+        features = compute_trial_features(trial)
+    if trial.id is not None:
+        _FEATURE_CACHE[trial.id] = (trial.updated_at, features)
+    return features
+
+
+def prime_trial_feature_cache(trials: QuerySet) -> int:
+    """
+    Load features for the `trials` not already cached at their current
+    updated_at, so hydrated candidate trials only hit the cache. Only those
+    trials' rows and sites are read. Returns the number loaded.
+    """
+    stale_ids = [
+        trial_id
+        for trial_id, updated_at in trials.values_list("id", "updated_at")
+        if _FEATURE_CACHE.get(trial_id, (None,))[0] != updated_at
+    ]
+    for trial in Trial.objects.filter(id__in=stale_ids).prefetch_related("sites").iterator(chunk_size=500):
+        get_trial_features(trial)
+    return len(stale_ids)
+
+
+def clear_trial_feature_cache() -> None:
+    _FEATURE_CACHE.clear()
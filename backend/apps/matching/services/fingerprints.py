@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any, Dict
+
+from django.conf import settings
+
+from apps.patients.models import PatientProfile
+from apps.patients.services.profile import patient_embedding_payload, patient_embedding_text
+from apps.trials.models import Trial
+
+# Settings that change which trials a patient is matched to or how matches are scored.
+FINGERPRINT_SETTINGS = (
+    "MATCH_TOP_K",
+    "MATCH_EVALUATE_TOP_N",
+    "MATCH_MIN_ELIGIBILITY_SCORE",
+    "MATCH_MIN_CONDITION_OVERLAP",
+    "MATCH_MIN_VECTOR_SIMILARITY",
+    "LLM_PROMPT_VERSION",
+)
+
+
+def _digest(payload: Dict[str, Any]) -> str:
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=True, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def patient_match_fingerprint(patient: PatientProfile) -> str:
+    """
+    Hash of every patient input that can change retrieval or scoring,
+    including the organization's score weights and the matching settings.
+    """
+    structured = patient.structured_profile if isinstance(patient.structured_profile, dict) else {}
+    organization = patient.organization
+    return _digest(
+        {
+            "embedding_text": patient_embedding_text(patient_embedding_payload(patient), structured),
+            "embedding_version": patient.embedding_version,
+            "age": patient.age,
+            "sex": patient.sex,
+            "city": patient.city,
+            "country": patient.country,
+            "language": patient.language,
+            "diagnosis": patient.diagnosis,
+            "stage": patient.stage,
+            "story": patient.story,
+            "structured_profile": structured,
+            "profile_completeness": patient.profile_completeness,
+            "organization_id": patient.organization_id,
+            "score_weights": organization.score_weights if organization else None,
+            "settings": {name: getattr(settings, name, None) for name in FINGERPRINT_SETTINGS},
+        }
+    )
+
+
+def trial_match_fingerprint(trial: Trial, rule_features: Dict[str, Any]) -> str:
+    """
+    Hash of the trial inputs used by retrieval and the rule engine.
+    """
+    sites = sorted(
+        (
+            [site.facility or "", site.city or "", site.country or "", site.latitude, site.longitude]
+            for site in trial.sites.all()
+        ),
+        key=str,
+    )
+    return _digest(
+        {
+            "embedding_text": trial.embedding_text,
+            "status": trial.status,
+            "countries": trial.countries,
+            "sites": sites,
+            "rule_features": rule_features,
+        }
+    )
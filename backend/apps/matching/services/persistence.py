@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+
+from apps.matching.models import ExplanationState, MatchEvaluation
+from apps.patients.models import PatientProfile
+
+MATCH_UPSERT_FIELDS = [
+    "organization",
+    "matching_run",
+    "eligibility_score",
+    "feasibility_score",
+    "urgency_score",
+    "explainability_score",
+    "urgency_flag",
+    "overall_status",
+    "reasons_matched",
+    "reasons_failed",
+    "missing_info",
+    "doctor_checklist",
+    "explanation_summary",
+    "explanation_language",
+    "explanation_model",
+    "explanation_state",
+    "prompt_version",
+    "confidence",
+    "vector_similarity",
+    "is_new",
+    "patient_fingerprint",
+    "trial_fingerprint",
+    "last_evaluated",
+    "updated_at",
+]
+# Columns filled from the explanation; kept on rows whose complete explanation still applies.
+EXPLANATION_FIELDS = {
+    "overall_status",
+    "reasons_matched",
+    "reasons_failed",
+    "missing_info",
+    "doctor_checklist",
+    "explanation_summary",
+    "explanation_language",
+    "explanation_model",
+    "explanation_state",
+    "confidence",
+}
+
+
+class MatchWriteBatch:
+    """
+    Collects evaluated matches for one or more patients and persists them with
+    one upsert, one existing-key lookup and one stale-match delete per flush.
+    Outreach state and created_at are never overwritten on existing rows.
+
+    Rows added with a deferred explanation job are handed to `on_commit` once
+    the flush that wrote them has committed. When the stored row already has
+    a complete explanation for the same patient and trial fingerprints, its
+    explanation columns are kept and no job is queued, so re-running an
+    unchanged match does not revert it to the deterministic text.
+    `queued_explanations` counts the jobs handed to `on_commit`.
+    """
+
+    def __init__(self, on_commit: Callable[[List[Dict[str, Any]]], None] | None = None) -> None:
+        self._on_commit = on_commit
+        self._rows: Dict[Tuple[int, int], MatchEvaluation] = {}
+        self._deferred: Dict[Tuple[int, int], Dict[str, Any]] = {}
+        self._retained: Dict[int, Set[int]] = {}
+        self._cleared: Set[int] = set()
+        self._patient_state: Dict[int, Tuple[str, float]] = {}
+        self.queued_explanations = 0
+
+    def __len__(self) -> int:
+        return len(self._retained) + len(self._cleared)
+
+    def track_patient(self, patient_id: int, fingerprint: str = "", similarity_floor: float = 0.0) -> None:
+        """
+        Mark a patient as evaluated so its stale matches are pruned on flush,
+        and record the fingerprint/similarity floor incremental runs compare against.
+        """
+        self._cleared.discard(patient_id)
+        self._retained.setdefault(patient_id, set())
+        if fingerprint:
+            self._patient_state[patient_id] = (fingerprint, similarity_floor)
+
+    def clear_patient(self, patient_id: int, fingerprint: str = "", similarity_floor: float = 0.0) -> None:
+        """Drop every stored match for a patient on flush, including ones with outreach."""
+        self._retained.pop(patient_id, None)
+        self._rows = {key: row for key, row in self._rows.items() if key[0] != patient_id}
+        self._deferred = {key: job for key, job in self._deferred.items() if key[0] != patient_id}
+        self._cleared.add(patient_id)
+        if fingerprint:
+            self._patient_state[patient_id] = (fingerprint, similarity_floor)
+
+    def add(self, match: MatchEvaluation, deferred_explanation: Dict[str, Any] | None = None) -> None:
+        key = (match.patient_id, match.trial_id)
+        self.track_patient(match.patient_id)
+        self._retained[match.patient_id].add(match.trial_id)
+        self._rows[key] = match
+        if deferred_explanation is not None:
+            self._deferred[key] = deferred_explanation
+        else:
+            self._deferred.pop(key, None)
+
+    def flush(self) -> int:
+        """Persist pending rows and return the number of matches written."""
+        if not self._retained and not self._cleared:
+            return 0
+
+        rows = list(self._rows.values())
+        with transaction.atomic():
+            if rows:
+                existing = {
+                    (patient_id, trial_id): (state, patient_fingerprint, trial_fingerprint)
+                    for patient_id, trial_id, state, patient_fingerprint, trial_fingerprint in (
+                        MatchEvaluation.objects.filter(patient_id__in=self._retained.keys()).values_list(
+                            "patient_id", "trial_id", "explanation_state", "patient_fingerprint", "trial_fingerprint"
+                        )
+                    )
+                }
+                rewritten, explained = [], []
+                for row in rows:
+                    key = (row.patient_id, row.trial_id)
+                    row.is_new = key not in existing
+                    if key in self._deferred and existing.get(key) == (
+                        ExplanationState.COMPLETE,
+                        row.patient_fingerprint,
+                        row.trial_fingerprint,
+                    ):
+                        explained.append(row)
+                        del self._deferred[key]
+                    else:
+                        rewritten.append(row)
+                for batch_rows, update_fields in (
+                    (rewritten, MATCH_UPSERT_FIELDS),
+                    (explained, [field for field in MATCH_UPSERT_FIELDS if field not in EXPLANATION_FIELDS]),
+                ):
+                    if batch_rows:
+                        MatchEvaluation.objects.bulk_create(
+                            batch_rows,
+                            update_conflicts=True,
+                            unique_fields=["patient", "trial"],
+                            update_fields=update_fields,
+                        )
+
+            if self._retained:
+                keep = Q(pk__in=[])
+                for patient_id, trial_ids in self._retained.items():
+                    if trial_ids:
+                        keep |= Q(patient_id=patient_id, trial_id__in=trial_ids)
+                (
+                    MatchEvaluation.objects.filter(patient_id__in=self._retained.keys(), outreach_messages__isnull=True)
+                    .exclude(keep)
+                    .delete()
+                )
+
+            if self._cleared:
+                MatchEvaluation.objects.filter(patient_id__in=self._cleared).delete()
+
+            if self._patient_state:
+                PatientProfile.objects.bulk_update(
+                    [
+                        PatientProfile(id=patient_id, match_fingerprint=fingerprint, match_similarity_floor=floor)
+                        for patient_id, (fingerprint, floor) in self._patient_state.items()
+                    ],
+                    ["match_fingerprint", "match_similarity_floor"],
+                )
+
+            if self._deferred and self._on_commit is not None:
+                jobs = list(self._deferred.values())
+                self.queued_explanations += len(jobs)
+                on_commit = self._on_commit
+                transaction.on_commit(lambda: on_commit(jobs))
+
+        self._rows = {}
+        self._deferred = {}
+        self._retained = {}
+        self._cleared = set()
+        self._patient_state = {}
+        return len(rows)
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, Iterable
+
+import redis
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from apps.matching.models import MatchingRun
+
+PROGRESS_KEY_TTL_SECONDS = 24 * 60 * 60
+# After a failed Redis call, skip Redis for this long and fall back to the database.
+REDIS_RETRY_SECONDS = 30.0
+# While Redis is up, the MatchingRun stop flag is still read this often, to
+# catch stops that were only written to the database during an outage.
+STOP_DATABASE_CHECK_SECONDS = 5.0
+
+_client: redis.Redis | None = None
+_unavailable_until = 0.0
+
+
+def _redis() -> redis.Redis | None:
+    global _client
+    if time.monotonic() < _unavailable_until:
+        return None
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.MATCH_PROGRESS_REDIS_URL,
+            socket_timeout=0.5,
+            socket_connect_timeout=0.5,
+        )
+    return _client
+
+
+def _mark_unavailable() -> None:
+    global _unavailable_until
+    _unavailable_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+def _progress_key(run_id: int) -> str:
+    return f"matching:run:{run_id}:progress"
+
+
+def _stop_key(run_id: int) -> str:
+    return f"matching:run:{run_id}:stop"
+
+
+def _database_stop_requested(run_id: int) -> bool:
+    flag = MatchingRun.objects.filter(id=run_id).values_list("metadata__stop_requested", flat=True).first()
+    return bool(flag)
+
+
+class RunProgressChannel:
+    """
+    Live progress counters and the stop flag for one matching run, kept in
+    Redis so the evaluation loop does not touch MatchingRun per patient.
+    Every shard of a sharded run increments the same counters.
+
+    Methods never raise on Redis errors: counters are skipped, so callers
+    fall back to MatchingRun.metadata, and stop_requested reads the flag from
+    MatchingRun instead.
+    """
+
+    def __init__(self, run_id: int) -> None:
+        self.run_id = run_id
+        self._next_database_check = 0.0
+
+    def record(self, updates: int, processed_patients: int = 1) -> None:
+        client = _redis()
+        if client is None:
+            return
+        key = _progress_key(self.run_id)
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.hincrby(key, "updates", updates)
+            pipeline.hincrby(key, "processed_patients", processed_patients)
+            pipeline.expire(key, PROGRESS_KEY_TTL_SECONDS)
+            pipeline.execute()
+        except redis.RedisError:
+            _mark_unavailable()
+
+    def stop_requested(self) -> bool:
+        """
+        Whether a stop was requested. Reads Redis, and MatchingRun.metadata on
+        every call while Redis is unavailable or every
+        STOP_DATABASE_CHECK_SECONDS otherwise. A stop found only in the
+        database is re-published to Redis for the other shards.
+        """
+        client = _redis()
+        if client is not None:
+            try:
+                if client.exists(_stop_key(self.run_id)):
+                    return True
+            except redis.RedisError:
+                _mark_unavailable()
+                client = None
+
+        now = time.monotonic()
+        if client is not None and now < self._next_database_check:
+            return False
+        self._next_database_check = now + STOP_DATABASE_CHECK_SECONDS
+        if not _database_stop_requested(self.run_id):
+            return False
+        if client is not None:
+            try:
+                client.set(_stop_key(self.run_id), timezone.now().isoformat(), ex=PROGRESS_KEY_TTL_SECONDS)
+            except redis.RedisError:
+                _mark_unavailable()
+        return True
+
+    def clear(self) -> None:
+        client = _redis()
+        if client is None:
+            return
+        try:
+            client.delete(_progress_key(self.run_id), _stop_key(self.run_id))
+        except redis.RedisError:
+            _mark_unavailable()
+
+
+def read_run_progress(run_id: int) -> Dict[str, Any]:
+    """
+    Live counters for a running run, or {} when Redis has none; callers then
+    use the periodically flushed MatchingRun.metadata instead.
+    """
+    client = _redis()
+    if client is None:
+        return {}
+    try:
+        counters = client.hgetall(_progress_key(run_id))
+        stop_requested = bool(client.exists(_stop_key(run_id)))
+    except redis.RedisError:
+        _mark_unavailable()
+        return {}
+    progress: Dict[str, Any] = {key.decode(): int(value) for key, value in counters.items()}
+    if stop_requested:
+        progress["stop_requested"] = True
+    return progress
+
+
+def request_run_stop(run_ids: Iterable[int]) -> None:
+    """
+    Ask running runs to stop. The flag goes to Redis for the evaluation loop
+    and is merged into MatchingRun.metadata for workers without Redis.
+    """
+    run_ids = list(run_ids)
+    if not run_ids:
+        return
+
+    now = timezone.now().isoformat()
+    client = _redis()
+    if client is not None:
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for run_id in run_ids:
+                pipeline.set(_stop_key(run_id), now, ex=PROGRESS_KEY_TTL_SECONDS)
+            pipeline.execute()
+        except redis.RedisError:
+            _mark_unavailable()
+
+    # Merge in place: sharded runs keep live counters in the same metadata document.
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"UPDATE {MatchingRun._meta.db_table} SET metadata = metadata || %s::jsonb, updated_at = NOW() "
+            "WHERE id = ANY(%s)",
+            [json.dumps({"stop_requested": True, "stop_requested_at": now}), run_ids],
+        )
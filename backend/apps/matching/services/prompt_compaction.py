@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import json
+import math
+import re
+from typing import Any, Dict, List, Sequence, Tuple
+
+from django.conf import settings
+
+# Rough English/JSON average; only used to compare payloads against a budget.
+CHARS_PER_TOKEN = 4
+# A field truncated below this many tokens carries too little to be worth sending.
+MIN_TRUNCATED_FIELD_TOKENS = 16
+TRUNCATION_MARKER = " ..."
+CRITERIA_HEADER_PATTERN = re.compile(r"^(inclusion|exclusion)\s+criteria\s*:?$", re.IGNORECASE)
+CRITERIA_BULLET_PATTERN = re.compile(r"^(?:[*\-•]|\d+[.)])\s*")
+# Criteria lines with thresholds or staging carry most of the eligibility signal.
+CRITERIA_SIGNAL_PATTERN = re.compile(r"\d|[<>]=?|≤|≥|\b(ecog|stage|age|years|her2|brca|pd-l1)\b", re.IGNORECASE)
+STORY_DUPLICATE_KEYS = ("raw_story", "clean_story", "ai_summary")
+# Profile bookkeeping written by story parsing; it carries nothing for the model.
+PROFILE_BOOKKEEPING_KEYS = ("history_fingerprint", "history_parse")
+
+
+def estimate_tokens(value: Any) -> int:
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=True, default=str)
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _field_priority(setting: str) -> List[str]:
+    return [field.strip() for field in str(setting).split(",") if field.strip()]
+
+
+def _normalize_text(value: Any) -> str:
+    return " ".join(str(value or "").split()).casefold()
+
+
+def _truncate_text(text: str, max_tokens: int) -> str:
+    max_chars = max_tokens * CHARS_PER_TOKEN - len(TRUNCATION_MARKER)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    # Prefer ending on a word boundary when one is close.
+    boundary = cut.rfind(" ")
+    if boundary > max_chars * 0.8:
+        cut = cut[:boundary]
+    return cut.rstrip() + TRUNCATION_MARKER
+
+
+def criteria_lines(text: str) -> Tuple[List[str], List[str]]:
+    """
+    Split free-text eligibility criteria into (inclusion, exclusion) lines.
+    CT.gov puts both sections in one text under "Inclusion Criteria:" and
+    "Exclusion Criteria:" headers; text without headers counts as inclusion.
+    """
+    inclusion: List[str] = []
+    exclusion: List[str] = []
+    current = inclusion
+    for raw_line in (text or "").splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        header = CRITERIA_HEADER_PATTERN.match(line)
+        if header:
+            current = inclusion if header.group(1).lower() == "inclusion" else exclusion
+            continue
+        line = CRITERIA_BULLET_PATTERN.sub("", line).strip()
+        if line:
+            current.append(line)
+    return inclusion, exclusion
+
+
+def _select_criteria(lines: Sequence[str], max_tokens: int) -> List[str]:
+    """
+    Keep lines within `max_tokens`, taking criteria lines with numeric
+    thresholds or staging first and returning them in their original order.
+    """
+    if estimate_tokens(list(lines)) <= max_tokens:
+        return list(lines)
+    ranked = sorted(range(len(lines)), key=lambda index: (not CRITERIA_SIGNAL_PATTERN.search(lines[index]), index))
+    kept: List[int] = []
+    used = 2
+    for index in ranked:
+        cost = estimate_tokens(lines[index]) + 1
+        if used + cost > max_tokens:
+            continue
+        kept.append(index)
+        used += cost
+    selected = [lines[index] for index in sorted(kept)]
+    omitted = len(lines) - len(selected)
+    if omitted:
+        selected.append(f"[{omitted} more omitted]")
+    return selected
+
+
+def _shrink(value: Any, max_tokens: int) -> Any | None:
+    """Fit a string or list value into `max_tokens`, or None when it cannot be usefully shortened."""
+    if max_tokens < MIN_TRUNCATED_FIELD_TOKENS:
+        return None
+    if isinstance(value, str):
+        return _truncate_text(value, max_tokens)
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return _select_criteria(value, max_tokens)
+    return None
+
+
+def _fit_to_budget(
+    payload: Dict[str, Any],
+    priority: List[str],
+    budget: int,
+    required: Sequence[str] = (),
+) -> Dict[str, Any]:
+    """
+    Keep fields in `priority` order (unlisted fields last) while the estimate
+    stays within `budget`. A field that does not fit is truncated into the
+    remaining budget when it is text or a list of strings, otherwise dropped.
+    Required fields are always kept as-is.
+    """
+    ordered = [field for field in priority if field in payload]
+    ordered += [field for field in payload if field not in ordered]
+    compacted: Dict[str, Any] = {field: payload[field] for field in required if field in payload}
+    used = estimate_tokens(compacted)
+    for field in ordered:
+        value = payload[field]
+        if field in compacted or value in (None, "", [], {}):
+            continue
+        cost = estimate_tokens({field: value})
+        if used + cost <= budget:
+            compacted[field] = value
+            used += cost
+            continue
+        shrunk = _shrink(value, budget - used - estimate_tokens({field: ""}))
+        if shrunk is not None:
+            compacted[field] = shrunk
+            used += estimate_tokens({field: shrunk})
+    return compacted
+
+
+def compact_patient_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Drop structured_profile text that repeats the story, diagnosis or stage,
+    then fit the payload into LLM_PROMPT_PATIENT_TOKENS.
+    """
+    compacted = dict(payload)
+    profile = payload.get("structured_profile")
+    if isinstance(profile, dict):
+        story = _normalize_text(payload.get("story"))
+        profile = {
+            key: value
+            for key, value in profile.items()
+            if not (key in STORY_DUPLICATE_KEYS and _normalize_text(value) == story)
+            and not (key in ("diagnosis", "stage") and _normalize_text(value) == _normalize_text(payload.get(key)))
+            and key not in PROFILE_BOOKKEEPING_KEYS
+            and value not in (None, "", [], {})
+        }
+        # The story is only needed once; keep the structured copy when the top-level one is empty.
+        if not story and profile.get("raw_story"):
+            compacted["story"] = profile.pop("raw_story")
+        compacted["structured_profile"] = profile
+    return _fit_to_budget(
+        compacted,
+        _field_priority(settings.LLM_PROMPT_PATIENT_FIELDS),
+        max(1, int(settings.LLM_PROMPT_PATIENT_TOKENS)),
+    )
+
+
+def compact_trial_payload(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Replace inclusion/exclusion text with criteria lines (pre-extracted ones
+    when the payload carries them), then fit the payload into
+    LLM_PROMPT_TRIAL_TOKENS. The trial_id is always kept.
+    """
+    compacted = {key: value for key, value in payload.items() if key not in ("inclusion_text", "exclusion_text")}
+    parsed_inclusion, parsed_exclusion = criteria_lines(payload.get("inclusion_text", ""))
+    parsed_exclusion += criteria_lines(payload.get("exclusion_text", ""))[0]
+    if not compacted.get("inclusion_criteria"):
+        compacted["inclusion_criteria"] = parsed_inclusion
+    if not compacted.get("exclusion_criteria"):
+        compacted["exclusion_criteria"] = parsed_exclusion
+    return _fit_to_budget(
+        compacted,
+        _field_priority(settings.LLM_PROMPT_TRIAL_FIELDS),
+        max(1, int(settings.LLM_PROMPT_TRIAL_TOKENS)),
+        required=("trial_id",),
+    )
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+from django.db import transaction
+from django.db.models import F, QuerySet
+from django.utils import timezone
+
+from apps.core.services.embedding import current_embedding_version, embed_texts
+from apps.matching.models import EmbeddingBackfill
+from apps.patients.models import PatientProfile
+from apps.patients.services.profile import patient_embedding_payload, patient_embedding_text
+from apps.trials.models import Trial
+
+REEMBED_TARGETS = {
+    "trials": Trial,
+    "patients": PatientProfile,
+}
+# Only the columns that make up each row's embedding text are streamed.
+TEXT_FIELDS = {
+    "trials": ("embedding_text",),
+    "patients": ("full_name", "age", "sex", "city", "country", "story", "structured_profile"),
+}
+
+
+def _embedding_text(target: str, row) -> str:
+    if target == "trials":
+        return row.embedding_text
+    return patient_embedding_text(patient_embedding_payload(row), row.structured_profile)
+
+
+def _batches(rows: Iterable, size: int) -> Iterator[List]:
+    iterator = iter(rows)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def stale_rows(target: str, version: str) -> QuerySet:
+    """Rows without a vector, or whose vector was produced by another model or dimension count."""
+    return REEMBED_TARGETS[target].objects.exclude(embedding_version=version, embedding_vector__isnull=False)
+
+
+def open_backfill(target: str, version: str) -> EmbeddingBackfill:
+    """The unfinished backfill for `target` and `version`, to resume from its checkpoint, or a new one."""
+    backfill = (
+        EmbeddingBackfill.objects.filter(target=target, version=version, completed_at__isnull=True)
+        .order_by("-id")
+        .first()
+    )
+    return backfill or EmbeddingBackfill.objects.create(target=target, version=version)
+
+
+def backfill_shadow_embeddings(
+    target: str,
+    batch_size: int,
+    stats: Dict[str, int] | None = None,
+    on_batch: Callable[[EmbeddingBackfill], None] | None = None,
+) -> EmbeddingBackfill:
+    """
+    Embed every stale row of `target` with the current model into the shadow
+    columns, in id order and `batch_size` rows per embedding call. The live
+    columns are not touched, so retrieval keeps using the old vectors until
+    swap_shadow_embeddings.
+
+    Each batch commits together with the backfill checkpoint, so an
+    interrupted run resumes after the last committed row. Rows whose request
+    fell back to hash vectors get no shadow vector and stay stale for the
+    next run.
+    """
+    version = current_embedding_version()
+    model = REEMBED_TARGETS[target]
+    backfill = open_backfill(target, version)
+    rows = stale_rows(target, version).filter(id__gt=backfill.last_id).order_by("id").only("id", *TEXT_FIELDS[target])
+
+    # iterator() reads through a server-side cursor, which stays open across the per-batch commits.
+    for batch in _batches(rows.iterator(chunk_size=batch_size), batch_size):
+        embeddings = embed_texts([_embedding_text(target, row) for row in batch], stats=stats)
+        ready = []
+        for row, embedding in zip(batch, embeddings):
+            if embedding.version == version:
+                row.embedding_vector_next, row.embedding_version_next = embedding
+                ready.append(row)
+        with transaction.atomic():
+            model.objects.bulk_update(ready, ["embedding_vector_next", "embedding_version_next"])
+            backfill.last_id = batch[-1].id
+            backfill.embedded += len(ready)
+            backfill.failed += len(batch) - len(ready)
+            backfill.save(update_fields=["last_id", "embedded", "failed", "updated_at"])
+        if on_batch is not None:
+            on_batch(backfill)
+    return backfill
+
+
+def swap_shadow_embeddings(backfills: Sequence[EmbeddingBackfill]) -> None:
+    """
+    Move the backfills' shadow vectors into the live columns in one
+    transaction, so retrieval sees either every old vector or every new one,
+    including across trials and patients swapped together.
+
+    Rows that were re-embedded with the current version after their shadow
+    was written keep the newer live vector. Swapped trials are marked changed
+    for incremental matching; patients are, through their fingerprint.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        for backfill in backfills:
+            model = REEMBED_TARGETS[backfill.target]
+            shadowed = model.objects.filter(embedding_version_next=backfill.version)
+            changes = {
+                "embedding_vector": F("embedding_vector_next"),
+                "embedding_version": F("embedding_version_next"),
+                "updated_at": now,
+            }
+            if model is Trial:
+                changes["fingerprint_updated_at"] = now
+            backfill.swapped = shadowed.exclude(embedding_version=backfill.version).update(**changes)
+            shadowed.update(embedding_vector_next=None, embedding_version_next="")
+            backfill.completed_at = now
+            backfill.save(update_fields=["swapped", "completed_at", "updated_at"])
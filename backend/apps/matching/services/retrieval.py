@@ -0,0 +1,257 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Max, Value
+from django.db.models.functions import Cast
+from pgvector.django import CosineDistance, HalfVector, HalfVectorField
+
+from apps.core.services.embedding import compatible_embedding_versions
+from apps.trials.models import Trial
+
+VECTOR_PRECISIONS = ("full", "half")
+
+
+def half_precision_search() -> bool:
+    return settings.MATCH_VECTOR_PRECISION == "half"
+
+
+def halfvec_index_name(model) -> str:
+    return f"{model._meta.model_name}_embedding_halfvec_hnsw"
+
+
+def halfvec_index_sql(model) -> str:
+    """
+    HNSW index over the embedding column cast to halfvec: half the size of the
+    float32 index, built from the existing column without rewriting the table.
+    Queries use it when they compare the same cast expression.
+    """
+    dimensions = model._meta.get_field("embedding_vector").dimensions
+    return (
+        f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {halfvec_index_name(model)} ON {model._meta.db_table} "
+        f"USING hnsw ((embedding_vector::halfvec({dimensions})) halfvec_cosine_ops) "
+        "WITH (m = 16, ef_construction = 64)"
+    )
+
+
+def cosine_distance_sql(column: str, query: str, dimensions: int, half: bool | None = None) -> str:
+    """
+    SQL cosine distance between a vector column and a query vector given as
+    text. In half precision both sides are cast to halfvec so the halfvec
+    expression index applies.
+    """
+    if half_precision_search() if half is None else half:
+        return f"{column}::halfvec({dimensions}) <=> {query}::halfvec({dimensions})"
+    return f"{column} <=> {query}::vector"
+
+
+def cosine_distance(model, vector: Any, half: bool | None = None) -> CosineDistance:
+    """ORM counterpart of cosine_distance_sql against `model.embedding_vector`."""
+    if not (half_precision_search() if half is None else half):
+        return CosineDistance("embedding_vector", vector)
+    field = HalfVectorField(dimensions=model._meta.get_field("embedding_vector").dimensions)
+    query = Value(HalfVector._to_db(HalfVector(list(vector))))
+    return CosineDistance(Cast("embedding_vector", field), Cast(query, field))
+
+
+def vector_search_params() -> tuple[int, int]:
+    """
+    Effective (hnsw.ef_search, ivfflat.probes). ef_search never drops below
+    the number of rows retrieval asks for, since HNSW returns at most that many.
+    """
+    ef_search = max(int(settings.MATCH_VECTOR_EF_SEARCH), int(settings.MATCH_TOP_K) * 2)
+    probes = max(1, int(settings.MATCH_VECTOR_IVFFLAT_PROBES))
+    return ef_search, probes
+
+
+def configure_vector_search() -> None:
+    """
+    Apply ANN search knobs to the current database session. Applied once per
+    physical connection outside transactions; inside one it is re-applied
+    because a rollback would discard it.
+    """
+    connection.ensure_connection()
+    ef_search, probes = vector_search_params()
+    applied_key = (id(connection.connection), ef_search, probes)
+    if not connection.in_atomic_block and getattr(connection, "_vector_search_params", None) == applied_key:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT set_config('hnsw.ef_search', %s, false), set_config('ivfflat.probes', %s, false)",
+            [str(ef_search), str(probes)],
+        )
+    connection._vector_search_params = applied_key
+
+
+def nearest_trial_ids_for_vectors(
+    vectors: Dict[int, Any],
+    statuses: Sequence[str],
+    limit: int,
+    version: str | None = None,
+) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Top `limit` trials by cosine distance for each keyed query vector, in one
+    round trip. Each query vector is joined LATERAL against the trial table so
+    every per-key subquery can still use the HNSW index (the halfvec one at
+    MATCH_VECTOR_PRECISION=half). When `version` is given, only trials with
+    a compatible embedding_version are compared (see
+    compatible_embedding_versions).
+
+    Returns {key: [(trial_id, distance), ...]} ordered by distance; keys with
+    no vector or no neighbours are absent.
+    """
+    keys = [key for key, vector in vectors.items() if vector is not None]
+    if not keys or limit <= 0:
+        return {}
+
+    vector_field = Trial._meta.get_field("embedding_vector")
+    encoded = [vector_field.get_prep_value(vectors[key]) for key in keys]
+    distance = cosine_distance_sql("t.embedding_vector", "q.embedding", vector_field.dimensions)
+    versions = compatible_embedding_versions(version) if version is not None else None
+
+    configure_vector_search()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            SELECT q.key, nearest.id, nearest.distance
+            FROM unnest(%s::bigint[], %s::text[]) WITH ORDINALITY AS q(key, embedding, position)
+            CROSS JOIN LATERAL (
+                SELECT t.id, {distance} AS distance
+                FROM {Trial._meta.db_table} t
+                WHERE t.status = ANY(%s) AND t.embedding_vector IS NOT NULL
+                    AND (%s::text[] IS NULL OR t.embedding_version = ANY(%s::text[]))
+                ORDER BY {distance}
+                LIMIT %s
+            ) nearest
+            ORDER BY q.position, nearest.distance
+            """,
+            [keys, encoded, list(statuses), versions, versions, int(limit)],
+        )
+        rows = cursor.fetchall()
+
+    ranked: Dict[int, List[Tuple[int, float]]] = {}
+    for key, trial_id, distance in rows:
+        ranked.setdefault(key, []).append((trial_id, float(distance)))
+    return ranked
+
+
+@dataclass(frozen=True)
+class TrialMatrix:
+    """Unit-normalized float32 trial embeddings, one row per trial id."""
+
+    version: Tuple[Any, ...]
+    trial_ids: np.ndarray
+    vectors: np.ndarray
+
+
+# Per-process matrices by embedding version, each rebuilt when its trial set's
+# count or latest updated_at moves.
+_TRIAL_MATRICES: Dict[str | None, TrialMatrix] = {}
+
+
+def _matrix_trials(statuses: Sequence[str], embedding_version: str | None):
+    trials = Trial.objects.filter(status__in=statuses, embedding_vector__isnull=False)
+    if embedding_version is not None:
+        trials = trials.filter(embedding_version__in=compatible_embedding_versions(embedding_version))
+    return trials
+
+
+def _trial_matrix_version(statuses: Sequence[str], embedding_version: str | None) -> Tuple[Any, ...]:
+    summary = _matrix_trials(statuses, embedding_version).aggregate(count=Count("id"), latest=Max("updated_at"))
+    return (tuple(sorted(statuses)), embedding_version, summary["count"], summary["latest"])
+
+
+def get_trial_matrix(statuses: Sequence[str], embedding_version: str | None = None) -> TrialMatrix:
+    version = _trial_matrix_version(statuses, embedding_version)
+    cached = _TRIAL_MATRICES.get(embedding_version)
+    if cached is not None and cached.version == version:
+        return cached
+
+    rows = _matrix_trials(statuses, embedding_version).values_list("id", "embedding_vector")
+    trial_ids: List[int] = []
+    vectors: List[np.ndarray] = []
+    for trial_id, vector in rows.iterator(chunk_size=2000):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if norm == 0.0:
+            # pgvector yields no usable cosine distance for zero vectors either.
+            continue
+        trial_ids.append(trial_id)
+        vectors.append(vector / norm)
+
+    dimensions = Trial._meta.get_field("embedding_vector").dimensions
+    matrix = TrialMatrix(
+        version=version,
+        trial_ids=np.asarray(trial_ids, dtype=np.int64),
+        vectors=np.ascontiguousarray(np.vstack(vectors)) if vectors else np.empty((0, dimensions), dtype=np.float32),
+    )
+    _TRIAL_MATRICES[embedding_version] = matrix
+    return matrix
+
+
+def clear_trial_matrix() -> None:
+    _TRIAL_MATRICES.clear()
+
+
+def nearest_trial_ids_in_memory(
+    vectors: Dict[int, Any],
+    statuses: Sequence[str],
+    limit: int,
+    version: str | None = None,
+) -> Dict[int, List[Tuple[int, float]]]:
+    """
+    Same contract as nearest_trial_ids_for_vectors, computed exactly against
+    the cached trial matrix with one matrix multiply for the whole batch.
+    """
+    keys = [key for key, vector in vectors.items() if vector is not None]
+    if not keys or limit <= 0:
+        return {}
+
+    matrix = get_trial_matrix(statuses, version)
+    if not len(matrix.trial_ids):
+        return {}
+
+    queries = np.vstack([np.asarray(vectors[key], dtype=np.float32) for key in keys])
+    norms = np.linalg.norm(queries, axis=1)
+    usable = norms > 0
+    similarities = (queries[usable] / norms[usable, None]) @ matrix.vectors.T
+
+    k = min(limit, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    ranked: Dict[int, List[Tuple[int, float]]] = {}
+    usable_keys = [key for key, keep in zip(keys, usable) if keep]
+    for row, key in enumerate(usable_keys):
+        ranked[key] = [
+            (int(matrix.trial_ids[column]), 1.0 - float(score)) for column, score in zip(top[row], top_scores[row])
+        ]
+    return ranked
+
+
+def nearest_trial_ids(
+    vectors: Dict[int, Any],
+    statuses: Sequence[str],
+    limit: int,
+    version: str | None = None,
+) -> Dict[int, List[Tuple[int, float]]]:
+    """Dispatch batched retrieval to the engine selected by MATCH_RETRIEVAL_ENGINE."""
+    if settings.MATCH_RETRIEVAL_ENGINE == "numpy":
+        return nearest_trial_ids_in_memory(vectors, statuses, limit, version)
+    return nearest_trial_ids_for_vectors(vectors, statuses, limit, version)
+
+
+def hydrate_trials(trial_ids: Iterable[int]) -> Dict[int, Trial]:
+    """Load trials with their sites once so candidates for many patients share instances."""
+    ids = set(trial_ids)
+    if not ids:
+        return {}
+    return {trial.id: trial for trial in Trial.objects.filter(id__in=ids).prefetch_related("sites")}
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from apps.trials.models import Trial, TrialSite
+
+EARTH_RADIUS_KM = 6371.0
+GRID_CELL_DEGREES = 1.0
+NON_WORD_PATTERN = re.compile(r"[^\w\s]")
+
+Point = Tuple[float, float]
+
+
+def normalize_place(value: str | None) -> str:
+    """Casefold, drop punctuation and collapse whitespace so place names compare exactly."""
+    if not value:
+        return ""
+    return " ".join(NON_WORD_PATTERN.sub(" ", value.casefold()).split())
+
+
+def haversine_km(a: Point, b: Point) -> float:
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+LONGITUDE_CELLS = int(360 / GRID_CELL_DEGREES)
+
+
+def _grid_cell(point: Point) -> Tuple[int, int]:
+    # Longitude cells wrap so sites across the antimeridian stay neighbours.
+    return math.floor(point[0] / GRID_CELL_DEGREES), math.floor(
+        (point[1] + 180.0) / GRID_CELL_DEGREES
+    ) % LONGITUDE_CELLS
+
+
+class SiteIndex:
+    """
+    Lookup tables over trial sites for location feasibility: trial ids by
+    normalized (country, city) and by country, plus a lat/lon grid of site
+    coordinates for nearest-site distances. Patients carry no coordinates, so
+    a patient's position is the centroid of known sites in the same city.
+
+    Entries are tied to each trial's updated_at; callers must check
+    covers(trial) before trusting a lookup.
+    """
+
+    def __init__(self, trial_versions: Dict[int, Any], sites: Iterable[Tuple[int, str, str, Any, Any]]) -> None:
+        self.trial_versions = trial_versions
+        self.trials_with_sites: Set[int] = set()
+        self.by_location: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+        self.by_city: Dict[str, Set[int]] = defaultdict(set)
+        self.by_country: Dict[str, Set[int]] = defaultdict(set)
+        self.grid: Dict[Tuple[int, int], List[Tuple[Point, int]]] = defaultdict(list)
+
+        city_sums: Dict[Tuple[str, str], List[float]] = defaultdict(lambda: [0.0, 0.0, 0.0])
+        for trial_id, city, country, latitude, longitude in sites:
+            city_key = normalize_place(city)
+            country_key = normalize_place(country)
+            self.trials_with_sites.add(trial_id)
+            self.by_location[(country_key, city_key)].add(trial_id)
+            self.by_city[city_key].add(trial_id)
+            self.by_country[country_key].add(trial_id)
+            if latitude is None or longitude is None:
+                continue
+            point = (float(latitude), float(longitude))
+            self.grid[_grid_cell(point)].append((point, trial_id))
+            for key in ((country_key, city_key), ("", city_key)):
+                totals = city_sums[key]
+                totals[0] += point[0]
+                totals[1] += point[1]
+                totals[2] += 1
+
+        self.city_points: Dict[Tuple[str, str], Point] = {
+            key: (lat_sum / count, lon_sum / count) for key, (lat_sum, lon_sum, count) in city_sums.items()
+        }
+        self._distance_cache: Dict[Tuple[str, str, float], Dict[int, float]] = {}
+
+    def covers(self, trial: Trial) -> bool:
+        return trial.id in self.trial_versions and self.trial_versions[trial.id] == trial.updated_at
+
+    def has_site_in_city(self, trial_id: int, country: str, city: str) -> bool:
+        if not city:
+            return False
+        if country:
+            return trial_id in self.by_location.get((country, city), ())
+        return trial_id in self.by_city.get(city, ())
+
+    def has_site_in_country(self, trial_id: int, country: str) -> bool:
+        return bool(country) and trial_id in self.by_country.get(country, ())
+
+    def locate(self, country: str, city: str) -> Point | None:
+        if not city:
+            return None
+        return self.city_points.get((country, city)) or self.city_points.get(("", city))
+
+    def nearest_site_km(self, trial_id: int, country: str, city: str, max_km: float) -> float | None:
+        """Distance from the patient's city to the trial's closest site, if within max_km."""
+        return self._site_distances(country, city, max_km).get(trial_id)
+
+    def _site_distances(self, country: str, city: str, max_km: float) -> Dict[int, float]:
+        # Computed once per patient location and reused for every candidate trial.
+        cache_key = (country, city, max_km)
+        cached = self._distance_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        distances: Dict[int, float] = {}
+        origin = self.locate(country, city)
+        if origin is not None and max_km > 0:
+            lat_cells = math.ceil(max_km / (111.0 * GRID_CELL_DEGREES))
+            cos_lat = max(0.01, math.cos(math.radians(origin[0])))
+            lon_cells = math.ceil(max_km / (111.0 * cos_lat * GRID_CELL_DEGREES))
+            origin_cell = _grid_cell(origin)
+            lon_range = {(origin_cell[1] + offset) % LONGITUDE_CELLS for offset in range(-lon_cells, lon_cells + 1)}
+            for lat_offset in range(-lat_cells, lat_cells + 1):
+                for lon_cell in lon_range:
+                    for point, trial_id in self.grid.get((origin_cell[0] + lat_offset, lon_cell), ()):
+                        distance = haversine_km(origin, point)
+                        if distance <= max_km and distance < distances.get(trial_id, math.inf):
+                            distances[trial_id] = distance
+
+        self._distance_cache[cache_key] = distances
+        return distances
+
+
+_SITE_INDEX: SiteIndex | None = None
+
+
+def build_site_index(trial_ids: Iterable[int] | None = None) -> SiteIndex:
+    """Build the index for the given trials (all trials when None) and make it the active one."""
+    global _SITE_INDEX
+
+    trials = Trial.objects.all()
+    sites = TrialSite.objects.all()
+    if trial_ids is not None:
+        trial_ids = list(trial_ids)
+        trials = trials.filter(id__in=trial_ids)
+        sites = sites.filter(trial_id__in=trial_ids)
+
+    _SITE_INDEX = SiteIndex(
+        dict(trials.values_list("id", "updated_at")),
+        sites.values_list("trial_id", "city", "country", "latitude", "longitude").iterator(chunk_size=5000),
+    )
+    return _SITE_INDEX
+
+
+def get_site_index() -> SiteIndex | None:
+    return _SITE_INDEX
+
+
+def clear_site_index() -> None:
+    global _SITE_INDEX
+    _SITE_INDEX = None
@@ -1,12 +1,65 @@
-from celery import shared_task
+from celery import chord, shared_task
+from django.conf import settings
 
-from .services.engine import MatchingRunAlreadyRunningError, run_full_matching_cycle
+from apps.matching.models import MatchingRun
+
+from .services.engine import (
+    MatchingRunAlreadyRunningError,
+    create_sharded_matching_run,
+    explain_deferred_matches,
+    finalize_sharded_matching_run,
+    run_full_matching_cycle,
+    run_matching_shard,
+)
+
+
+@shared_task
+def run_matching_shard_task(run_id: int, shard_index: int, first_patient_id: int, last_patient_id: int) -> dict:
+    return run_matching_shard(run_id, shard_index, first_patient_id, last_patient_id)
+
+
+@shared_task
+def finalize_sharded_matching_run_task(shard_results: list, run_id: int) -> dict:
+    run = finalize_sharded_matching_run(shard_results, run_id)
+    if run is None:
+        return {"run_id": run_id, "missing": True}
+    return {"run_id": run.id, "status": run.status, **run.metadata}
+
+
+@shared_task
+def explain_matches_task(jobs: list, run_id: int | None = None) -> dict:
+    return explain_deferred_matches(jobs, run_id=run_id)
+
+
+def start_sharded_matching_run(run_type: str = "scheduled") -> MatchingRun:
+    """
+    Create a sharded parent run and fan its shards out across Celery workers.
+    Returns immediately; the chord callback closes the run when all shards finish.
+    """
+    run, shards = create_sharded_matching_run(run_type=run_type)
+    if shards:
+        chord(
+            [
+                run_matching_shard_task.s(run.id, index, first_id, last_id)
+                for index, (first_id, last_id) in enumerate(shards)
+            ]
+        )(finalize_sharded_matching_run_task.s(run.id))
+    return run
+
+
+def start_matching_run(run_type: str = "scheduled") -> MatchingRun:
+    # Incremental runs touch only changed patients, so they always run in-process.
+    if settings.MATCH_SCHEDULED_INCREMENTAL:
+        return run_full_matching_cycle(run_type="incremental", incremental=True)
+    if settings.MATCH_RUN_MODE == "sharded":
+        return start_sharded_matching_run(run_type=run_type)
+    return run_full_matching_cycle(run_type=run_type)
 
 
 @shared_task
 def run_daily_matching() -> dict:
     try:
-        run = run_full_matching_cycle(run_type="scheduled")
+        run = start_matching_run(run_type="scheduled")
     except MatchingRunAlreadyRunningError as exc:
         running_run = exc.running_run
         return {
@@ -1,8 +1,45 @@
-from django.test import TestCase, override_settings
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
 
 from apps.core.models import Organization
-from apps.matching.models import MatchEvaluation
-from apps.matching.services.engine import evaluate_patient_against_trials
+from apps.core.services.embedding import generate_embedding
+from apps.matching.models import ExplanationState, MatchEvaluation, MatchingRun
+from apps.matching.services import progress
+from apps.matching.services.engine import (
+    _candidate_trials_for_patients,
+    _consume_llm_budget,
+    _release_llm_budget,
+    _indexed_location_feasibility,
+    evaluate_patient_against_trials,
+    explain_deferred_matches,
+    finalize_sharded_matching_run,
+    plan_patient_shards,
+    run_full_matching_cycle,
+    run_matching_shard,
+    select_incremental_patient_ids,
+)
+from apps.matching.services.features import (
+    TrialFeatures,
+    compute_trial_features,
+    get_trial_features,
+    refresh_trial_features,
+    trial_features_source_hash,
+)
+from apps.matching.services.fingerprints import patient_match_fingerprint
+from apps.matching.services.retrieval import (
+    clear_trial_matrix,
+    cosine_distance,
+    cosine_distance_sql,
+    nearest_trial_ids_for_vectors,
+    nearest_trial_ids_in_memory,
+)
+from apps.matching.services.sites import SiteIndex
 from apps.patients.models import PatientProfile
 from apps.trials.models import Trial, TrialSite
 
@@ -93,6 +130,194 @@ class MatchingEngineTests(TestCase):
         self.assertGreaterEqual(top.eligibility_score, 60)
         self.assertIn(top.overall_status, {"Eligible", "Possibly Eligible", "Unlikely"})
 
+    def test_reevaluation_upserts_existing_matches_as_not_new(self):
+        evaluate_patient_against_trials(self.patient)
+        first = MatchEvaluation.objects.get(patient=self.patient, trial=self.matching_trial)
+        self.assertTrue(first.is_new)
+        MatchEvaluation.objects.filter(id=first.id).update(outreach_status="sent")
+
+        evaluate_patient_against_trials(self.patient)
+        second = MatchEvaluation.objects.get(patient=self.patient, trial=self.matching_trial)
+        self.assertEqual(second.id, first.id)
+        self.assertFalse(second.is_new)
+        self.assertEqual(second.outreach_status, "sent")
+        self.assertEqual(second.created_at, first.created_at)
+
+    def test_trial_features_round_trip_through_trial(self):
+        features = refresh_trial_features(self.matching_trial)
+        self.matching_trial.refresh_from_db()
+
+        self.assertEqual(TrialFeatures.from_dict(self.matching_trial.rule_features), features)
+        self.assertEqual(compute_trial_features(self.matching_trial), features)
+        self.assertEqual((features.min_age, features.max_age), (18, 70))
+        self.assertTrue(features.female_only)
+        self.assertIn(("karachi", "pakistan"), features.site_locations)
+
+    def test_trial_features_recomputed_when_criteria_change_without_refresh(self):
+        refresh_trial_features(self.matching_trial)
+        # An admin-style edit: saved, but without refreshing the features.
+        trial = Trial.objects.get(id=self.matching_trial.id)
+        trial.inclusion_text = "Minimum age 30 years."
+        trial.save(update_fields=["inclusion_text", "updated_at"])
+
+        self.assertIsNone(TrialFeatures.from_dict(trial.rule_features, trial_features_source_hash(trial)))
+        features = get_trial_features(trial)
+        self.assertEqual((features.min_age, features.max_age), (30, 70))
+        self.assertFalse(features.female_only)
+
+    def test_cached_trial_features_skip_rebuilding_trial_text(self):
+        features = refresh_trial_features(self.matching_trial)
+        hydrated = Trial.objects.prefetch_related("sites").get(id=self.matching_trial.id)
+
+        with patch("apps.matching.services.features._trial_text") as trial_text:
+            self.assertEqual(get_trial_features(hydrated), features)
+        trial_text.assert_not_called()
+
+    def test_trial_features_source_hash_covers_sites(self):
+        refresh_trial_features(self.matching_trial)
+        TrialSite.objects.create(trial=self.matching_trial, facility="Lahore Site", city="Lahore", country="Pakistan")
+        trial = Trial.objects.prefetch_related("sites").get(id=self.matching_trial.id)
+
+        self.assertIsNone(TrialFeatures.from_dict(trial.rule_features, trial_features_source_hash(trial)))
+
+    def test_incremental_selection_tracks_patient_and_trial_changes(self):
+        refresh_trial_features(self.matching_trial)
+        refresh_trial_features(self.unrelated_trial)
+        evaluate_patient_against_trials(self.patient)
+        MatchingRun.objects.create(run_type="manual", status="completed")
+
+        patient_ids, info = select_incremental_patient_ids()
+        self.assertEqual(patient_ids, [])
+        self.assertEqual(info["changed_trials"], 0)
+
+        self.patient.story = f"{self.patient.story} Recent CBC within normal limits."
+        self.patient.save(update_fields=["story", "updated_at"])
+        patient_ids, info = select_incremental_patient_ids()
+        self.assertEqual(patient_ids, [self.patient.id])
+        self.assertEqual(info["changed_patients"], 1)
+
+    def test_incremental_selection_reevaluates_patients_when_a_candidate_trial_closes(self):
+        vector = [1.0] + [0.0] * 383
+        Trial.objects.filter(id=self.unrelated_trial.id).update(embedding_vector=vector)
+        refresh_trial_features(self.matching_trial)
+        refresh_trial_features(self.unrelated_trial)
+        # Evaluated with the trial among their candidates, just below the match cutoff, so no match is kept.
+        self.patient.embedding_vector = vector
+        self.patient.match_similarity_floor = 0.5
+        self.patient.match_fingerprint = patient_match_fingerprint(self.patient)
+        self.patient.save(update_fields=["embedding_vector", "match_similarity_floor", "match_fingerprint"])
+        MatchingRun.objects.create(run_type="manual", status="completed")
+        self.assertFalse(MatchEvaluation.objects.filter(patient=self.patient, trial=self.unrelated_trial).exists())
+
+        trial = Trial.objects.get(id=self.unrelated_trial.id)
+        trial.status = "COMPLETED"
+        trial.save(update_fields=["status", "updated_at"])
+        refresh_trial_features(trial)
+
+        patient_ids, info = select_incremental_patient_ids()
+        self.assertEqual(info["changed_trials"], 1)
+        self.assertEqual(patient_ids, [self.patient.id])
+
+    @override_settings(
+        MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0",
+        MATCH_EXPLANATION_MODE="inline",
+        LLM_MODE="gemini",
+        GEMINI_API_KEY="test-key",
+        LLM_EXPLANATION_CACHE_TTL_SECONDS=0,
+        LLM_GEMINI_MAX_CONCURRENCY=4,
+        MATCH_WRITE_BATCH_PATIENTS=10,
+    )
+    def test_inline_run_explains_a_patient_batch_concurrently(self):
+        for trial in (self.matching_trial, self.unrelated_trial):
+            trial.embedding_vector = generate_embedding(f"{trial.title} {' '.join(trial.conditions)}")
+            trial.save(update_fields=["embedding_vector"])
+        second_patient = PatientProfile.objects.create(
+            patient_code="PAT-9005",
+            organization=self.org,
+            full_name="Concurrent Explanation Patient",
+            age=49,
+            sex="female",
+            city="Karachi",
+            country="Pakistan",
+            language="English",
+            diagnosis="HER2+ Breast Cancer",
+            stage="Stage IV (Metastatic)",
+            story="Metastatic HER2 positive breast cancer after trastuzumab. ECOG 1.",
+            structured_profile={"markers": ["her2", "metastatic"], "stage": "Stage IV"},
+            contact_channel="email",
+            contact_value="concurrent.patient@example.com",
+            consent=True,
+        )
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_gemini(prompt, rule_result):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.1)
+            with lock:
+                state["active"] -= 1
+            return {**rule_result, "plain_language_summary": "Explained.", "model": "gemini:test"}
+
+        with patch("apps.matching.services.explanation._generate_with_gemini", side_effect=slow_gemini):
+            run = run_full_matching_cycle(run_type="manual")
+
+        self.assertEqual(run.status, "completed")
+        self.assertEqual(
+            set(MatchEvaluation.objects.filter(trial=self.matching_trial).values_list("patient_id", flat=True)),
+            {self.patient.id, second_patient.id},
+        )
+        self.assertEqual(state["peak"], 2)
+
+    def test_batched_retrieval_shares_trials_across_patients(self):
+        for trial in (self.matching_trial, self.unrelated_trial):
+            trial.embedding_vector = generate_embedding(f"{trial.title} {' '.join(trial.conditions)}")
+            trial.save(update_fields=["embedding_vector"])
+        second_patient = PatientProfile.objects.create(
+            patient_code="PAT-9004",
+            organization=self.org,
+            full_name="Second Batch Patient",
+            age=52,
+            sex="female",
+            city="Lahore",
+            country="Pakistan",
+            language="English",
+            diagnosis="HER2+ Breast Cancer",
+            story="HER2 positive metastatic breast cancer after two lines of therapy.",
+            contact_channel="email",
+            contact_value="second.batch@example.com",
+            consent=True,
+        )
+        patients = [self.patient, second_patient]
+        for patient in patients:
+            patient.embedding_vector = generate_embedding(patient.story)
+
+        candidates = _candidate_trials_for_patients(patients)
+
+        self.assertEqual(set(candidates), {self.patient.id, second_patient.id})
+        first_trials = {candidate.trial.id: candidate.trial for candidate in candidates[self.patient.id]}
+        second_trials = {candidate.trial.id: candidate.trial for candidate in candidates[second_patient.id]}
+        self.assertIn(self.matching_trial.id, first_trials)
+        self.assertIs(first_trials[self.matching_trial.id], second_trials[self.matching_trial.id])
+
+    def test_in_memory_retrieval_matches_pgvector_ranking(self):
+        for trial in (self.matching_trial, self.unrelated_trial):
+            trial.embedding_vector = generate_embedding(f"{trial.title} {' '.join(trial.conditions)}")
+            trial.save(update_fields=["embedding_vector", "updated_at"])
+        clear_trial_matrix()
+        vectors = {self.patient.id: generate_embedding(self.patient.story)}
+
+        in_memory = nearest_trial_ids_in_memory(vectors, ["RECRUITING"], 10)
+        database = nearest_trial_ids_for_vectors(vectors, ["RECRUITING"], 10)
+
+        self.assertEqual(
+            [trial_id for trial_id, _ in in_memory[self.patient.id]],
+            [trial_id for trial_id, _ in database[self.patient.id]],
+        )
+        for (_, memory_distance), (_, db_distance) in zip(in_memory[self.patient.id], database[self.patient.id]):
+            self.assertAlmostEqual(memory_distance, db_distance, places=4)
+
     def test_engine_skips_gibberish_story(self):
         gibberish_patient = PatientProfile.objects.create(
             patient_code="PAT-9002",
@@ -130,7 +355,10 @@ class MatchingEngineTests(TestCase):
             diagnosis="",
             stage="",
             story="I have severe scoliosis and severe headache. I also have skin cancer.",
-            structured_profile={"markers": [], "raw_story": "I have severe scoliosis and severe headache. I also have skin cancer."},
+            structured_profile={
+                "markers": [],
+                "raw_story": "I have severe scoliosis and severe headache. I also have skin cancer.",
+            },
             contact_channel="email",
             contact_value="low.relevance@example.com",
             consent=True,
@@ -140,3 +368,288 @@ class MatchingEngineTests(TestCase):
         updates = evaluate_patient_against_trials(weak_signal_patient)
         self.assertEqual(updates, 0)
         self.assertFalse(MatchEvaluation.objects.filter(patient=weak_signal_patient).exists())
+
+    @override_settings(
+        MATCH_EXPLANATION_MODE="deferred",
+        LLM_MODE="gemini",
+        GEMINI_API_KEY="test-key",
+        LLM_EXPLANATION_CACHE_TTL_SECONDS=0,
+        LLM_PATIENT_BATCH_SIZE=1,
+    )
+    def test_deferred_explanations_are_queued_on_commit_and_filled_in(self):
+        with (
+            patch("apps.matching.services.engine.enqueue_match_explanations") as enqueue_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            updates = evaluate_patient_against_trials(self.patient)
+
+        self.assertGreaterEqual(updates, 1)
+        jobs = enqueue_mock.call_args.args[0]
+        self.assertEqual(len(jobs), updates)
+        pending = MatchEvaluation.objects.get(patient=self.patient, trial=self.matching_trial)
+        self.assertEqual(pending.explanation_state, ExplanationState.PENDING)
+        self.assertEqual(pending.explanation_model, "deterministic-fallback")
+
+        llm_response = {
+            "plain_language_summary": "Strong HER2 overlap.",
+            "reasons_matched": ["HER2 positive"],
+            "reasons_failed": [],
+            "missing_info": [],
+            "doctor_checklist": [],
+            "overall_status": "Possibly Eligible",
+            "confidence": 0.8,
+            "model": "gemini:test",
+            "provider": "gemini",
+        }
+        with patch("apps.matching.services.explanation._generate_with_gemini", return_value=llm_response):
+            result = explain_deferred_matches(jobs)
+            repeated = explain_deferred_matches(jobs)
+
+        self.assertEqual(result, {"explained": updates, "skipped": 0})
+        self.assertEqual(repeated, {"explained": 0, "skipped": updates})
+        explained = MatchEvaluation.objects.get(id=pending.id)
+        self.assertEqual(explained.explanation_state, ExplanationState.COMPLETE)
+        self.assertEqual(explained.explanation_summary, "Strong HER2 overlap.")
+        self.assertEqual(explained.explanation_model, "gemini:test")
+        self.assertEqual(explained.eligibility_score, pending.eligibility_score)
+
+    @override_settings(MATCH_EXPLANATION_MODE="deferred", LLM_MODE="fallback")
+    def test_deferred_explanation_skips_reevaluated_match(self):
+        with (
+            patch("apps.matching.services.engine.enqueue_match_explanations") as enqueue_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            evaluate_patient_against_trials(self.patient)
+        jobs = enqueue_mock.call_args.args[0]
+        MatchEvaluation.objects.filter(patient=self.patient).update(patient_fingerprint="changed")
+
+        result = explain_deferred_matches(jobs)
+
+        self.assertEqual(result["explained"], 0)
+        self.assertFalse(
+            MatchEvaluation.objects.filter(patient=self.patient)
+            .exclude(explanation_state=ExplanationState.PENDING)
+            .exists()
+        )
+
+    @override_settings(MATCH_EXPLANATION_MODE="deferred", LLM_MODE="fallback")
+    def test_deferred_rerun_keeps_complete_explanation_of_unchanged_match(self):
+        with (
+            patch("apps.matching.services.engine.enqueue_match_explanations"),
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            evaluate_patient_against_trials(self.patient)
+        MatchEvaluation.objects.filter(patient=self.patient).update(
+            explanation_state=ExplanationState.COMPLETE,
+            explanation_summary="Strong HER2 overlap.",
+            explanation_model="gemini:test",
+        )
+
+        llm_state = {}
+        with (
+            patch("apps.matching.services.engine.enqueue_match_explanations") as enqueue_mock,
+            self.captureOnCommitCallbacks(execute=True),
+        ):
+            updates = evaluate_patient_against_trials(self.patient, llm_state=llm_state)
+
+        self.assertGreaterEqual(updates, 1)
+        enqueue_mock.assert_not_called()
+        self.assertEqual(llm_state.get("explanations_queued", 0), 0)
+        kept = MatchEvaluation.objects.get(patient=self.patient, trial=self.matching_trial)
+        self.assertEqual(kept.explanation_state, ExplanationState.COMPLETE)
+        self.assertEqual(kept.explanation_summary, "Strong HER2 overlap.")
+        self.assertEqual(kept.explanation_model, "gemini:test")
+
+    @override_settings(MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0", LLM_MODE="fallback")
+    def test_shard_holds_shared_matching_lock_while_evaluating(self):
+        run = MatchingRun.objects.create(
+            run_type="manual", status="running", metadata={"mode": "sharded", "explanation_mode": "inline"}
+        )
+        held_locks = []
+
+        def advisory_locks():
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT mode FROM pg_locks WHERE locktype = 'advisory' AND pid = pg_backend_pid()")
+                return [row[0] for row in cursor.fetchall()]
+
+        def evaluate(*args, **kwargs):
+            held_locks.extend(advisory_locks())
+            return 2, 1, {}
+
+        with patch("apps.matching.services.engine._evaluate_patient_iterable", side_effect=evaluate):
+            result = run_matching_shard(run.id, 0, self.patient.id, self.patient.id)
+
+        self.assertEqual(held_locks, ["ShareLock"])
+        self.assertEqual(advisory_locks(), [])
+        self.assertEqual((result["updates"], result["processed_patients"]), (2, 1))
+        run.refresh_from_db()
+        self.assertEqual(run.metadata["shard_progress"]["0"]["status"], "completed")
+
+    @override_settings(MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0", LLM_MODE="fallback")
+    def test_shard_evaluates_its_id_range(self):
+        run = MatchingRun.objects.create(
+            run_type="manual", status="running", metadata={"mode": "sharded", "explanation_mode": "inline"}
+        )
+
+        result = run_matching_shard(run.id, 0, self.patient.id, self.patient.id)
+
+        self.assertNotIn("error", result)
+        self.assertEqual(result["processed_patients"], 1)
+        self.assertTrue(MatchEvaluation.objects.filter(patient=self.patient).exists())
+
+    def test_shard_skips_run_that_is_not_running(self):
+        run = MatchingRun.objects.create(run_type="manual", status="stopped", metadata={"mode": "sharded"})
+
+        result = run_matching_shard(run.id, 0, self.patient.id, self.patient.id)
+
+        self.assertEqual(result["reason"], "run_not_running")
+        self.assertFalse(MatchEvaluation.objects.filter(patient=self.patient).exists())
+
+    @override_settings(MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0")
+    def test_finalize_merges_shard_metadata_and_completes_run(self):
+        run = MatchingRun.objects.create(
+            run_type="manual",
+            status="running",
+            metadata={"mode": "sharded", "explanation_mode": "inline", "patients": 3, "shard_count": 2},
+        )
+
+        finalized = finalize_sharded_matching_run(
+            [
+                {"shard": 0, "updates": 2, "processed_patients": 2, "llm_cache_hits": 1, "embedding_requests": 1},
+                {"shard": 1, "updates": 1, "processed_patients": 1, "llm_cache_hits": 2},
+            ],
+            run.id,
+        )
+
+        self.assertEqual(finalized.status, "completed")
+        self.assertIsNotNone(finalized.finished_at)
+        self.assertEqual(finalized.metadata["updates"], 3)
+        self.assertEqual(finalized.metadata["processed_patients"], 3)
+        self.assertEqual(finalized.metadata["llm_cache_hits"], 3)
+        self.assertEqual(finalized.metadata["embedding_requests"], 1)
+        self.assertEqual(finalized.metadata["patients"], 3)
+
+    @override_settings(MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0")
+    def test_finalize_marks_run_failed_when_a_shard_errored(self):
+        run = MatchingRun.objects.create(
+            run_type="manual", status="running", metadata={"mode": "sharded", "explanation_mode": "inline"}
+        )
+
+        finalized = finalize_sharded_matching_run(
+            [{"shard": 0, "updates": 1, "processed_patients": 1}, {"shard": 1, "error": "boom"}], run.id
+        )
+
+        self.assertEqual(finalized.status, "failed")
+        self.assertEqual(finalized.metadata["shard_errors"], [{"shard": 1, "error": "boom"}])
+        self.assertEqual(finalized.metadata["updates"], 1)
+
+
+class MatchingShardPlanTests(SimpleTestCase):
+    def test_plans_inclusive_id_ranges_per_shard(self):
+        shards = plan_patient_shards([3, 4, 9, 10, 11, 25, 40], shard_size=3)
+        self.assertEqual(shards, [(3, 9), (10, 25), (40, 40)])
+
+    def test_plans_no_shards_without_patients(self):
+        self.assertEqual(plan_patient_shards([], shard_size=100), [])
+
+    def test_local_llm_budget_stops_at_limit(self):
+        llm_state = {"used": 0, "budget": 2}
+        granted = [_consume_llm_budget(llm_state) for _ in range(3)]
+        self.assertEqual(granted, [True, True, False])
+        self.assertEqual(llm_state["used"], 2)
+
+        _release_llm_budget(llm_state)
+        self.assertTrue(_consume_llm_budget(llm_state))
+
+    def test_incremental_command_rejects_sharded_mode(self):
+        with (
+            patch("apps.matching.management.commands.run_matching.run_full_matching_cycle") as run_mock,
+            self.assertRaises(CommandError),
+        ):
+            call_command("run_matching", "--incremental", "--mode", "sharded")
+        run_mock.assert_not_called()
+
+
+@override_settings(MATCH_PROGRESS_REDIS_URL="redis://127.0.0.1:1/0")
+class MatchingProgressChannelTests(SimpleTestCase):
+    def setUp(self):
+        progress._client = None
+        progress._unavailable_until = 0.0
+
+    def tearDown(self):
+        progress._client = None
+        progress._unavailable_until = 0.0
+
+    @patch("apps.matching.services.progress._database_stop_requested", return_value=True)
+    def test_unreachable_redis_defers_to_database(self, database_stop):
+        channel = progress.RunProgressChannel(1)
+        channel.record(3)
+
+        self.assertTrue(channel.stop_requested())
+        self.assertEqual(progress.read_run_progress(1), {})
+        self.assertGreater(progress._unavailable_until, 0.0)
+        database_stop.assert_called_once_with(1)
+
+    @patch("apps.matching.services.progress._database_stop_requested", return_value=True)
+    def test_database_stop_is_republished_after_redis_recovers(self, database_stop):
+        client = MagicMock()
+        client.exists.return_value = 0
+        progress._client = client
+        channel = progress.RunProgressChannel(1)
+
+        self.assertTrue(channel.stop_requested())
+        client.set.assert_called_once()
+        self.assertEqual(client.set.call_args.args[0], "matching:run:1:stop")
+
+    @patch("apps.matching.services.progress._database_stop_requested", return_value=False)
+    def test_database_stop_flag_is_polled_while_redis_is_up(self, database_stop):
+        client = MagicMock()
+        client.exists.return_value = 0
+        progress._client = client
+        channel = progress.RunProgressChannel(1)
+
+        self.assertFalse(channel.stop_requested())
+        self.assertFalse(channel.stop_requested())
+        self.assertEqual(database_stop.call_count, 1)
+
+
+@override_settings(MATCH_SITE_NEAR_KM=200, MATCH_SITE_REGION_KM=500)
+class SiteIndexFeasibilityTests(SimpleTestCase):
+    def setUp(self):
+        self.index = SiteIndex(
+            {1: None, 2: None},
+            [
+                (1, "Karachi", "Pakistan", 24.86, 67.00),
+                (2, "Hyderabad", "Pakistan", 25.39, 68.37),
+            ],
+        )
+        self.patient = PatientProfile(city=" karachi ", country="PAKISTAN")
+
+    def test_same_city_site_scores_highest(self):
+        score, _ = _indexed_location_feasibility(self.index, self.patient, Trial(id=1))
+        self.assertEqual(score, 1.0)
+
+    def test_nearby_site_scores_distance_tier(self):
+        score, reason = _indexed_location_feasibility(self.index, self.patient, Trial(id=2))
+        self.assertEqual(score, 0.9)
+        self.assertIn("150 km", reason)
+
+
+class VectorPrecisionTests(SimpleTestCase):
+    @override_settings(MATCH_VECTOR_PRECISION="full")
+    def test_full_precision_compares_vectors(self):
+        self.assertEqual(
+            cosine_distance_sql("t.embedding_vector", "q.embedding", 384), "t.embedding_vector <=> q.embedding::vector"
+        )
+        query = PatientProfile.objects.annotate(distance=cosine_distance(PatientProfile, [1.0] * 384)).query
+        self.assertNotIn("halfvec", str(query))
+
+    @override_settings(MATCH_VECTOR_PRECISION="half")
+    def test_half_precision_casts_both_sides_like_the_index(self):
+        self.assertEqual(
+            cosine_distance_sql("t.embedding_vector", "q.embedding", 384),
+            "t.embedding_vector::halfvec(384) <=> q.embedding::halfvec(384)",
+        )
+        query = str(PatientProfile.objects.annotate(distance=cosine_distance(PatientProfile, [1.0] * 384)).query)
+        self.assertIn('("patients_patientprofile"."embedding_vector")::halfvec(384) <=>', query)
+        self.assertEqual(query.count("::halfvec(384)"), 2)
@@ -0,0 +1,352 @@
+import json
+import threading
+import time
+from unittest.mock import patch
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.core.services.rate_limiter import RateLimitedError
+from apps.matching.models import ExplanationCacheEntry
+from apps.matching.services.explanation import generate_explanation, generate_explanations
+from apps.matching.services.explanation_cache import prune_explanation_cache, store_explanation
+from apps.matching.services.prompt_compaction import (
+    compact_patient_payload,
+    compact_trial_payload,
+    criteria_lines,
+    estimate_tokens,
+)
+
+RULE_RESULT = {
+    "reasons_matched": ["Diagnosis profile overlaps with trial condition focus"],
+    "reasons_failed": [],
+    "missing_info": [],
+    "doctor_checklist": [],
+    "overall_status": "Possibly Eligible",
+    "confidence": 0.7,
+}
+LLM_RESPONSE = {
+    "plain_language_summary": "Likely relevant trial.",
+    "reasons_matched": [],
+    "reasons_failed": [],
+    "missing_info": [],
+    "doctor_checklist": [],
+    "overall_status": "Possibly Eligible",
+    "confidence": 0.8,
+    "model": "gemini:test",
+    "provider": "gemini",
+}
+
+
+@override_settings(LLM_MODE="gemini", GEMINI_API_KEY="test-key", GEMINI_MODEL="test")
+class ExplanationCacheTests(TestCase):
+    @patch("apps.matching.services.explanation._generate_with_gemini", return_value=LLM_RESPONSE)
+    def test_cache_hit_skips_provider_and_budget(self, generate_mock):
+        reservations = []
+
+        def reserve():
+            reservations.append(1)
+            return True
+
+        first = generate_explanation({"name": "A"}, {"trial_id": "NCT-1"}, RULE_RESULT, reserve_llm_call=reserve)
+        second = generate_explanation({"name": "A"}, {"trial_id": "NCT-1"}, RULE_RESULT, reserve_llm_call=reserve)
+
+        self.assertEqual(first["cache_status"], "miss")
+        self.assertEqual(second["cache_status"], "hit")
+        self.assertEqual(second["plain_language_summary"], LLM_RESPONSE["plain_language_summary"])
+        self.assertEqual(generate_mock.call_count, 1)
+        self.assertEqual(len(reservations), 1)
+        self.assertEqual(ExplanationCacheEntry.objects.get().hit_count, 1)
+
+    @patch("apps.matching.services.explanation._generate_with_gemini", return_value=LLM_RESPONSE)
+    def test_exhausted_budget_falls_back_on_cache_miss(self, generate_mock):
+        result = generate_explanation({"name": "B"}, {"trial_id": "NCT-2"}, RULE_RESULT, reserve_llm_call=lambda: False)
+
+        self.assertEqual(result["fallback_reason"], "llm_budget_reached")
+        generate_mock.assert_not_called()
+
+    @override_settings(LLM_EXPLANATION_CACHE_MAX_ENTRIES=2)
+    def test_prune_evicts_least_recently_used(self):
+        for index in range(4):
+            store_explanation(f"{index:064d}", "gemini", "gemini:test", LLM_RESPONSE)
+
+        self.assertEqual(prune_explanation_cache(), 2)
+        self.assertEqual(
+            sorted(ExplanationCacheEntry.objects.values_list("key", flat=True)),
+            [f"{index:064d}" for index in (2, 3)],
+        )
+
+
+@override_settings(
+    LLM_MODE="gemini",
+    GEMINI_API_KEY="test-key",
+    LLM_EXPLANATION_CACHE_TTL_SECONDS=0,
+    LLM_GEMINI_MAX_CONCURRENCY=3,
+    LLM_BATCH_TIMEOUT_SECONDS=10,
+    LLM_PATIENT_BATCH_SIZE=1,
+)
+class ConcurrentExplanationTests(SimpleTestCase):
+    def test_requests_run_concurrently_within_provider_limit(self):
+        lock = threading.Lock()
+        state = {"active": 0, "peak": 0}
+
+        def slow_gemini(prompt, rule_result):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.1)
+            with lock:
+                state["active"] -= 1
+            if "NCT-FAIL" in prompt:
+                raise RuntimeError("provider error")
+            return {**LLM_RESPONSE, "plain_language_summary": prompt.split("NCT-")[1][:1]}
+
+        trial_ids = ["NCT-1", "NCT-2", "NCT-FAIL", "NCT-4", "NCT-5", "NCT-6"]
+        items = [({"name": "A"}, {"trial_id": trial_id}, RULE_RESULT) for trial_id in trial_ids]
+        with patch("apps.matching.services.explanation._generate_with_gemini", side_effect=slow_gemini):
+            results = generate_explanations(items)
+
+        self.assertEqual(state["peak"], 3)
+        self.assertEqual([result.get("plain_language_summary") for result in results][:2], ["1", "2"])
+        self.assertEqual(results[2]["fallback_reason"], "gemini_request_failed")
+        self.assertEqual([result["plain_language_summary"] for result in results[3:]], ["4", "5", "6"])
+
+    def test_budget_is_reserved_per_uncached_item(self):
+        allowed = iter([True, False])
+        items = [({"name": "A"}, {"trial_id": f"NCT-{index}"}, RULE_RESULT) for index in range(2)]
+        with patch("apps.matching.services.explanation._generate_with_gemini", return_value=LLM_RESPONSE):
+            results = generate_explanations(items, reserve_llm_call=lambda: next(allowed))
+
+        self.assertEqual(results[0]["cache_status"], "miss")
+        self.assertEqual(results[1]["fallback_reason"], "llm_budget_reached")
+
+    def test_rate_limited_provider_falls_back(self):
+        items = [({"name": "A"}, {"trial_id": f"NCT-{index}"}, RULE_RESULT) for index in range(2)]
+        with (
+            patch(
+                "apps.matching.services.explanation.require_llm_capacity",
+                side_effect=RateLimitedError("gemini", "test"),
+            ),
+            patch("apps.matching.services.explanation.http_post") as post,
+        ):
+            results = generate_explanations(items)
+
+        self.assertEqual({result["fallback_reason"] for result in results}, {"llm_rate_limited"})
+        post.assert_not_called()
+
+    def test_rate_limited_request_releases_its_reservation(self):
+        budget = {"reserved": 0, "released": 0}
+        items = [({"name": "A"}, {"trial_id": f"NCT-{index}"}, RULE_RESULT) for index in range(2)]
+
+        def gemini(prompt, rule_result):
+            if "NCT-1" in prompt:
+                raise RateLimitedError("gemini", "test")
+            return LLM_RESPONSE
+
+        with patch("apps.matching.services.explanation._generate_with_gemini", side_effect=gemini):
+            results = generate_explanations(
+                items,
+                reserve_llm_call=lambda: budget.update(reserved=budget["reserved"] + 1) or True,
+                release_llm_call=lambda: budget.update(released=budget["released"] + 1),
+            )
+
+        self.assertEqual(results[0]["cache_status"], "miss")
+        self.assertEqual(results[1]["fallback_reason"], "llm_rate_limited")
+        self.assertEqual(budget, {"reserved": 2, "released": 1})
+
+
+@override_settings(
+    LLM_MODE="gemini",
+    GEMINI_API_KEY="test-key",
+    LLM_EXPLANATION_CACHE_TTL_SECONDS=0,
+    LLM_PATIENT_BATCH_SIZE=3,
+)
+class BatchedPromptTests(SimpleTestCase):
+    def _items(self, patients):
+        return [
+            ({"name": name}, {"trial_id": f"NCT-{name}{index}"}, RULE_RESULT)
+            for name, count in patients
+            for index in range(count)
+        ]
+
+    def _batch_text(self, trial_ids):
+        return json.dumps(
+            [
+                {**LLM_RESPONSE, "trial_id": trial_id, "plain_language_summary": f"About {trial_id}"}
+                for trial_id in trial_ids
+            ]
+        )
+
+    def test_one_request_per_patient_chunk(self):
+        prompts = []
+
+        def gemini_text(prompt, max_output_tokens):
+            prompts.append(prompt)
+            trials = json.loads(prompt.split("rule evaluation:\n", 1)[1].split("\n\nRules:", 1)[0])
+            return self._batch_text([trial["trial"]["trial_id"] for trial in trials])
+
+        reservations = []
+        with (
+            patch("apps.matching.services.explanation._request_gemini_text", side_effect=gemini_text),
+            patch("apps.matching.services.explanation._generate_with_gemini", return_value=LLM_RESPONSE) as single,
+        ):
+            results = generate_explanations(
+                self._items([("A", 4), ("B", 2)]),
+                reserve_llm_call=lambda: reservations.append(1) or True,
+            )
+
+        # A: one batch of 3 and a single; B: one batch of 2.
+        self.assertEqual(len(prompts), 2)
+        self.assertEqual(single.call_count, 1)
+        self.assertEqual(len(reservations), 3)
+        self.assertTrue(all(prompt.count('"name": ') == 1 for prompt in prompts))
+        self.assertEqual(results[0]["plain_language_summary"], "About NCT-A0")
+        self.assertEqual(results[5]["plain_language_summary"], "About NCT-B1")
+
+    def test_partial_batch_response_falls_back_per_trial(self):
+        text = (
+            "```json\n"
+            + json.dumps(
+                [
+                    {**LLM_RESPONSE, "trial_id": "NCT-A1", "plain_language_summary": "Second"},
+                    {**LLM_RESPONSE, "trial_id": "NCT-A0", "plain_language_summary": "First"},
+                    {**LLM_RESPONSE, "trial_id": "NCT-A2", "plain_language_summary": ""},
+                ]
+            )
+            + "\n```"
+        )
+        with patch("apps.matching.services.explanation._request_gemini_text", return_value=text):
+            results = generate_explanations(self._items([("A", 3)]))
+
+        self.assertEqual([result["plain_language_summary"] for result in results[:2]], ["First", "Second"])
+        self.assertEqual(results[2]["fallback_reason"], "gemini_batch_item_invalid")
+
+    def test_missing_batch_item_keeps_results_aligned_with_input(self):
+        # The provider answers for the first trial only.
+        responses = [{**LLM_RESPONSE, "plain_language_summary": "First"}]
+        with patch("apps.matching.services.explanation._generate_batch_with_gemini", return_value=responses):
+            results = generate_explanations(self._items([("A", 2)]))
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results[0]["plain_language_summary"], "First")
+        self.assertEqual(results[1]["fallback_reason"], "gemini_batch_item_invalid")
+
+    def test_unparseable_batch_response_falls_back_for_every_trial(self):
+        with patch("apps.matching.services.explanation._request_gemini_text", return_value="not json"):
+            results = generate_explanations(self._items([("A", 2)]))
+
+        self.assertEqual({result["fallback_reason"] for result in results}, {"gemini_request_failed"})
+
+
+@override_settings(
+    LLM_MODE="auto",
+    GEMINI_API_KEY="test-key",
+    HF_API_TOKEN="hf-token",
+    HF_LLM_ENDPOINT="https://hf.example/model",
+    LLM_EXPLANATION_CACHE_TTL_SECONDS=0,
+    LLM_PATIENT_BATCH_SIZE=1,
+    LLM_HEDGING=True,
+)
+@patch("apps.matching.services.explanation._hedge_delay", return_value=0.05)
+class HedgedRequestTests(SimpleTestCase):
+    def _explain(self, gemini_delay, hf_error=None):
+        def gemini(prompt, rule_result):
+            time.sleep(gemini_delay)
+            return LLM_RESPONSE
+
+        def hf(prompt, rule_result):
+            if hf_error:
+                raise hf_error
+            return {**LLM_RESPONSE, "provider": "huggingface", "model": "hf"}
+
+        reservations = []
+        with (
+            patch("apps.matching.services.explanation._generate_with_gemini", side_effect=gemini),
+            patch("apps.matching.services.explanation._generate_with_hf", side_effect=hf),
+        ):
+            results = generate_explanations(
+                [({"name": "A"}, {"trial_id": "NCT-1"}, RULE_RESULT)],
+                reserve_llm_call=lambda: reservations.append(1) or True,
+            )
+        return results[0], len(reservations)
+
+    def test_slow_primary_is_hedged_and_faster_provider_wins(self, _delay):
+        result, reservations = self._explain(gemini_delay=0.5)
+
+        self.assertEqual(result["provider"], "huggingface")
+        self.assertEqual(result["hedge"], {"providers": ["gemini", "huggingface"], "winner": "huggingface"})
+        self.assertEqual(reservations, 2)
+
+    def test_fast_primary_is_not_hedged(self, _delay):
+        result, reservations = self._explain(gemini_delay=0)
+
+        self.assertEqual(result["provider"], "gemini")
+        self.assertNotIn("hedge", result)
+        self.assertEqual(reservations, 1)
+
+    def test_failed_hedge_waits_for_primary(self, _delay):
+        result, _ = self._explain(gemini_delay=0.2, hf_error=RuntimeError("hf down"))
+
+        self.assertEqual(result["provider"], "gemini")
+        self.assertEqual(result["hedge"]["winner"], "gemini")
+
+
+CTGOV_CRITERIA = "\n".join(
+    ["Inclusion Criteria:", "", "* Age >= 18 years", "* HER2-positive disease", "* ECOG 0-1"]
+    + [f"* Willing to comply with study visit schedule item {index}" for index in range(80)]
+    + ["", "Exclusion Criteria:", "", "* Active CNS metastases", "* Prior T-DXd therapy"]
+)
+
+
+@override_settings(LLM_PROMPT_PATIENT_TOKENS=120, LLM_PROMPT_TRIAL_TOKENS=200)
+class PromptCompactionTests(SimpleTestCase):
+    def test_criteria_lines_split_ctgov_sections(self):
+        inclusion, exclusion = criteria_lines(CTGOV_CRITERIA)
+
+        self.assertEqual(inclusion[:3], ["Age >= 18 years", "HER2-positive disease", "ECOG 0-1"])
+        self.assertEqual(exclusion, ["Active CNS metastases", "Prior T-DXd therapy"])
+
+    def test_trial_payload_fits_budget_and_keeps_threshold_criteria(self):
+        payload = {
+            "trial_id": "NCT-LONG",
+            "title": "HER2 study",
+            "inclusion_text": CTGOV_CRITERIA,
+            "exclusion_text": "",
+        }
+
+        compacted = compact_trial_payload(payload)
+
+        self.assertLessEqual(estimate_tokens(compacted), 200)
+        self.assertEqual(compacted["trial_id"], "NCT-LONG")
+        self.assertEqual(compacted["inclusion_criteria"][:3], ["Age >= 18 years", "HER2-positive disease", "ECOG 0-1"])
+        self.assertTrue(compacted["inclusion_criteria"][-1].endswith("more omitted]"))
+        self.assertNotIn("inclusion_text", compacted)
+
+    def test_patient_payload_drops_repeated_story(self):
+        story = "Metastatic HER2 positive breast cancer after trastuzumab."
+        payload = {
+            "diagnosis": "HER2+ Breast Cancer",
+            "story": story,
+            "structured_profile": {
+                "diagnosis": "HER2+ Breast Cancer",
+                "markers": ["her2"],
+                "raw_story": story,
+                "clean_story": f"  {story}",
+                "symptoms": [],
+            },
+        }
+
+        compacted = compact_patient_payload(payload)
+
+        self.assertEqual(compacted["story"], story)
+        self.assertEqual(compacted["structured_profile"], {"markers": ["her2"]})
+
+    @override_settings(LLM_MODE="gemini", GEMINI_API_KEY="test-key", LLM_EXPLANATION_CACHE_TTL_SECONDS=0)
+    def test_provider_result_reports_token_estimates(self):
+        trial = {"trial_id": "NCT-LONG", "inclusion_text": CTGOV_CRITERIA}
+        with patch("apps.matching.services.explanation._generate_with_gemini", return_value=LLM_RESPONSE) as gemini:
+            result = generate_explanation({"name": "A"}, trial, RULE_RESULT)
+
+        prompt = gemini.call_args.args[0]
+        self.assertNotIn("item 79", prompt)
+        self.assertLess(result["prompt_tokens"]["compacted"], result["prompt_tokens"]["original"])
+        self.assertEqual(result["prompt_tokens"]["compacted"], estimate_tokens(prompt))
@@ -0,0 +1,145 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from apps.core.models import Organization
+from apps.core.services.embedding import Embedding, current_embedding_version, embed_texts
+from apps.matching.models import EmbeddingBackfill
+from apps.matching.services.engine import _candidate_trials_for_patients
+from apps.matching.services.reembed import backfill_shadow_embeddings, stale_rows, swap_shadow_embeddings
+from apps.matching.services.retrieval import clear_trial_matrix
+from apps.patients.models import PatientProfile
+from apps.trials.models import Trial
+
+
+class ReembedTests(TestCase):
+    def setUp(self):
+        clear_trial_matrix()
+        self.addCleanup(clear_trial_matrix)
+        self.org = Organization.objects.create(name="Reembed Org", slug="reembed-org", score_weights={})
+        self.trials = [
+            Trial.objects.create(
+                trial_id=f"NCT-REEMBED-{index}",
+                title=f"HER2 Positive Breast Cancer Trial {index}",
+                status="RECRUITING",
+                conditions=["Breast Cancer"],
+                embedding_text=f"HER2 positive breast cancer trial {index}",
+                embedding_vector=[1.0] + [0.0] * 383,
+                embedding_version="legacy/384",
+            )
+            for index in range(5)
+        ]
+        self.patient = PatientProfile.objects.create(
+            patient_code="PAT-REEMBED",
+            organization=self.org,
+            full_name="Reembed Patient",
+            age=50,
+            sex="female",
+            city="Karachi",
+            country="Pakistan",
+            language="English",
+            diagnosis="HER2+ Breast Cancer",
+            story="HER2 positive metastatic breast cancer.",
+            contact_channel="email",
+            contact_value="reembed@example.com",
+            consent=True,
+            embedding_vector=[1.0] + [0.0] * 383,
+            embedding_version="legacy/384",
+        )
+        self.version = current_embedding_version()
+
+    def test_backfill_writes_shadow_columns_until_swap(self):
+        backfill = backfill_shadow_embeddings("trials", batch_size=2)
+
+        self.assertEqual((backfill.embedded, backfill.failed), (5, 0))
+        self.assertEqual(backfill.last_id, self.trials[-1].id)
+        self.assertEqual(Trial.objects.filter(embedding_version="legacy/384").count(), 5)
+        self.assertEqual(Trial.objects.filter(embedding_version_next=self.version).count(), 5)
+
+        swap_shadow_embeddings([backfill])
+
+        trial = Trial.objects.get(id=self.trials[0].id)
+        self.assertEqual(trial.embedding_version, self.version)
+        self.assertEqual(list(trial.embedding_vector), embed_texts([trial.embedding_text])[0].vector)
+        self.assertIsNone(trial.embedding_vector_next)
+        self.assertEqual(trial.embedding_version_next, "")
+        self.assertIsNotNone(EmbeddingBackfill.objects.get(id=backfill.id).completed_at)
+        self.assertFalse(stale_rows("trials", self.version).exists())
+
+    def test_interrupted_backfill_resumes_after_checkpoint(self):
+        calls = []
+
+        def fail_on_second_batch(texts, stats=None):
+            calls.append(len(texts))
+            if len(calls) == 2:
+                raise RuntimeError("worker killed")
+            return embed_texts(texts, stats=stats)
+
+        with patch("apps.matching.services.reembed.embed_texts", side_effect=fail_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                backfill_shadow_embeddings("trials", batch_size=2)
+
+        checkpoint = EmbeddingBackfill.objects.get(target="trials", version=self.version)
+        self.assertEqual(checkpoint.last_id, self.trials[1].id)
+
+        with patch("apps.matching.services.reembed.embed_texts", wraps=embed_texts) as resumed:
+            backfill = backfill_shadow_embeddings("trials", batch_size=2)
+
+        self.assertEqual(backfill.id, checkpoint.id)
+        self.assertEqual(sum(len(call.args[0]) for call in resumed.call_args_list), 3)
+        self.assertEqual(backfill.embedded, 5)
+
+    def test_fallback_vectors_are_left_stale(self):
+        with patch(
+            "apps.matching.services.reembed.embed_texts",
+            side_effect=lambda texts, stats=None: [Embedding([0.0] * 384, "other/384") for _ in texts],
+        ):
+            backfill = backfill_shadow_embeddings("patients", batch_size=10)
+        swap_shadow_embeddings([backfill])
+
+        self.assertEqual((backfill.embedded, backfill.failed, backfill.swapped), (0, 1, 0))
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.embedding_version, "legacy/384")
+
+    def test_rows_rewritten_during_backfill_keep_their_live_vector(self):
+        backfill = backfill_shadow_embeddings("patients", batch_size=10)
+        PatientProfile.objects.filter(id=self.patient.id).update(
+            embedding_vector=[0.0, 1.0] + [0.0] * 382, embedding_version=self.version
+        )
+
+        swap_shadow_embeddings([backfill])
+
+        self.patient.refresh_from_db()
+        self.assertEqual(backfill.swapped, 0)
+        self.assertEqual(list(self.patient.embedding_vector[:2]), [0.0, 1.0])
+
+    @override_settings(MATCH_TOP_K=10)
+    def test_retrieval_only_compares_matching_versions(self):
+        for engine in ("pgvector", "numpy"):
+            with self.subTest(engine=engine), self.settings(MATCH_RETRIEVAL_ENGINE=engine):
+                self.patient.embedding_version = "legacy/384"
+                vector_trials = {c.trial.id for c in _candidate_trials_for_patients([self.patient])[self.patient.id]}
+                self.assertEqual(vector_trials, {trial.id for trial in self.trials})
+
+                Trial.objects.filter(id__in=[trial.id for trial in self.trials[:3]]).update(embedding_version="new/384")
+                self.patient.embedding_version = "new/384"
+                candidates = _candidate_trials_for_patients([self.patient])[self.patient.id]
+                self.assertEqual({c.trial.id for c in candidates}, {trial.id for trial in self.trials[:3]})
+                self.assertTrue(all(candidate.similarity > 0.5 for candidate in candidates))
+                Trial.objects.update(embedding_version="legacy/384")
+
+    @override_settings(MATCH_TOP_K=10)
+    def test_unstamped_patient_matches_resynced_trials_until_reembed(self):
+        # A patient embedded before versions were stamped, against trials re-synced since.
+        PatientProfile.objects.filter(id=self.patient.id).update(embedding_version="")
+        Trial.objects.update(embedding_version=self.version)
+        patient = PatientProfile.objects.get(id=self.patient.id)
+
+        for engine in ("pgvector", "numpy"):
+            with self.subTest(engine=engine), self.settings(MATCH_RETRIEVAL_ENGINE=engine):
+                clear_trial_matrix()
+                candidates = _candidate_trials_for_patients([patient])[patient.id]
+                self.assertEqual({c.trial.id for c in candidates}, {trial.id for trial in self.trials})
+                self.assertTrue(all(candidate.similarity > 0.5 for candidate in candidates))
+
+        self.assertTrue(stale_rows("patients", self.version).filter(id=patient.id).exists())
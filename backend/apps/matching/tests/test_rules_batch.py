@@ -0,0 +1,150 @@
+import random
+
+from django.test import SimpleTestCase, override_settings
+
+from apps.core.models import Organization
+from apps.matching.services.engine import (
+    Candidate,
+    _evaluate_rules,
+    _evaluate_rules_batch,
+    _passes_relevance_gate,
+)
+from apps.matching.services.features import TrialFeatures, trial_features_source_hash
+from apps.patients.models import PatientProfile
+from apps.trials.models import Trial
+
+CONDITION_TOKENS = [
+    frozenset({"breast", "her2", "metastatic"}),
+    frozenset({"lung", "nsclc", "egfr"}),
+    frozenset({"atopic", "dermatitis"}),
+    frozenset(),
+]
+SEARCH_TEXTS = [
+    "her2 positive metastatic breast disease, ecog 0-1",
+    "egfr mutant lung adenocarcinoma with brca carriers excluded",
+    "localized skin disease",
+]
+SITE_LAYOUTS = [
+    ((("karachi", "pakistan"),), ("pakistan",)),
+    ((("lahore", "pakistan"), ("berlin", "germany")), ("pakistan", "germany")),
+    ((("berlin", "germany"),), ("germany",)),
+    ((), ("pakistan",)),
+    ((), ()),
+]
+AGE_WINDOWS = [(None, None), (18, None), (None, 65), (18, 70), (50, 80), (18, 40)]
+STATUSES = ["RECRUITING", "NOT_YET_RECRUITING", "ACTIVE_NOT_RECRUITING", "COMPLETED"]
+PATIENTS = [
+    {
+        "age": 47,
+        "sex": "female",
+        "diagnosis": "HER2+ Breast Cancer",
+        "stage": "Stage IV (Metastatic)",
+        "story": "Metastatic HER2 positive breast disease progressed after trastuzumab. ECOG 1. CBC normal.",
+        "markers": ["her2", "metastatic"],
+    },
+    {
+        "age": 72,
+        "sex": "male",
+        "diagnosis": "Non-small cell lung cancer",
+        "stage": "Stage III",
+        "story": "Advanced EGFR lung adenocarcinoma, creatinine stable.",
+        "markers": ["egfr"],
+    },
+    {
+        "age": 16,
+        "sex": "",
+        "diagnosis": "Atopic dermatitis",
+        "stage": "",
+        "story": "Teenager with persistent eczema flares.",
+        "markers": [],
+    },
+]
+WEIGHTS = [
+    None,
+    {"eligibility": 0.50, "feasibility": 0.25, "urgency": 0.20, "explainability": 0.05},
+    {"eligibility": "bad", "feasibility": -1, "urgency": 3},
+]
+
+
+def _trial(rng: random.Random, index: int) -> Trial:
+    site_locations, countries = rng.choice(SITE_LAYOUTS)
+    min_age, max_age = rng.choice(AGE_WINDOWS)
+    female_only = rng.random() < 0.3
+    trial = Trial(trial_id=f"NCT-PARITY-{index}", status=rng.choice(STATUSES))
+    features = TrialFeatures(
+        min_age=min_age,
+        max_age=max_age,
+        female_only=female_only,
+        male_only=not female_only and rng.random() < 0.2,
+        condition_tokens=rng.choice(CONDITION_TOKENS),
+        search_text=rng.choice(SEARCH_TEXTS),
+        site_locations=site_locations,
+        site_countries=frozenset(country for _, country in site_locations),
+        countries=countries,
+        source_hash=trial_features_source_hash(trial),
+    )
+    trial.rule_features = features.to_dict()
+    return trial
+
+
+class RuleBatchParityTests(SimpleTestCase):
+    def _assert_parity(self, patient: PatientProfile, candidates: list) -> int:
+        batch = _evaluate_rules_batch(patient, candidates)
+        self.assertEqual(len(batch), len(candidates))
+        for candidate, result in zip(candidates, batch):
+            scalar = _evaluate_rules(patient, candidate.trial, candidate.similarity)
+            expected = scalar if _passes_relevance_gate(scalar, candidate.similarity) else None
+            self.assertEqual(result, expected)
+        return sum(1 for result in batch if result is not None)
+
+    def test_batch_matches_scalar_rules_and_gate(self):
+        rng = random.Random(20240611)
+        passed = 0
+        total = 0
+        for weights in WEIGHTS:
+            organization = Organization(name="Parity Org", slug="parity-org", score_weights=weights)
+            for values in PATIENTS:
+                patient = PatientProfile(
+                    organization=organization,
+                    age=values["age"],
+                    sex=values["sex"],
+                    city=rng.choice(["Karachi", "Lahore", ""]),
+                    country=rng.choice(["Pakistan", "Germany", ""]),
+                    diagnosis=values["diagnosis"],
+                    stage=values["stage"],
+                    story=values["story"],
+                    structured_profile={"markers": values["markers"]},
+                    profile_completeness=rng.choice([0, 45, 95, 100]),
+                )
+                candidates = [
+                    Candidate(trial=_trial(rng, index), similarity=round(rng.uniform(0.3, 1.0), 6))
+                    for index in range(40)
+                ]
+                passed += self._assert_parity(patient, candidates)
+                total += len(candidates)
+        # The grid must exercise both sides of the relevance gate.
+        self.assertGreater(passed, 0)
+        self.assertLess(passed, total)
+
+    @override_settings(MATCH_MIN_ELIGIBILITY_SCORE=0, MATCH_MIN_CONDITION_OVERLAP=0.0, MATCH_MIN_VECTOR_SIMILARITY=0.0)
+    def test_batch_matches_scalar_with_open_gate(self):
+        rng = random.Random(7)
+        values = PATIENTS[0]
+        patient = PatientProfile(
+            organization=Organization(name="Parity Org", slug="parity-org"),
+            age=values["age"],
+            sex=values["sex"],
+            city="Karachi",
+            country="Pakistan",
+            diagnosis=values["diagnosis"],
+            stage=values["stage"],
+            story=values["story"],
+            structured_profile={"markers": values["markers"]},
+            profile_completeness=80,
+        )
+        candidates = [Candidate(trial=_trial(rng, index), similarity=rng.random()) for index in range(60)]
+        # Only the "unlikely" status still filters, so most pairs are materialized.
+        self.assertGreater(self._assert_parity(patient, candidates), 0)
+
+    def test_empty_candidate_set(self):
+        self.assertEqual(_evaluate_rules_batch(PatientProfile(age=40), []), [])
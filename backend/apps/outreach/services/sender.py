@@ -3,10 +3,10 @@ from __future__ import annotations
 from datetime import datetime
 from typing import Dict
 
-import requests
 from django.conf import settings
 from django.utils import timezone
 
+from apps.core.services.http_client import http_post
 from apps.matching.models import MatchEvaluation, OutreachStatus
 from apps.outreach.models import OutreachMessage
 
@@ -28,7 +28,9 @@ def _twilio_send(to_value: str, body: str, channel: str) -> Dict[str, str]:
     if channel == "whatsapp" and not from_value.startswith("whatsapp:"):
         from_value = f"whatsapp:{from_value}"
 
-    response = requests.post(
+    # Not idempotent: a resend could deliver the message twice, so only connect failures are retried.
+    response = http_post(
+        "twilio",
         f"{TWILIO_API_BASE}/Accounts/{account_sid}/Messages.json",
         auth=(account_sid, auth_token),
         data={
@@ -36,9 +38,7 @@ def _twilio_send(to_value: str, body: str, channel: str) -> Dict[str, str]:
             "To": target,
             "Body": body,
         },
-        timeout=20,
     )
-    response.raise_for_status()
     payload = response.json()
     return {"sid": payload.get("sid", ""), "status": payload.get("status", "queued")}
 
@@ -9,7 +9,7 @@ from django.core.management.base import BaseCommand
 from apps.core.models import Organization
 from apps.matching.services.engine import MatchingRunAlreadyRunningError, run_full_matching_cycle
 from apps.patients.models import ContactChannel, PatientProfile
-from apps.patients.services.profile import infer_structured_profile
+from apps.patients.services.profile import infer_history_profile
 from apps.trials.models import Trial
 
 
@@ -289,7 +289,7 @@ class Command(BaseCommand):
             full_name = f"{first} {last}"
             seed_profile = _build_seed_profile(mode, condition_pool)
 
-            structured = infer_structured_profile(seed_profile.story)
+            structured = infer_history_profile(seed_profile.story)
             diagnosis = structured.get("diagnosis") or seed_profile.diagnosis_hint
             stage = structured.get("stage") or seed_profile.stage_hint
 
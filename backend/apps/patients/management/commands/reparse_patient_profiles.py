@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.patients.models import PatientProfile
+from apps.patients.services.profile import apply_history_profile, combined_history_text, infer_history_profile
+from apps.patients.services.story_cache import prune_story_parse_cache
+
+
+class Command(BaseCommand):
+    help = "Re-parse patients' full history into a fresh structured profile, replacing incrementally merged ones."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--patient-id", type=int, action="append", default=[], help="Patient to re-parse (repeatable)."
+        )
+        parser.add_argument("--all", action="store_true", help="Re-parse every patient with a story.")
+        parser.add_argument(
+            "--incremental-only",
+            action="store_true",
+            help="With --all, only patients whose profile was last updated incrementally.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["patient_id"] and not options["all"]:
+            raise CommandError("Pass --patient-id or --all.")
+
+        patients = PatientProfile.objects.order_by("id")
+        if options["patient_id"]:
+            patients = patients.filter(id__in=options["patient_id"])
+        if options["incremental_only"]:
+            patients = patients.filter(structured_profile__history_parse="incremental")
+
+        reparsed = 0
+        for patient in patients.iterator(chunk_size=100):
+            combined_story = combined_history_text(patient)
+            if not combined_story:
+                continue
+            apply_history_profile(patient, combined_story, infer_history_profile(combined_story, full=True))
+            reparsed += 1
+
+        pruned = prune_story_parse_cache()
+        self.stdout.write(
+            self.style.SUCCESS(f"Re-parsed {reparsed} patient profile(s); pruned {pruned} cache entries.")
+        )
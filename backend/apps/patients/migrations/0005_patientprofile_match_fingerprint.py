@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0004_patienthistoryentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientprofile',
+            name='match_fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='match_similarity_floor',
+            field=models.FloatField(default=0.0),
+        ),
+    ]
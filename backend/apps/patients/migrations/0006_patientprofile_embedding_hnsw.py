@@ -0,0 +1,24 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:58
+
+import pgvector.django.indexes
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('patients', '0005_patientprofile_match_fingerprint'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='patientprofile',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_vector'], m=16, name='patient_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-16 23:33
+
+import pgvector.django.vector
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('patients', '0007_storyparsecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientprofile',
+            name='embedding_vector_next',
+            field=pgvector.django.vector.VectorField(blank=True, dimensions=384, null=True),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='embedding_version',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='patientprofile',
+            name='embedding_version_next',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
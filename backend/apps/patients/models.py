@@ -1,6 +1,6 @@
 from django.conf import settings
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 from apps.core.models import TimeStampedModel
 
@@ -41,6 +41,27 @@ class PatientProfile(TimeStampedModel):
 
     profile_completeness = models.PositiveSmallIntegerField(default=0)
     embedding_vector = VectorField(dimensions=384, null=True, blank=True)
+    # Model/dimensions that produced embedding_vector; retrieval only compares equal versions.
+    embedding_version = models.CharField(max_length=64, blank=True, db_index=True)
+    # Written by the reembed command and swapped into the live columns when it completes.
+    embedding_vector_next = VectorField(dimensions=384, null=True, blank=True)
+    embedding_version_next = models.CharField(max_length=64, blank=True)
+
+    # Recorded by the matching engine: fingerprint of the inputs at the last
+    # evaluation and the lowest candidate similarity that made the cut.
+    match_fingerprint = models.CharField(max_length=64, blank=True)
+    match_similarity_floor = models.FloatField(default=0.0)
+
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="patient_embedding_hnsw",
+                fields=["embedding_vector"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.patient_code} - {self.full_name}"
@@ -95,3 +116,17 @@ class PatientDocument(TimeStampedModel):
 
     def __str__(self) -> str:
         return f"{self.patient.patient_code} - {self.original_name}"
+
+
+class StoryParseCacheEntry(TimeStampedModel):
+    """LLM story-parse result keyed by a hash of the normalized story, model and prompt version."""
+
+    key = models.CharField(max_length=64, unique=True)
+    model = models.CharField(max_length=255)
+    prompt_version = models.CharField(max_length=32)
+    response = models.JSONField(default=dict)
+    hit_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"{self.model}:{self.key[:12]}"
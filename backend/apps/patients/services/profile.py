@@ -2,12 +2,21 @@ from __future__ import annotations
 
 import json
 import re
-from typing import Dict, List
+from typing import Dict, List, Sequence, Tuple
 
-import requests
 from django.conf import settings
 
-from apps.core.services.embedding import generate_embedding
+from apps.core.services.circuit_breaker import provider_breaker
+from apps.core.services.embedding import Embedding, embed_texts
+from apps.core.services.http_client import http_post
+from apps.core.services.rate_limiter import acquire_llm_capacity
+from apps.matching.services.prompt_compaction import estimate_tokens
+from apps.patients.services.story_cache import (
+    get_cached_story_parse,
+    store_story_parse,
+    story_fingerprint,
+    story_parse_cache_key,
+)
 
 
 KEYWORDS_TO_DIAGNOSIS = {
@@ -42,6 +51,8 @@ Patient story:
 {story}
 """.strip()
 
+STORY_PARSE_MAX_OUTPUT_TOKENS = 600
+
 KNOWN_MARKERS = {"her2", "brca", "pik3ca", "ecog", "metastatic", "stage iv", "pd-l1"}
 
 
@@ -121,28 +132,57 @@ def _gemini_story_parse(story: str) -> Dict[str, object] | None:
         return None
 
     model = settings.GEMINI_MODEL or "gemini-2.0-flash"
+    cache_key = story_parse_cache_key(story, f"gemini:{model}")
+    cached = get_cached_story_parse(cache_key)
+    if cached is not None:
+        return cached
+    parsed = _request_gemini_story_parse(story, model)
+    # Failed calls are not cached, so the next save of the same story tries again.
+    if parsed is not None:
+        store_story_parse(cache_key, f"gemini:{model}", parsed)
+    return parsed
+
+
+def _request_gemini_story_parse(story: str, model: str) -> Dict[str, object] | None:
     endpoint = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
     prompt = STORY_PARSE_PROMPT_TEMPLATE.format(story=story)
+    # Intake waits only briefly for quota; the deterministic parse covers the rest.
+    if not acquire_llm_capacity(
+        "gemini",
+        model,
+        estimate_tokens(prompt) + STORY_PARSE_MAX_OUTPUT_TOKENS,
+        max_wait_seconds=float(settings.LLM_RATE_LIMIT_INTERACTIVE_WAIT_SECONDS),
+    ):
+        return None
 
     try:
-        response = requests.post(
-            endpoint,
-            headers={
-                "Content-Type": "application/json",
-                "X-goog-api-key": settings.GEMINI_API_KEY,
-            },
-            json={
-                "contents": [{"parts": [{"text": prompt}]}],
-                "generationConfig": {
-                    "temperature": 0.1,
-                    "maxOutputTokens": 600,
-                    "responseMimeType": "application/json",
+        # An open Gemini breaker raises CircuitOpenError here and the deterministic parse is used.
+        payload = (
+            provider_breaker("gemini")
+            .call(
+                http_post,
+                "gemini",
+                endpoint,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-goog-api-key": settings.GEMINI_API_KEY,
+                },
+                json={
+                    "contents": [{"parts": [{"text": prompt}]}],
+                    "generationConfig": {
+                        "temperature": 0.1,
+                        "maxOutputTokens": STORY_PARSE_MAX_OUTPUT_TOKENS,
+                        "responseMimeType": "application/json",
+                    },
                 },
-            },
-            timeout=25,
+                idempotent=True,
+                # Parsing runs inside the intake request, so it waits less than background explanations
+                # and is not retried.
+                read_timeout=25,
+                max_retries=0,
+            )
+            .json()
         )
-        response.raise_for_status()
-        payload = response.json()
         text = _extract_gemini_text(payload).strip()
         if not text:
             return None
@@ -245,6 +285,97 @@ def infer_structured_profile(story: str) -> Dict[str, object]:
     }
 
 
+def _merge_unique(existing: object, incoming: object) -> List[str]:
+    merged: List[str] = []
+    seen: set[str] = set()
+    for value in [*(existing if isinstance(existing, list) else []), *(incoming if isinstance(incoming, list) else [])]:
+        if not isinstance(value, str) or not value.strip() or value.strip().casefold() in seen:
+            continue
+        seen.add(value.strip().casefold())
+        merged.append(value.strip())
+    return merged
+
+
+def _diagnosis_conflicts(current: object, incoming: object) -> bool:
+    current_text = _normalize_text(str(current or "")).casefold()
+    incoming_text = _normalize_text(str(incoming or "")).casefold()
+    return (
+        bool(current_text and incoming_text) and current_text not in incoming_text and incoming_text not in current_text
+    )
+
+
+def _merge_entry_profile(
+    existing: Dict[str, object], entry_profile: Dict[str, object], combined_history: str
+) -> Dict[str, object]:
+    """Fold one parsed history entry into the profile of the history before it."""
+    merged = dict(existing)
+    # A newer entry's diagnosis or stage (e.g. progression) supersedes the old one.
+    for field in ("diagnosis", "stage"):
+        if entry_profile.get(field):
+            merged[field] = entry_profile[field]
+    for field in ("markers", "symptoms", "treatments"):
+        merged[field] = _merge_unique(existing.get(field), entry_profile.get(field))
+    summary = " ".join(
+        part for part in (str(existing.get("ai_summary") or ""), str(entry_profile.get("ai_summary") or "")) if part
+    )
+    merged.update(
+        {
+            "raw_story": _normalize_text(combined_history),
+            "clean_story": summary,
+            "ai_summary": summary,
+            "parser": entry_profile.get("parser", "deterministic"),
+        }
+    )
+    return merged
+
+
+def infer_history_profile(
+    combined_history: str,
+    existing: Dict[str, object] | None = None,
+    previous_history: str = "",
+    new_entry: str = "",
+    full: bool = False,
+) -> Dict[str, object]:
+    """
+    Structured profile for a patient's combined history text.
+
+    When a single entry was appended and `existing` still describes
+    `previous_history` (its history_fingerprint matches), only the new entry
+    is parsed and merged in. The whole history is re-parsed when `full` is
+    set, STORY_PARSE_INCREMENTAL is off, the existing profile is out of sync
+    with the history, the entry names a diagnosis that contradicts the
+    current one, or the appended summary would pass
+    STORY_PARSE_SUMMARY_MAX_CHARS (so it is re-summarized instead of growing
+    with every entry).
+    """
+    existing = existing if isinstance(existing, dict) else {}
+    incremental = (
+        settings.STORY_PARSE_INCREMENTAL
+        and not full
+        and bool(new_entry.strip())
+        and bool(existing.get("ai_summary"))
+        and existing.get("history_fingerprint") == story_fingerprint(previous_history)
+    )
+    if incremental:
+        entry_profile = infer_structured_profile(new_entry)
+        if not _diagnosis_conflicts(existing.get("diagnosis"), entry_profile.get("diagnosis")):
+            merged = _merge_entry_profile(existing, entry_profile, combined_history)
+            if len(str(merged["ai_summary"])) > settings.STORY_PARSE_SUMMARY_MAX_CHARS:
+                return _reparse_history(combined_history)
+            return {
+                **merged,
+                "history_fingerprint": story_fingerprint(combined_history),
+                "history_parse": "incremental",
+            }
+
+    return _reparse_history(combined_history)
+
+
+def _reparse_history(combined_history: str) -> Dict[str, object]:
+    structured = infer_structured_profile(combined_history)
+    return {**structured, "history_fingerprint": story_fingerprint(combined_history), "history_parse": "full"}
+
+
 def compute_completeness(payload: Dict[str, object]) -> int:
     fields = [
         bool(payload.get("name")),
@@ -276,5 +407,53 @@ def patient_embedding_text(payload: Dict[str, object], structured: Dict[str, obj
     )
 
 
-def generate_patient_embedding(payload: Dict[str, object], structured: Dict[str, object]) -> List[float]:
-    return generate_embedding(patient_embedding_text(payload, structured))
+def patient_embedding_payload(patient) -> Dict[str, object]:
+    return {
+        "name": patient.full_name,
+        "age": patient.age,
+        "sex": patient.sex,
+        "city": patient.city,
+        "country": patient.country,
+        "story": patient.story,
+    }
+
+
+def embed_patient(payload: Dict[str, object], structured: Dict[str, object]) -> Embedding:
+    return embed_patients([(payload, structured)])[0]
+
+
+def embed_patients(
+    items: Sequence[Tuple[Dict[str, object], Dict[str, object]]],
+    stats: Dict[str, int] | None = None,
+) -> List[Embedding]:
+    return embed_texts([patient_embedding_text(payload, structured) for payload, structured in items], stats=stats)
+
+
+def combined_history_text(patient) -> str:
+    entries = patient.history_entries.order_by("created_at").values_list("entry_text", flat=True)
+    cleaned = [text.strip() for text in entries if isinstance(text, str) and text.strip()]
+    if cleaned:
+        return "\n\n".join(cleaned)
+    return (patient.story or "").strip()
+
+
+def apply_history_profile(patient, combined_history: str, structured: Dict[str, object]) -> None:
+    """Store a re-derived profile on the patient together with its story and embedding."""
+    patient.story = combined_history
+    patient.structured_profile = structured
+    patient.embedding_vector, patient.embedding_version = embed_patient(patient_embedding_payload(patient), structured)
+    if structured.get("diagnosis"):
+        patient.diagnosis = str(structured.get("diagnosis", ""))
+    if structured.get("stage"):
+        patient.stage = str(structured.get("stage", ""))
+    patient.save(
+        update_fields=[
+            "story",
+            "structured_profile",
+            "embedding_vector",
+            "embedding_version",
+            "diagnosis",
+            "stage",
+            "updated_at",
+        ]
+    )
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from typing import Any, Dict
+
+from django.conf import settings
+
+from apps.core.services.cache_table import CacheTable
+from apps.patients.models import StoryParseCacheEntry
+
+_table = CacheTable(StoryParseCacheEntry, "STORY_PARSE_CACHE_MAX_ENTRIES", ttl_setting="STORY_PARSE_CACHE_TTL_SECONDS")
+
+
+def story_parse_cache_enabled() -> bool:
+    return int(settings.STORY_PARSE_CACHE_TTL_SECONDS) > 0
+
+
+def normalized_story(story: str) -> str:
+    """Whitespace- and case-insensitive form of a story, used for cache keys and history fingerprints."""
+    return re.sub(r"\s+", " ", story or "").strip().casefold()
+
+
+def story_fingerprint(story: str) -> str:
+    return hashlib.sha256(normalized_story(story).encode("utf-8")).hexdigest()
+
+
+def story_parse_cache_key(story: str, model: str) -> str:
+    encoded = json.dumps([normalized_story(story), model, settings.LLM_PROMPT_VERSION], ensure_ascii=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_cached_story_parse(key: str) -> Dict[str, Any] | None:
+    """Return a stored parse that is still within its TTL and mark it recently used."""
+    if not story_parse_cache_enabled():
+        return None
+    response = _table.get(key, "response")
+    return dict(response) if response is not None else None
+
+
+def store_story_parse(key: str, model: str, response: Dict[str, Any]) -> None:
+    if not story_parse_cache_enabled():
+        return
+    _table.store_many({key: {"model": model, "prompt_version": settings.LLM_PROMPT_VERSION, "response": response}})
+
+
+def prune_story_parse_cache() -> int:
+    """
+    Delete entries past their TTL, then the least recently used entries above
+    STORY_PARSE_CACHE_MAX_ENTRIES. Returns the number of rows deleted.
+    """
+    return _table.prune()
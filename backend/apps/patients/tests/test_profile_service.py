@@ -1,13 +1,33 @@
 from unittest.mock import Mock, patch
 
-from django.test import SimpleTestCase, override_settings
+from django.test import SimpleTestCase, TestCase, override_settings
 
-from apps.patients.services.profile import infer_structured_profile
+from apps.patients.models import StoryParseCacheEntry
+from apps.patients.services.profile import infer_history_profile, infer_structured_profile
+from apps.patients.services.story_cache import story_fingerprint
+
+GEMINI_JSON = {
+    "candidates": [
+        {
+            "content": {
+                "parts": [
+                    {
+                        "text": (
+                            '{"ai_summary":"Structured summary","diagnosis":"Scoliosis","stage":"","markers":[],'
+                            '"symptoms":["back pain"],"treatments":["physiotherapy"]}'
+                        )
+                    }
+                ]
+            }
+        }
+    ]
+}
 
 
+@override_settings(STORY_PARSE_CACHE_TTL_SECONDS=0)
 class ProfileServiceTests(SimpleTestCase):
     @override_settings(LLM_MODE="gemini", GEMINI_API_KEY="test-key", GEMINI_MODEL="gemini-2.0-flash")
-    @patch("apps.patients.services.profile.requests.post")
+    @patch("apps.patients.services.profile.http_post")
     def test_uses_gemini_plain_text_when_json_is_not_returned(self, mock_post):
         response = Mock()
         response.raise_for_status = Mock()
@@ -30,26 +50,11 @@ class ProfileServiceTests(SimpleTestCase):
         self.assertEqual(result["parser"], "gemini:gemini-2.0-flash:text")
 
     @override_settings(LLM_MODE="gemini", GEMINI_API_KEY="test-key", GEMINI_MODEL="gemini-2.0-flash")
-    @patch("apps.patients.services.profile.requests.post")
+    @patch("apps.patients.services.profile.http_post")
     def test_uses_gemini_json_response_when_available(self, mock_post):
         response = Mock()
         response.raise_for_status = Mock()
-        response.json.return_value = {
-            "candidates": [
-                {
-                    "content": {
-                        "parts": [
-                            {
-                                "text": (
-                                    '{"ai_summary":"Structured summary","diagnosis":"Scoliosis","stage":"","markers":[],'
-                                    '"symptoms":["back pain"],"treatments":["physiotherapy"]}'
-                                )
-                            }
-                        ]
-                    }
-                }
-            ]
-        }
+        response.json.return_value = GEMINI_JSON
         mock_post.return_value = response
 
         result = infer_structured_profile("Scoliosis with ongoing treatment.")
@@ -57,3 +62,85 @@ class ProfileServiceTests(SimpleTestCase):
         self.assertEqual(result["ai_summary"], "Structured summary")
         self.assertEqual(result["diagnosis"], "Scoliosis")
         self.assertEqual(result["parser"], "gemini:gemini-2.0-flash")
+
+
+def _entry_parse(story):
+    return {
+        "ai_summary": f"Summary of: {story}",
+        "diagnosis": "Triple-negative breast cancer" if "triple" in story.lower() else "",
+        "stage": "Stage IV" if "metastatic" in story.lower() else "",
+        "markers": ["brca"] if "brca" in story.lower() else [],
+        "symptoms": ["fatigue"] if "tired" in story.lower() else [],
+        "treatments": [],
+        "parser": "gemini:test",
+    }
+
+
+@override_settings(STORY_PARSE_INCREMENTAL=True)
+class HistoryProfileTests(SimpleTestCase):
+    previous = "HER2-positive breast cancer, BRCA carrier, on trastuzumab."
+
+    def _existing(self):
+        with patch("apps.patients.services.profile._gemini_story_parse", side_effect=_entry_parse):
+            return infer_history_profile(self.previous)
+
+    def _append(self, existing, entry):
+        combined = f"{self.previous}\n\n{entry}"
+        with patch("apps.patients.services.profile._gemini_story_parse", side_effect=_entry_parse) as parse:
+            result = infer_history_profile(combined, existing=existing, previous_history=self.previous, new_entry=entry)
+        return result, [call.args[0] for call in parse.call_args_list]
+
+    def test_append_parses_only_the_new_entry(self):
+        existing = self._existing()
+
+        result, parsed = self._append(existing, "Now metastatic and feeling tired.")
+
+        self.assertEqual(parsed, ["Now metastatic and feeling tired."])
+        self.assertEqual(result["history_parse"], "incremental")
+        self.assertEqual(result["stage"], "Stage IV")
+        self.assertEqual(result["markers"], [*existing["markers"], "metastatic"])
+        self.assertEqual(result["symptoms"], ["fatigue"])
+        self.assertTrue(result["ai_summary"].startswith(existing["ai_summary"]))
+        self.assertEqual(result["history_fingerprint"], story_fingerprint(f"{self.previous}\n\n{parsed[0]}"))
+
+    def test_out_of_sync_profile_is_reparsed_in_full(self):
+        existing = {**self._existing(), "history_fingerprint": story_fingerprint("an older history")}
+
+        result, parsed = self._append(existing, "Feeling tired.")
+
+        self.assertEqual(result["history_parse"], "full")
+        self.assertEqual(len(parsed), 1)
+        self.assertIn(self.previous, parsed[0])
+
+    def test_conflicting_diagnosis_triggers_full_reparse(self):
+        existing = {**self._existing(), "diagnosis": "HER2+ Breast Cancer"}
+
+        result, parsed = self._append(existing, "Biopsy shows triple-negative disease.")
+
+        self.assertEqual(result["history_parse"], "full")
+        self.assertEqual(len(parsed), 2)
+
+    def test_summary_past_the_cap_is_resummarized(self):
+        existing = self._existing()
+
+        with self.settings(STORY_PARSE_SUMMARY_MAX_CHARS=len(existing["ai_summary"]) + 5):
+            result, parsed = self._append(existing, "Now metastatic and feeling tired.")
+
+        self.assertEqual(result["history_parse"], "full")
+        self.assertEqual(len(parsed), 2)
+
+
+@override_settings(LLM_MODE="gemini", GEMINI_API_KEY="test-key", GEMINI_MODEL="gemini-2.0-flash")
+class StoryParseCacheTests(TestCase):
+    @patch("apps.patients.services.profile.http_post")
+    def test_same_story_is_parsed_once(self, mock_post):
+        response = Mock()
+        response.json.return_value = GEMINI_JSON
+        mock_post.return_value = response
+
+        first = infer_structured_profile("Scoliosis with ongoing treatment.")
+        second = infer_structured_profile("  scoliosis with   ongoing treatment. ")
+
+        self.assertEqual(mock_post.call_count, 1)
+        self.assertEqual(second["diagnosis"], first["diagnosis"])
+        self.assertEqual(StoryParseCacheEntry.objects.get().hit_count, 1)
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from apps.matching.services.features import refresh_trial_features
+
 from .models import Trial, TrialSite
 
 
@@ -14,3 +16,7 @@ class TrialAdmin(admin.ModelAdmin):
     search_fields = ("trial_id", "title", "summary")
     list_filter = ("source", "status", "phase")
     inlines = [TrialSiteInline]
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        refresh_trial_features(form.instance)
@@ -1,6 +1,14 @@
 from django.core.management.base import BaseCommand
 
-from apps.trials.services.ingestion import fetch_ctgov_trials, ingest_sample_trials, upsert_trial
+from apps.trials.services.ingestion import fetch_ctgov_trials, ingest_sample_trials, upsert_trials
+
+
+def _embedding_summary(stats: dict) -> str:
+    return (
+        f"embedding cache {stats.get('embedding_cache_hits', 0)} hit(s), "
+        f"{stats.get('embedding_cache_misses', 0)} miss(es), "
+        f"{stats.get('embedding_requests', 0)} request(s)"
+    )
 
 
 class Command(BaseCommand):
@@ -13,14 +21,14 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         source = options["source"]
         limit = options["limit"]
+        stats: dict = {}
 
         if source == "sample":
-            trials = ingest_sample_trials()
-            self.stdout.write(self.style.SUCCESS(f"Ingested sample trials: {len(trials)}"))
+            trials = ingest_sample_trials(stats=stats)
+            self.stdout.write(
+                self.style.SUCCESS(f"Ingested sample trials: {len(trials)} ({_embedding_summary(stats)})")
+            )
             return
 
-        ingested = 0
-        for payload in fetch_ctgov_trials(limit=limit):
-            upsert_trial(payload)
-            ingested += 1
-        self.stdout.write(self.style.SUCCESS(f"Ingested CT.gov trials: {ingested}"))
+        ingested = len(upsert_trials(fetch_ctgov_trials(limit=limit), stats=stats))
+        self.stdout.write(self.style.SUCCESS(f"Ingested CT.gov trials: {ingested} ({_embedding_summary(stats)})"))
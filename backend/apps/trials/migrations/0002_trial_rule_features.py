@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trials', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trial',
+            name='rule_features',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
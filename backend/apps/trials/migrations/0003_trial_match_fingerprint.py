@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trials', '0002_trial_rule_features'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trial',
+            name='fingerprint_updated_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trial',
+            name='match_fingerprint',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
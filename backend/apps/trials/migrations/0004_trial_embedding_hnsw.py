@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-16 22:58
+
+import pgvector.django.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('trials', '0003_trial_match_fingerprint'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='trial',
+            index=pgvector.django.indexes.HnswIndex(ef_construction=64, fields=['embedding_vector'], m=16, name='trial_embedding_hnsw', opclasses=['vector_cosine_ops']),
+        ),
+    ]
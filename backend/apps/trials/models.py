@@ -1,5 +1,5 @@
 from django.db import models
-from pgvector.django import VectorField
+from pgvector.django import HnswIndex, VectorField
 
 from apps.core.models import TimeStampedModel
 
@@ -29,13 +29,32 @@ class Trial(TimeStampedModel):
     exclusion_text = models.TextField(blank=True)
     eligibility_json = models.JSONField(default=dict)
     metadata = models.JSONField(default=dict)
+    rule_features = models.JSONField(default=dict, blank=True)
+    match_fingerprint = models.CharField(max_length=64, blank=True)
+    fingerprint_updated_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     embedding_text = models.TextField(blank=True)
     embedding_vector = VectorField(dimensions=384, null=True, blank=True)
+    # Model/dimensions that produced embedding_vector; retrieval only compares equal versions.
+    embedding_version = models.CharField(max_length=64, blank=True, db_index=True)
+    # Written by the reembed command and swapped into the live columns when it completes.
+    embedding_vector_next = VectorField(dimensions=384, null=True, blank=True)
+    embedding_version_next = models.CharField(max_length=64, blank=True)
 
     source_url = models.URLField(blank=True)
     external_last_updated = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            HnswIndex(
+                name="trial_embedding_hnsw",
+                fields=["embedding_vector"],
+                m=16,
+                ef_construction=64,
+                opclasses=["vector_cosine_ops"],
+            ),
+        ]
+
     def __str__(self) -> str:
         return f"{self.trial_id} - {self.title[:80]}"
 
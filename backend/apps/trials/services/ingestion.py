@@ -3,9 +3,11 @@ from __future__ import annotations
 from datetime import date
 from typing import Dict, Iterable, List
 
-import requests
+from django.db import transaction
 
-from apps.core.services.embedding import generate_embedding
+from apps.core.services.embedding import embed_texts
+from apps.core.services.http_client import http_get
+from apps.matching.services.features import TRIAL_FEATURE_FIELDS, apply_trial_features
 from apps.trials.models import Trial, TrialSite
 
 from .sample_trials import SAMPLE_TRIALS
@@ -23,7 +25,7 @@ def trial_embedding_text(payload: Dict[str, object]) -> str:
     )
 
 
-def upsert_trial(payload: Dict[str, object]) -> Trial:
+def _upsert_trial_record(payload: Dict[str, object]) -> Trial:
     trial, _ = Trial.objects.update_or_create(
         trial_id=payload["trial_id"],
         defaults={
@@ -45,11 +47,6 @@ def upsert_trial(payload: Dict[str, object]) -> Trial:
             "external_last_updated": payload.get("external_last_updated", date.today()),
         },
     )
-    text = trial_embedding_text(payload)
-    trial.embedding_text = text
-    trial.embedding_vector = generate_embedding(text)
-    trial.save(update_fields=["embedding_text", "embedding_vector", "updated_at"])
-
     trial.sites.all().delete()
     for site in payload.get("sites", []):
         TrialSite.objects.create(
@@ -60,20 +57,45 @@ def upsert_trial(payload: Dict[str, object]) -> Trial:
             latitude=site.get("latitude"),
             longitude=site.get("longitude"),
         )
-
+    trial.embedding_text = trial_embedding_text(payload)
     return trial
 
 
-def ingest_sample_trials() -> List[Trial]:
-    return [upsert_trial(item) for item in SAMPLE_TRIALS]
+def upsert_trials(payloads: Iterable[Dict[str, object]], stats: Dict[str, int] | None = None) -> List[Trial]:
+    """
+    Upsert trials and their sites, embedding all of them with batched requests.
+    Trials whose embedding text is unchanged are served from the embedding
+    cache; `stats` receives the cache counters when given.
+
+    `payloads` is read in full and embedded before anything is written, and
+    the rows are written in one transaction, so a fetch or write failing
+    partway leaves every trial as it was rather than with a new text and a
+    stale vector or features.
+    """
+    payloads = list(payloads)
+    embeddings = embed_texts([trial_embedding_text(payload) for payload in payloads], stats=stats)
+    with transaction.atomic():
+        trials = [_upsert_trial_record(payload) for payload in payloads]
+        for trial, embedding in zip(trials, embeddings):
+            trial.embedding_vector, trial.embedding_version = embedding
+            apply_trial_features(trial)
+            trial.save(update_fields=["embedding_text", "embedding_vector", "embedding_version", *TRIAL_FEATURE_FIELDS])
+    return trials
+
+
+def upsert_trial(payload: Dict[str, object]) -> Trial:
+    return upsert_trials([payload])[0]
+
+
+def ingest_sample_trials(stats: Dict[str, int] | None = None) -> List[Trial]:
+    return upsert_trials(SAMPLE_TRIALS, stats=stats)
 
 
 def fetch_ctgov_trials(limit: int = 20) -> Iterable[Dict[str, object]]:
     # Minimal extraction from CT.gov v2 API for hackathon MVP.
     url = "https://clinicaltrials.gov/api/v2/studies"
     params = {"pageSize": limit, "query.cond": "breast cancer"}
-    response = requests.get(url, params=params, timeout=30)
-    response.raise_for_status()
+    response = http_get("ctgov", url, params=params)
     studies = response.json().get("studies", [])
 
     for study in studies:
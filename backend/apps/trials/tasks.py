@@ -1,18 +1,20 @@
 from celery import shared_task
 
-from .services.ingestion import fetch_ctgov_trials, ingest_sample_trials, upsert_trial
+from apps.core.services.embedding_cache import prune_embedding_cache
+
+from .services.ingestion import fetch_ctgov_trials, ingest_sample_trials, upsert_trials
 
 
 @shared_task
 def sync_trial_sources() -> dict:
     ingested = 0
+    stats: dict = {}
     try:
-        for payload in fetch_ctgov_trials(limit=20):
-            upsert_trial(payload)
-            ingested += 1
+        ingested += len(upsert_trials(fetch_ctgov_trials(limit=20), stats=stats))
     except Exception:
         # Network/source failures should not block demo.
-        fallback = ingest_sample_trials()
+        fallback = ingest_sample_trials(stats=stats)
         ingested += len(fallback)
 
-    return {"ingested": ingested}
+    prune_embedding_cache()
+    return {"ingested": ingested, **stats}
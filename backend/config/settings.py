@@ -150,10 +150,54 @@ HF_API_TOKEN = os.getenv("HF_API_TOKEN", "")
 HF_LLM_ENDPOINT = os.getenv("HF_LLM_ENDPOINT", "")
 HF_EMBEDDING_ENDPOINT = os.getenv("HF_EMBEDDING_ENDPOINT", "")
 HF_EMBEDDING_DIMENSIONS = int(os.getenv("HF_EMBEDDING_DIMENSIONS", "384"))
+HF_EMBEDDING_BATCH_SIZE = int(os.getenv("HF_EMBEDDING_BATCH_SIZE", "32"))
+HF_EMBEDDING_BATCH_MAX_CHARS = int(os.getenv("HF_EMBEDDING_BATCH_MAX_CHARS", "60000"))
+EMBEDDING_MODEL_VERSION = os.getenv("EMBEDDING_MODEL_VERSION", "")
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "1") == "1"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+EMBEDDING_CACHE_LRU_SIZE = int(os.getenv("EMBEDDING_CACHE_LRU_SIZE", "4096"))
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
 LLM_PROMPT_VERSION = os.getenv("LLM_PROMPT_VERSION", "v1")
 LLM_MODE = os.getenv("LLM_MODE", "auto").lower()
+LLM_EXPLANATION_CACHE_TTL_SECONDS = int(os.getenv("LLM_EXPLANATION_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+LLM_EXPLANATION_CACHE_MAX_ENTRIES = int(os.getenv("LLM_EXPLANATION_CACHE_MAX_ENTRIES", "20000"))
+STORY_PARSE_CACHE_TTL_SECONDS = int(os.getenv("STORY_PARSE_CACHE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+STORY_PARSE_CACHE_MAX_ENTRIES = int(os.getenv("STORY_PARSE_CACHE_MAX_ENTRIES", "5000"))
+STORY_PARSE_INCREMENTAL = os.getenv("STORY_PARSE_INCREMENTAL", "1") == "1"
+STORY_PARSE_SUMMARY_MAX_CHARS = int(os.getenv("STORY_PARSE_SUMMARY_MAX_CHARS", "2000"))
+LLM_GEMINI_MAX_CONCURRENCY = int(os.getenv("LLM_GEMINI_MAX_CONCURRENCY", "4"))
+LLM_HF_MAX_CONCURRENCY = int(os.getenv("LLM_HF_MAX_CONCURRENCY", "2"))
+LLM_BATCH_TIMEOUT_SECONDS = float(os.getenv("LLM_BATCH_TIMEOUT_SECONDS", "90"))
+LLM_HEDGING = os.getenv("LLM_HEDGING", "0") == "1"
+LLM_HEDGE_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DELAY_SECONDS", "6"))
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "8"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF_SECONDS", "0.5"))
+HTTP_RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("HTTP_RETRY_BACKOFF_MAX_SECONDS", "8"))
+LLM_RATE_LIMIT_REDIS_URL = os.getenv("LLM_RATE_LIMIT_REDIS_URL", CELERY_BROKER_URL)
+LLM_RATE_LIMITS = os.getenv("LLM_RATE_LIMITS", "")
+LLM_RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "15"))
+LLM_RATE_LIMIT_INTERACTIVE_WAIT_SECONDS = float(os.getenv("LLM_RATE_LIMIT_INTERACTIVE_WAIT_SECONDS", "2"))
+PROVIDER_BREAKER_REDIS_URL = os.getenv("PROVIDER_BREAKER_REDIS_URL", CELERY_BROKER_URL)
+PROVIDER_BREAKER_FAILURE_THRESHOLD = int(os.getenv("PROVIDER_BREAKER_FAILURE_THRESHOLD", "5"))
+PROVIDER_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("PROVIDER_BREAKER_SLOW_CALL_SECONDS", "20"))
+PROVIDER_BREAKER_COOLDOWN_SECONDS = float(os.getenv("PROVIDER_BREAKER_COOLDOWN_SECONDS", "60"))
+LLM_PATIENT_BATCH_SIZE = int(os.getenv("LLM_PATIENT_BATCH_SIZE", "5"))
+LLM_PROMPT_COMPACTION = os.getenv("LLM_PROMPT_COMPACTION", "1") == "1"
+LLM_PROMPT_PATIENT_TOKENS = int(os.getenv("LLM_PROMPT_PATIENT_TOKENS", "600"))
+LLM_PROMPT_TRIAL_TOKENS = int(os.getenv("LLM_PROMPT_TRIAL_TOKENS", "900"))
+LLM_PROMPT_PATIENT_FIELDS = os.getenv(
+    "LLM_PROMPT_PATIENT_FIELDS",
+    "diagnosis,stage,age,sex,structured_profile,story,country,city,patient_code,name",
+)
+LLM_PROMPT_TRIAL_FIELDS = os.getenv(
+    "LLM_PROMPT_TRIAL_FIELDS",
+    "trial_id,title,conditions,phase,status,inclusion_criteria,exclusion_criteria,eligibility_summary,"
+    "interventions,sites",
+)
 
 TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID", "")
 TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN", "")
@@ -165,6 +209,22 @@ MATCH_TOP_K = int(os.getenv("MATCH_TOP_K", "20"))
 MATCH_EVALUATE_TOP_N = int(os.getenv("MATCH_EVALUATE_TOP_N", "5"))
 MATCH_MAX_RUN_SECONDS = int(os.getenv("MATCH_MAX_RUN_SECONDS", "900"))
 MATCH_LLM_MAX_CALLS_PER_RUN = int(os.getenv("MATCH_LLM_MAX_CALLS_PER_RUN", "200"))
+MATCH_EXPLANATION_MODE = os.getenv("MATCH_EXPLANATION_MODE", "inline").lower()
+MATCH_EXPLANATION_QUEUE = os.getenv("MATCH_EXPLANATION_QUEUE", "explanations")
+MATCH_EXPLANATION_TASK_BATCH = int(os.getenv("MATCH_EXPLANATION_TASK_BATCH", "20"))
+MATCH_RUN_MODE = os.getenv("MATCH_RUN_MODE", "serial").lower()
+MATCH_SHARD_SIZE = int(os.getenv("MATCH_SHARD_SIZE", "500"))
+MATCH_WRITE_BATCH_PATIENTS = int(os.getenv("MATCH_WRITE_BATCH_PATIENTS", "50"))
+MATCH_SCHEDULED_INCREMENTAL = os.getenv("MATCH_SCHEDULED_INCREMENTAL", "0") == "1"
+MATCH_VECTOR_EF_SEARCH = int(os.getenv("MATCH_VECTOR_EF_SEARCH", "100"))
+MATCH_VECTOR_IVFFLAT_PROBES = int(os.getenv("MATCH_VECTOR_IVFFLAT_PROBES", "10"))
+MATCH_RETRIEVAL_ENGINE = os.getenv("MATCH_RETRIEVAL_ENGINE", "pgvector").lower()
+MATCH_VECTOR_PRECISION = os.getenv("MATCH_VECTOR_PRECISION", "full").lower()
+MATCH_SITE_NEAR_KM = float(os.getenv("MATCH_SITE_NEAR_KM", "100"))
+MATCH_SITE_REGION_KM = float(os.getenv("MATCH_SITE_REGION_KM", "500"))
+MATCH_PROGRESS_REDIS_URL = os.getenv("MATCH_PROGRESS_REDIS_URL", CELERY_BROKER_URL)
+MATCH_PROGRESS_FLUSH_PATIENTS = int(os.getenv("MATCH_PROGRESS_FLUSH_PATIENTS", "25"))
+MATCH_PROGRESS_FLUSH_SECONDS = float(os.getenv("MATCH_PROGRESS_FLUSH_SECONDS", "5"))
 MATCH_MIN_ELIGIBILITY_SCORE = int(os.getenv("MATCH_MIN_ELIGIBILITY_SCORE", "35"))
 MATCH_MIN_CONDITION_OVERLAP = float(os.getenv("MATCH_MIN_CONDITION_OVERLAP", "0.06"))
 MATCH_MIN_VECTOR_SIMILARITY = float(os.getenv("MATCH_MIN_VECTOR_SIMILARITY", "0.62"))